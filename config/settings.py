@@ -17,6 +17,7 @@ import json
 import os
 import sys
 from django.core.exceptions import ImproperlyConfigured
+from core.log import logger_levels, logging_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,6 +55,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista: mede todos os outros (core/instrumentation.py)
+    'core.instrumentation.PerformanceMiddleware',
+    # Réplica de leitura / read-your-writes (core/db_router.py)
+    'core.db_router.ReadReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +91,16 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Conexões persistentes: cada thread do gunicorn reaproveita a sua conexão
+# por até DB_CONN_MAX_AGE segundos (0 = uma conexão nova por request), em
+# vez de abrir (TLS + init_command + charset) uma por request. Mantenha
+# abaixo do wait_timeout do MariaDB. Com DB_CONN_HEALTH_CHECKS a conexão
+# reaproveitada é testada antes do primeiro uso em cada request: se o
+# servidor derrubou, abre outra em vez de devolver erro. Threads de job e
+# workers: ver core/db_connections.py.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql', # Isso estÃ¡ correto, graÃ§as ao __init__.py
@@ -94,6 +109,8 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST', default='127.0.0.1'),
         'PORT': config('DB_PORT', default='3306'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
         'OPTIONS': {
             # Boa prÃ¡tica para garantir consistÃªncia
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
@@ -103,6 +120,171 @@ DATABASES = {
     }
 }
 
+# Réplica de leitura (core/db_router.py). Com DB_REPLICA_HOST definido, as
+# views de READ_REPLICA_VIEWS leem dela; escritas sempre no 'default'.
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+if DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        # Nos testes a réplica é o próprio banco de teste do 'default'
+        'TEST': {'MIRROR': 'default'},
+    }
+READ_REPLICA_ALIAS = 'replica' if DB_REPLICA_HOST else None
+READ_REPLICA_VIEWS = (
+    'core:homepage',
+    'core:get_available_slots',
+    'core:get_barber_available_dates',
+)
+# Depois de uma escrita, o navegador lê do primário por este tempo (cookie)
+READ_REPLICA_STICKY_SECONDS = config('READ_REPLICA_STICKY_SECONDS', default=15, cast=int)
+# Atraso máximo esperado da réplica: dados que mudaram há menos que isso
+# (instante da versão do cache) são lidos do primário
+READ_REPLICA_MAX_LAG_SECONDS = config('READ_REPLICA_MAX_LAG_SECONDS', default=5, cast=int)
+DATABASE_ROUTERS = ['core.db_router.ReadReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Com vários workers o cache TEM que ser compartilhado (REDIS_URL): a
+# invalidação feita pelos sinais só limpa o cache do processo que fez a
+# escrita. Sem Redis o cache fica em memória, por processo, e todos os
+# tempos de cache (inclusive as versões usadas como ETag) caem para
+# LOCAL_CACHE_MAX_TIMEOUT segundos: os outros workers servem dados velhos
+# por no máximo isso.
+REDIS_URL = config('REDIS_URL', default='')
+CACHE_BACKEND = config(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.redis.RedisCache' if REDIS_URL
+    else 'django.core.cache.backends.locmem.LocMemCache',
+)
+CACHE_IS_LOCAL = CACHE_BACKEND == 'django.core.cache.backends.locmem.LocMemCache'
+LOCAL_CACHE_MAX_TIMEOUT = config('LOCAL_CACHE_MAX_TIMEOUT', default=10, cast=int)
+
+
+def _cache_timeout(seconds):
+    return min(seconds, LOCAL_CACHE_MAX_TIMEOUT) if CACHE_IS_LOCAL else seconds
+
+
+# Versões das chaves de slots/catálogo (core/availability_cache.py):
+# None = não expiram (cache compartilhado)
+CACHE_VERSION_TIMEOUT = LOCAL_CACHE_MAX_TIMEOUT if CACHE_IS_LOCAL else None
+
+# O backend real fica em OPTIONS['BACKEND']; o wrapper só conta hits/misses
+# para a instrumentação por request (core/instrumentation.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'core.instrumentation.InstrumentedCache',
+        'LOCATION': REDIS_URL or config('CACHE_LOCATION', default='cadu-elegance'),
+        'OPTIONS': {
+            'BACKEND': CACHE_BACKEND,
+        },
+    }
+}
+
+# Instrumentação por request (core/instrumentation.py): Server-Timing + log
+# estruturado no logger 'core.performance'.
+# Fração dos requests instrumentados (0 = desligado, 1 = todos)
+PERF_SAMPLE_RATE = config('PERF_SAMPLE_RATE', default=(1.0 if DEBUG else 0.05), cast=float)
+# Envia o header Server-Timing nos requests amostrados
+PERF_SERVER_TIMING = config('PERF_SERVER_TIMING', default=True, cast=bool)
+# Requests mais lentos que isso sempre geram log (mesmo fora da amostra)
+PERF_SLOW_REQUEST_MS = config('PERF_SLOW_REQUEST_MS', default=1000, cast=int)
+
+# Prometheus (core/metrics.py). Com vários workers do gunicorn, aponte
+# PROMETHEUS_MULTIPROC_DIR para um diretório vazio (limpo a cada deploy):
+# os processos gravam ali e o /metrics soma todos. Precisa estar no
+# ambiente ANTES do primeiro import de prometheus_client.
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+# Token do scraper (header "Authorization: Bearer <token>"). Vazio = só staff.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Logging estruturado em JSON, escrito fora da thread do request (core/log.py).
+# Nível e amostragem por logger: "logger=NÍVEL[:fração],..."
+# Ex: LOG_LOGGERS="core.performance=INFO:0.1,core.notifications=WARNING"
+LOG_LOGGERS = config('LOG_LOGGERS', default='')
+LOG_LEVELS = logger_levels(LOG_LOGGERS, {
+    'core': (config('LOG_LEVEL', default='INFO'), 1.0),
+    'core.performance': (config('PERF_LOG_LEVEL', default='INFO'), 1.0),
+    'django': ('INFO' if DEBUG else 'WARNING', 1.0),
+    'django.server': ('INFO', 1.0),
+})
+LOGGING = logging_config(LOG_LEVELS)
+
+# Tempo máximo (segundos) de um snapshot de slots/datas no cache.
+# A invalidação real é feita pelos sinais em core/signals.py.
+SLOTS_CACHE_TIMEOUT = _cache_timeout(config('SLOTS_CACHE_TIMEOUT', default=3600, cast=int))
+
+# Tempo máximo (segundos) do catálogo da homepage (snapshot + fragmento HTML).
+# Também é invalidado pelos sinais quando barbeiros/serviços/preços mudam.
+CATALOG_CACHE_TIMEOUT = _cache_timeout(config('CATALOG_CACHE_TIMEOUT', default=3600, cast=int))
+
+# Quantos dias à frente o carrossel de datas da homepage mostra (máx. 365).
+AVAILABLE_DATES_HORIZON_DAYS = config('AVAILABLE_DATES_HORIZON_DAYS', default=30, cast=int)
+
+# Agendamentos por página no painel (o resto vem por rolagem infinita).
+PAINEL_PAGE_SIZE = config('PAINEL_PAGE_SIZE', default=20, cast=int)
+
+# Granularidade (minutos) da agenda compilada (core/barber_calendar.py).
+# Deve dividir 1440 (um dia). Horários fora da grade são arredondados de
+# forma conservadora (menos tempo aberto, nunca mais).
+CALENDAR_BUCKET_MINUTES = config('CALENDAR_BUCKET_MINUTES', default=5, cast=int)
+
+# Granularidade (minutos) das reservas de slot (core.models.SlotReservation).
+# Horários que não caem em múltiplos deste valor são tratados de forma
+# conservadora (o bucket parcial conta como ocupado). Se mudar com dados em
+# produção, as reservas existentes precisam ser recriadas.
+SLOT_RESERVATION_BUCKET_MINUTES = config('SLOT_RESERVATION_BUCKET_MINUTES', default=5, cast=int)
+# Reservas de buckets mais antigos que isso (dias) são apagadas pelo
+# 'manage.py prune_slot_reservations' (rodar pelo cron, ex: uma vez por dia).
+# Horários passados não disputam mais nada; a margem só evita mexer em
+# agendamentos em andamento.
+SLOT_RESERVATION_RETENTION_DAYS = config('SLOT_RESERVATION_RETENTION_DAYS', default=1, cast=int)
+
+
+# --- Notificações WhatsApp (core/utils.py + outbox em core/notifications.py) ---
+TWILIO_ACCOUNT_SID = config('TWILIO_ACCOUNT_SID', default='')
+TWILIO_AUTH_TOKEN = config('TWILIO_AUTH_TOKEN', default='')
+TWILIO_WHATSAPP_FROM = config('TWILIO_WHATSAPP_FROM', default='')  # Ex: whatsapp:+14155238886
+# Vazio = envio simulado. Pode apontar para um endpoint fake local nos testes.
+WHATSAPP_API_URL = config(
+    'WHATSAPP_API_URL',
+    default=(
+        f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+        if TWILIO_ACCOUNT_SID else ''
+    ),
+)
+WHATSAPP_API_TIMEOUT = config('WHATSAPP_API_TIMEOUT', default=10, cast=float)
+# Backend de envio (core/notification_transport.py). Vazio = Twilio se
+# WHATSAPP_API_URL estiver definido, senão ConsoleBackend.
+WHATSAPP_BACKEND = config('WHATSAPP_BACKEND', default='')
+# Conexões keep-alive mantidas pela Session compartilhada
+WHATSAPP_POOL_MAXSIZE = config('WHATSAPP_POOL_MAXSIZE', default=10, cast=int)
+
+# 'thread': tenta enviar logo após o commit, fora da thread do request.
+# 'worker': só o 'manage.py process_notifications' envia.
+NOTIFICATION_DISPATCH = config('NOTIFICATION_DISPATCH', default='thread')
+# Quantas mensagens o worker envia por flush
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', default=20, cast=int)
+NOTIFICATION_MAX_ATTEMPTS = config('NOTIFICATION_MAX_ATTEMPTS', default=6, cast=int)
+NOTIFICATION_BACKOFF_SECONDS = config('NOTIFICATION_BACKOFF_SECONDS', default=30, cast=int)
+NOTIFICATION_BACKOFF_MAX_SECONDS = config('NOTIFICATION_BACKOFF_MAX_SECONDS', default=3600, cast=int)
+# Tempo que um envio "em andamento" fica reservado antes de outro worker poder pegá-lo
+NOTIFICATION_CLAIM_SECONDS = config('NOTIFICATION_CLAIM_SECONDS', default=120, cast=int)
+
+# Jobs de storage (core/storage_jobs.py): uploads e remoções no GCS fora do
+# request. Mesmos modos de NOTIFICATION_DISPATCH ('thread' ou 'worker').
+STORAGE_JOB_DISPATCH = config('STORAGE_JOB_DISPATCH', default='thread')
+STORAGE_JOB_BATCH_SIZE = config('STORAGE_JOB_BATCH_SIZE', default=20, cast=int)
+STORAGE_JOB_MAX_ATTEMPTS = config('STORAGE_JOB_MAX_ATTEMPTS', default=6, cast=int)
+STORAGE_JOB_CLAIM_SECONDS = config('STORAGE_JOB_CLAIM_SECONDS', default=300, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -211,6 +393,13 @@ else:
         'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
     }
 
+# Staging local dos uploads: a view grava aqui e um job de storage copia
+# para o 'default' (GCS). No modo 'worker', use um diretório compartilhado.
+STORAGES['staging'] = {
+    'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    'OPTIONS': {'location': config('STORAGE_STAGING_ROOT', default=os.path.join(MEDIA_ROOT, 'staging'))},
+}
+
 # Segurança em produção
 SECURE_SSL_REDIRECT = config('SECURE_SSL_REDIRECT', default=not DEBUG, cast=bool)
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -238,3 +427,22 @@ if IS_TESTING:
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',  # ':memory:' usa a RAM (super rápido)
     }
+    # Réplica "de mentira": um segundo SQLite, SEPARADO (sem MIRROR), para os
+    # testes do router verem de qual banco a leitura veio. Só é criado para
+    # os testes que o pedem (databases = {'default', 'replica'}); eles ligam
+    # READ_REPLICA_ALIAS com override_settings.
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+    READ_REPLICA_ALIAS = None
+
+    # Nada de threads de envio soltas durante os testes (e nada de API real)
+    NOTIFICATION_DISPATCH = 'worker'
+    STORAGE_JOB_DISPATCH = 'worker'
+
+    # Instrumentação só nos testes que ligam explicitamente (override_settings)
+    PERF_SAMPLE_RATE = 0.0
+    # Logs só nos testes que usam assertLogs
+    LOGGING = logging_config({name: ('CRITICAL', 1.0) for name in LOG_LEVELS})
+    WHATSAPP_API_URL = ''
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from core.views import CoreLoginView
+from core.metrics import metrics_view
 
 urlpatterns = [
     path(
@@ -31,5 +32,7 @@ urlpatterns = [
         name='logout'
     ),
     path('admin/', admin.site.urls),
+    # Prometheus: protegido por METRICS_TOKEN/staff (core/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
     path('', include('core.urls', namespace='core')),
 ]
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     User, Service, BarberProfile, 
-    Availability, Appointment, BarberService, Bloqueio
+    Availability, AvailabilityOverride, Appointment, BarberService, Bloqueio, NotificationOutbox,
+    StorageJob,
 )
 
 # --- Configuração do Admin de Usuário ---
@@ -63,6 +64,8 @@ class BarberProfileAdmin(admin.ModelAdmin):
 class AppointmentAdmin(admin.ModelAdmin):
     # MUDANÇA: 'service' -> 'barber_service'
     list_display = ('cliente_nome', 'barber', 'barber_service', 'data_hora_inicio', 'status')
+    # O __str__ do BarberService usa o barbeiro e o serviço (evita N+1 na lista)
+    list_select_related = ('barber', 'barber_service__barber', 'barber_service__service')
     list_filter = ('status', 'barber', 'data_hora_inicio')
     search_fields = ('cliente_nome', 'barber__nome_exibicao')
     readonly_fields = ('data_hora_fim',)
@@ -76,12 +79,35 @@ admin.site.register(User, CustomUserAdmin)
 @admin.register(BarberService)
 class BarberServiceAdmin(admin.ModelAdmin):
     list_display = ('barber', 'service', 'preco')
+    list_select_related = ('barber', 'service')
     search_fields = ('barber__nome_exibicao', 'service__nome')
     
 @admin.register(Bloqueio)
 class BloqueioAdmin(admin.ModelAdmin):
     list_display = ('barber', 'data_inicio', 'data_fim', 'motivo')
+    list_select_related = ('barber',)
     list_filter = ('barber',)
     search_fields = ('barber__nome_exibicao', 'motivo')
     # Facilita a seleção do barbeiro
-    autocomplete_fields = ('barber',)
\ No newline at end of file
+    autocomplete_fields = ('barber',)
+
+@admin.register(AvailabilityOverride)
+class AvailabilityOverrideAdmin(admin.ModelAdmin):
+    list_display = ('barber', 'data', 'tipo', 'hora_inicio', 'hora_fim', 'motivo')
+    list_filter = ('tipo', 'barber')
+    list_select_related = ('barber',)
+    autocomplete_fields = ('barber',)
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('appointment', 'tipo', 'status', 'tentativas', 'proxima_tentativa', 'enviado_em')
+    list_select_related = ('appointment__barber_service__barber', 'appointment__barber_service__service')
+    list_filter = ('status', 'tipo')
+    readonly_fields = ('criado_em', 'enviado_em', 'ultimo_erro')
+
+
+@admin.register(StorageJob)
+class StorageJobAdmin(admin.ModelAdmin):
+    list_display = ('acao', 'status', 'tentativas', 'proxima_tentativa', 'concluido_em')
+    list_filter = ('status', 'acao')
+    readonly_fields = ('nomes', 'criado_em', 'concluido_em', 'ultimo_erro')
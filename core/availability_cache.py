@@ -0,0 +1,124 @@
+# core/availability_cache.py
+"""
+Cache dos slots/datas disponíveis (usa o cache framework do Django).
+
+As chaves são "versionadas": cada barbeiro tem uma versão geral (muda
+quando Availability, Bloqueio, AvailabilityOverride, BarberService ou
+Service mudam) e cada
+(barbeiro, dia) tem a sua própria versão (muda quando um Appointment
+daquele dia é criado/alterado/apagado). Invalidar = trocar a versão;
+as entradas antigas ficam órfãs e expiram sozinhas.
+
+Cada versão carrega o instante em que foi criada: as views usam a chave
+como ETag e esse instante como Last-Modified (GET condicional, 304).
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+SLOTS_CACHE_TIMEOUT = getattr(settings, 'SLOTS_CACHE_TIMEOUT', 60 * 60)
+# None = as versões não expiram (só com cache compartilhado, ver config/settings.py)
+VERSION_TIMEOUT = getattr(settings, 'CACHE_VERSION_TIMEOUT', None)
+# Formato do objeto BarberCalendar no cache: mude ao mudar os atributos,
+# para não ler um pickle antigo depois do deploy
+CALENDAR_FORMAT = 2
+
+
+def _barber_version_key(barber_id):
+    return f'slots:v:barber:{barber_id}'
+
+
+def _day_version_key(barber_id, day):
+    return f'slots:v:day:{barber_id}:{day.isoformat()}'
+
+
+def _new_version():
+    # "<microssegundos em hex>.<aleatório>": única e com o instante da mudança
+    return f'{time.time_ns() // 1000:x}.{uuid4().hex[:12]}'
+
+
+def version_timestamp(version):
+    """Instante (datetime UTC) em que a versão foi criada, ou None."""
+    stamp, sep, _ = version.partition('.')
+    if not sep:
+        return None  # Versão no formato antigo (só uuid)
+    return datetime.fromtimestamp(int(stamp, 16) / 1_000_000, tz=dt_timezone.utc)
+
+
+def _last_modified(*versions):
+    stamps = [version_timestamp(version) for version in versions]
+    return None if None in stamps else max(stamps)
+
+
+def get_versions(*keys):
+    """
+    Lê (ou cria) as versões das chaves. Uma única ida ao cache no caso
+    comum. Também usado por outros caches versionados (core/catalog.py).
+    """
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=VERSION_TIMEOUT)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*keys):
+    """
+    Troca as versões agora (para quem lê dentro da mesma transação) e de
+    novo no commit: assim uma leitura concorrente que calculou os slots com
+    os dados antigos não consegue "ressuscitar" uma entrada desatualizada.
+    """
+    def bump():
+        cache.set_many({key: _new_version() for key in keys}, timeout=VERSION_TIMEOUT)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def day_slots_state(barber_id, service_id, day):
+    """
+    (chave, última mudança) dos slots de (barbeiro, serviço, dia).
+    Ler ANTES de calcular. A última mudança é None para versões antigas.
+    """
+    barber_version, day_version = get_versions(
+        _barber_version_key(barber_id), _day_version_key(barber_id, day)
+    )
+    key = f'slots:{barber_id}:{service_id}:{day.isoformat()}:{barber_version}:{day_version}'
+    return key, _last_modified(barber_version, day_version)
+
+
+def available_dates_state(barber_id, start_date, end_date):
+    """(chave, última mudança) da lista de datas de trabalho do barbeiro no range."""
+    barber_version, = get_versions(_barber_version_key(barber_id))
+    key = f'slots:dates:{barber_id}:{start_date.isoformat()}:{end_date.isoformat()}:{barber_version}'
+    return key, _last_modified(barber_version)
+
+
+def calendar_key(barber_id, bucket_minutes):
+    """Chave da agenda compilada do barbeiro (core/barber_calendar.py)."""
+    return calendar_keys([barber_id], bucket_minutes)[barber_id]
+
+
+def calendar_keys(barber_ids, bucket_minutes):
+    """{barber_id: chave da agenda} de vários barbeiros numa ida ao cache."""
+    barber_ids = list(barber_ids)
+    versions = get_versions(*(_barber_version_key(barber_id) for barber_id in barber_ids))
+    return {
+        barber_id: f'slots:calendar:{CALENDAR_FORMAT}:{barber_id}:{bucket_minutes}:{version}'
+        for barber_id, version in zip(barber_ids, versions)
+    }
+
+
+def invalidate_barber(barber_id):
+    """Invalida TODOS os dias/serviços do barbeiro (mudança de agenda)."""
+    bump_versions(_barber_version_key(barber_id))
+
+
+def invalidate_barber_day(barber_id, day):
+    """Invalida apenas um dia do barbeiro (todos os serviços)."""
+    bump_versions(_day_version_key(barber_id, day))
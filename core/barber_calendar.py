@@ -0,0 +1,243 @@
+# core/barber_calendar.py
+"""
+Agenda compilada de um barbeiro (horário de trabalho, sem agendamentos).
+
+Cada dia vira uma máscara de bits: o bit i ligado = o bucket i do dia
+(settings.CALENDAR_BUCKET_MINUTES, padrão 5min -> 288 bits) está aberto.
+A agenda guarda:
+
+- uma máscara por dia da semana (modelo semanal, Availability);
+- máscaras só das datas com exceção (AvailabilityOverride);
+- os Bloqueios fundidos em intervalos de datas.
+
+Ao lado de cada máscara ficam os blocos (hora_inicio, hora_fim) que a
+formaram, sem fundir blocos vizinhos: a grade de slots recomeça no início
+de cada bloco (09-12 + 12-18 com serviço de 40min oferece 12:00, não
+11:40/12:20). As máscaras servem só para saber se há horário aberto.
+
+É compilada com 3 queries e guardada no cache com a versão do barbeiro
+(core/availability_cache.py), então os sinais que já invalidam os slots
+também invalidam a agenda. As views de slots leem daqui em vez de
+remontar a agenda a partir das linhas a cada request.
+
+Nas máscaras, horários fora da grade de buckets são arredondados de forma
+conservadora: o que é aberto encolhe, o que é fechado cresce. Os blocos
+guardam os horários exatos.
+"""
+from bisect import bisect_right
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import availability_cache
+from .models import Availability, AvailabilityOverride, Bloqueio
+from .slots import available_work_dates, merge_date_ranges
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def interval_mask(hora_inicio, hora_fim, bucket_minutes, outward=False):
+    """
+    Máscara dos buckets de [hora_inicio, hora_fim). Por padrão só os
+    buckets inteiramente dentro (para horário aberto); com outward=True
+    todos os buckets tocados (para horário fechado).
+    """
+    size = bucket_minutes * 60
+    start, end = _seconds(hora_inicio), _seconds(hora_fim)
+    if outward:
+        first, last = start // size, -(-end // size)
+    else:
+        first, last = -(-start // size), end // size
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def mask_to_blocks(mask, bucket_minutes):
+    """Converte a máscara em blocos contínuos (hora_inicio, hora_fim)."""
+    blocks = []
+    while mask:
+        first = (mask & -mask).bit_length() - 1
+        shifted = mask >> first
+        length = (shifted ^ (shifted + 1)).bit_length() - 1  # Bits 1 seguidos
+        blocks.append((
+            _bucket_time(first, bucket_minutes),
+            _bucket_time(first + length, bucket_minutes),
+        ))
+        mask &= ~(((1 << length) - 1) << first)
+    return blocks
+
+
+def _bucket_time(index, bucket_minutes):
+    seconds = index * bucket_minutes * 60
+    if seconds >= SECONDS_PER_DAY:
+        return time.max
+    return time(seconds // 3600, seconds // 60 % 60)
+
+
+def add_block(blocks, hora_inicio, hora_fim):
+    """
+    Soma o bloco aberto [hora_inicio, hora_fim) à lista ordenada 'blocks'.
+    Funde só com os blocos que ele sobrepõe; blocos apenas encostados
+    continuam separados (cada um com a sua grade de slots).
+    """
+    merged = []
+    for inicio, fim in blocks:
+        if inicio < hora_fim and hora_inicio < fim:
+            hora_inicio, hora_fim = min(inicio, hora_inicio), max(fim, hora_fim)
+        else:
+            merged.append((inicio, fim))
+    merged.append((hora_inicio, hora_fim))
+    merged.sort()
+    return merged
+
+
+def remove_interval(blocks, hora_inicio, hora_fim):
+    """Tira [hora_inicio, hora_fim) dos blocos, partindo os que ele corta ao meio."""
+    remaining = []
+    for inicio, fim in blocks:
+        if hora_fim <= inicio or fim <= hora_inicio:
+            remaining.append((inicio, fim))
+            continue
+        if inicio < hora_inicio:
+            remaining.append((inicio, hora_inicio))
+        if hora_fim < fim:
+            remaining.append((hora_fim, fim))
+    return remaining
+
+
+class BarberCalendar:
+    """Agenda compilada (ver o docstring do módulo). Vai inteira para o cache (pickle)."""
+
+    def __init__(self, bucket_minutes, weekday_masks, date_masks, blocked_ranges,
+                 weekday_blocks, date_blocks):
+        self.bucket_minutes = bucket_minutes
+        self.weekday_masks = weekday_masks      # [máscara] x 7 (0 = Segunda)
+        self.date_masks = date_masks            # {date: máscara} (só exceções)
+        self.blocked_ranges = blocked_ranges    # [(inicio, fim)) fundidos
+        self.weekday_blocks = weekday_blocks    # [[(hora_inicio, hora_fim)]] x 7, ordenados
+        self.date_blocks = date_blocks          # {date: [(hora_inicio, hora_fim)]} (só exceções)
+        self._blocked_starts = [inicio for inicio, _ in blocked_ranges]
+
+    def is_blocked(self, day):
+        """O dia cai num Bloqueio (folga/férias de dia inteiro)?"""
+        i = bisect_right(self._blocked_starts, day) - 1
+        return i >= 0 and day < self.blocked_ranges[i][1]
+
+    def mask_for(self, day):
+        if self.is_blocked(day):
+            return 0
+        return self.date_masks.get(day, self.weekday_masks[day.weekday()])
+
+    def blocks_for(self, day):
+        """
+        Blocos (hora_inicio, hora_fim) abertos no dia, no formato de
+        compute_available_slots: ordenados, disjuntos e com os limites
+        originais (não saem da máscara).
+        """
+        if self.is_blocked(day):
+            return []
+        return self.date_blocks.get(day, self.weekday_blocks[day.weekday()])
+
+    def available_dates(self, start_date, end_date):
+        """Datas do range (inclusive) com algum horário aberto."""
+        work_weekdays = [weekday for weekday, mask in enumerate(self.weekday_masks) if mask]
+        blocked = [(inicio, fim - timedelta(days=1)) for inicio, fim in self.blocked_ranges]
+        dates = available_work_dates(start_date, end_date, work_weekdays, blocked)
+
+        # As exceções são poucas: ajusta só as datas que têm alguma
+        overrides = {
+            day for day in self.date_masks if start_date <= day <= end_date
+        }
+        if overrides:
+            dates = sorted(
+                {day for day in dates if day not in overrides}
+                | {day for day in overrides if self.mask_for(day)}
+            )
+        return dates
+
+
+def build_calendar(barber_id):
+    """Compila a agenda a partir do banco (3 queries)."""
+    return build_calendars([barber_id])[barber_id]
+
+
+def build_calendars(barber_ids):
+    """
+    Compila as agendas de vários barbeiros com as MESMAS 3 queries
+    (filtradas por barber_id IN), não 3 por barbeiro.
+    """
+    bucket_minutes = settings.CALENDAR_BUCKET_MINUTES
+    barber_ids = list(barber_ids)
+
+    weekday_masks = {barber_id: [0] * 7 for barber_id in barber_ids}
+    weekday_blocks = {barber_id: [[] for _ in range(7)] for barber_id in barber_ids}
+    for barber_id, dia, hora_inicio, hora_fim in Availability.objects.filter(
+        barber_id__in=barber_ids
+    ).order_by().values_list('barber_id', 'dia_da_semana', 'hora_inicio', 'hora_fim'):
+        weekday_masks[barber_id][dia] |= interval_mask(hora_inicio, hora_fim, bucket_minutes)
+        weekday_blocks[barber_id][dia] = add_block(weekday_blocks[barber_id][dia], hora_inicio, hora_fim)
+
+    bloqueios = {barber_id: [] for barber_id in barber_ids}
+    for barber_id, data_inicio, data_fim in Bloqueio.objects.filter(
+        barber_id__in=barber_ids
+    ).order_by().values_list('barber_id', 'data_inicio', 'data_fim'):
+        bloqueios[barber_id].append((data_inicio, data_fim))
+
+    # Num mesmo dia, 'aberto' é aplicado antes de 'fechado' (ordem alfabética)
+    date_masks = {barber_id: {} for barber_id in barber_ids}
+    date_blocks = {barber_id: {} for barber_id in barber_ids}
+    for barber_id, data, hora_inicio, hora_fim, tipo in AvailabilityOverride.objects.filter(
+        barber_id__in=barber_ids
+    ).order_by('data', 'tipo').values_list('barber_id', 'data', 'hora_inicio', 'hora_fim', 'tipo'):
+        masks, blocks_by_date = date_masks[barber_id], date_blocks[barber_id]
+        mask = masks.get(data, weekday_masks[barber_id][data.weekday()])
+        blocks = blocks_by_date.get(data, weekday_blocks[barber_id][data.weekday()])
+        if tipo == 'aberto':
+            mask |= interval_mask(hora_inicio, hora_fim, bucket_minutes)
+            blocks = add_block(blocks, hora_inicio, hora_fim)
+        else:
+            mask &= ~interval_mask(hora_inicio, hora_fim, bucket_minutes, outward=True)
+            blocks = remove_interval(blocks, hora_inicio, hora_fim)
+        masks[data] = mask
+        blocks_by_date[data] = blocks
+
+    return {
+        barber_id: BarberCalendar(
+            bucket_minutes, weekday_masks[barber_id], date_masks[barber_id],
+            merge_date_ranges(bloqueios[barber_id]),
+            weekday_blocks[barber_id], date_blocks[barber_id],
+        )
+        for barber_id in barber_ids
+    }
+
+
+def get_calendar(barber_id):
+    """Agenda do barbeiro, do cache (compila e guarda se não existir)."""
+    return get_calendars([barber_id])[barber_id]
+
+
+def get_calendars(barber_ids):
+    """
+    {barber_id: agenda} de vários barbeiros: uma leitura do cache para
+    todos e, para os que faltarem, uma única compilação (3 queries).
+    """
+    keys = availability_cache.calendar_keys(barber_ids, settings.CALENDAR_BUCKET_MINUTES)
+    cached = cache.get_many(keys.values())
+    calendars = {
+        barber_id: cached[key] for barber_id, key in keys.items() if key in cached
+    }
+    missing = [barber_id for barber_id in keys if barber_id not in calendars]
+    if missing:
+        built = build_calendars(missing)
+        cache.set_many(
+            {keys[barber_id]: calendar for barber_id, calendar in built.items()},
+            availability_cache.SLOTS_CACHE_TIMEOUT,
+        )
+        calendars.update(built)
+    return calendars
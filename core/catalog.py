@@ -0,0 +1,69 @@
+# core/catalog.py
+"""
+Snapshot do catálogo da homepage (barbeiros, fotos, serviços e preços).
+
+O snapshot é montado uma vez (2 queries), guardado no cache com uma
+versão global e reaproveitado por todas as visitas. Os sinais em
+core/signals.py trocam a versão quando BarberProfile, Service ou
+BarberService mudam. A mesma versão entra na chave do fragmento
+{% cache %} do template, então em regime a homepage não faz nenhuma
+query.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .availability_cache import bump_versions, get_versions
+from .models import BarberProfile, BarberService, Service
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+_VERSION_KEY = 'catalog:v'
+
+
+def catalog_version():
+    """Versão atual do catálogo (uma ida ao cache, nenhuma ao banco)."""
+    version, = get_versions(_VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    bump_versions(_VERSION_KEY)
+
+
+def build_snapshot():
+    """Monta o catálogo a partir do banco (só tipos simples: vai para o cache)."""
+    precos = {}
+    for barber_id, service_id, preco in BarberService.objects.values_list('barber_id', 'service_id', 'preco'):
+        precos.setdefault(barber_id, {})[str(service_id)] = str(preco)
+
+    barbers = []
+    for barber in BarberProfile.objects.only('id', 'nome_exibicao', 'profile_picture', 'foto_renditions'):
+        card = barber.foto_renditions.get('card', {})
+        barbers.append({
+            'id': barber.id,
+            'nome_exibicao': barber.nome_exibicao,
+            # Versão 'card' (poucos KB); fotos antigas, sem versões, usam o arquivo original
+            'foto_url': card.get('jpeg') or (barber.profile_picture.url if barber.profile_picture else ''),
+            'foto_webp': card.get('webp', ''),
+            'precos_json': json.dumps(precos.get(barber.id, {})),
+        })
+
+    services = [
+        {'id': service.id, 'nome': service.nome, 'friendly_duration': service.friendly_duration}
+        for service in Service.objects.all()
+    ]
+    return {'barbers': barbers, 'services': services}
+
+
+def get_snapshot(version=None):
+    """Snapshot da versão atual (monta e guarda no cache se não existir)."""
+    if version is None:
+        version = catalog_version()
+    key = f'catalog:snapshot:{version}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot()
+        cache.set(key, snapshot, CATALOG_CACHE_TIMEOUT)
+    return snapshot
@@ -0,0 +1,39 @@
+# core/db_connections.py
+"""
+Conexões persistentes fora do ciclo de request.
+
+Com CONN_MAX_AGE/CONN_HEALTH_CHECKS (config/settings.py) cada thread do
+gunicorn mantém a SUA conexão aberta entre requests: o Django descarta as
+velhas ou quebradas no início/fim de cada request (sinais request_started e
+request_finished) e, com health check, testa a conexão antes do primeiro
+uso em cada request. O connect (TLS + init_command + charset) acontece uma
+vez por conexão, não por request.
+
+As threads de envio/jobs (core/notifications.py, core/storage_jobs.py) e os
+workers (manage.py process_*) não passam por esses sinais: usam
+connection_cycle() em volta de cada job/lote para ter o mesmo comportamento
+(reaproveitar a conexão da thread, trocar a que expirou ou caiu).
+"""
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+def close_old_connections():
+    """
+    O close_old_connections() do Django, mas sem mexer em conexões dentro de
+    uma transação (ex: o worker chamado por call_command num TestCase).
+    """
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+@contextmanager
+def connection_cycle():
+    """Um "request" para o banco: descarta conexões velhas/quebradas antes e depois."""
+    close_old_connections()
+    try:
+        yield
+    finally:
+        close_old_connections()
@@ -0,0 +1,127 @@
+# core/db_router.py
+"""
+Réplica de leitura com "read-your-writes".
+
+As views só de leitura mais acessadas (READ_REPLICA_VIEWS: homepage,
+slots do dia, datas disponíveis) leem da réplica (READ_REPLICA_ALIAS);
+todo o resto, e TODA escrita, vai para o primário ('default').
+
+Quando a réplica NÃO é usada, mesmo numa dessas views:
+
+1. Quem acabou de escrever: um request que grava algo no banco (agendar,
+   confirmar/cancelar, editar o painel, login...) devolve o cookie
+   STICKY_COOKIE e, por READ_REPLICA_STICKY_SECONDS, os requests desse
+   navegador leem do primário. Vale entre workers (está no cookie).
+2. Dados que mudaram agora: as views passam o instante da versão do cache
+   (core/availability_cache.py) para pin_primary_if_recent(); se a mudança
+   tem menos de READ_REPLICA_MAX_LAG_SECONDS, a réplica pode ainda não ter
+   recebido e o request lê do primário. Sem isso um cliente qualquer
+   calcularia os slots com dados antigos e os guardaria no cache com a
+   versão nova (e o ETag), até a próxima mudança.
+3. Depois de uma escrita no próprio request, as leituras seguintes.
+
+Sem READ_REPLICA_ALIAS (o padrão) tudo continua no 'default'. Fora de um
+request (worker, threads de job) também.
+"""
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+STICKY_COOKIE = 'db_primary_until'
+
+_state = ContextVar('core_db_routing', default=None)
+
+
+class _RequestRouting:
+    """Estado de roteamento de UM request (vive num ContextVar)."""
+
+    def __init__(self):
+        self.read_alias = None  # Réplica liberada para as leituras deste request
+        self.wrote = False
+
+
+class ReadReplicaRouter:
+    """Router do DATABASE_ROUTERS: leituras liberadas pelo middleware vão para a réplica."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.read_alias and not state.wrote:
+            return state.read_alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Sempre o primário, mesmo para um objeto que foi lido da réplica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A réplica é uma cópia do primário: os objetos podem se relacionar
+        aliases = {DEFAULT_DB_ALIAS, getattr(settings, 'READ_REPLICA_ALIAS', None)}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def is_sticky(request):
+    """O navegador escreveu há pouco (cookie ainda válido)?"""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_primary_if_recent(changed_at):
+    """
+    Lê do primário se os dados mudaram há menos de READ_REPLICA_MAX_LAG_SECONDS
+    (changed_at = instante da versão do cache; None = desconhecido).
+    """
+    state = _state.get()
+    if state is None or not state.read_alias:
+        return
+    max_lag = timedelta(seconds=settings.READ_REPLICA_MAX_LAG_SECONDS)
+    if changed_at is None or timezone.now() - changed_at < max_lag:
+        state.read_alias = None
+
+
+class ReadReplicaMiddleware:
+    """Libera a réplica para as views de READ_REPLICA_VIEWS e marca quem escreveu."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RequestRouting()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            sticky_seconds = settings.READ_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time()) + sticky_seconds),
+                max_age=sticky_seconds,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = getattr(settings, 'READ_REPLICA_ALIAS', None)
+        state = _state.get()
+        if (
+            alias and state is not None and not state.wrote
+            and request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name in settings.READ_REPLICA_VIEWS
+            and not is_sticky(request)
+        ):
+            state.read_alias = alias
+        return None
@@ -0,0 +1,82 @@
+# core/first_available.py
+"""
+"Primeiro horário livre com qualquer barbeiro" para um serviço.
+
+Em vez de repetir GetAvailableSlotsView barbeiro a barbeiro, os dados de
+TODOS os barbeiros que oferecem o serviço são carregados em lote:
+
+1. BarberService (+ barbeiro e serviço): 1 query;
+2. agendas compiladas: 1 leitura do cache (3 queries só para as frias);
+3. agendamentos do range de todos eles: 1 query.
+
+Cada barbeiro vira um gerador preguiçoso de slots em ordem cronológica
+(dia a dia, com core/occupancy.py) e heapq.merge intercala os geradores.
+Só se calcula o necessário para os N primeiros: um barbeiro lotado
+hoje não tem a semana inteira calculada se os outros já bastam.
+"""
+import heapq
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import barber_calendar
+from .models import Appointment, BarberService
+from .occupancy import DayOccupancy
+
+
+def barber_slot_stream(barber_id, calendar, busy_by_day, start_date, end_date, duration, now, tz):
+    """Gera (início, barber_id) dos slots livres do barbeiro, em ordem."""
+    granularity = settings.CALENDAR_BUCKET_MINUTES
+    day = start_date
+    while day <= end_date:
+        blocks = calendar.blocks_for(day)
+        if blocks:
+            occupancy = DayOccupancy.build(
+                day, blocks, busy_by_day.get(day, []), granularity=granularity, tz=tz,
+            )
+            # Os blocos da agenda compilada já vêm ordenados e disjuntos
+            for slot in occupancy.free_slots(duration, now=now):
+                yield slot, barber_id
+        day += timedelta(days=1)
+
+
+def first_available_slots(service_id, start_date, end_date, limit, now=None, tz=None):
+    """
+    Os 'limit' primeiros slots livres (de qualquer barbeiro) do serviço,
+    de start_date até end_date (inclusive). Devolve uma lista de
+    (início "aware", BarberService), em ordem de horário; empates são
+    desfeitos pelo id do barbeiro.
+    """
+    tz = tz or timezone.get_current_timezone()
+    now = now or timezone.now()
+
+    # 1. Quem oferece o serviço (com barbeiro e duração numa query)
+    offers = {
+        offer.barber_id: offer
+        for offer in BarberService.objects.filter(service_id=service_id).select_related('barber', 'service')
+    }
+    if not offers:
+        return []
+
+    # 2. Agendas compiladas de todos (cache) e agendamentos do range (1 query)
+    calendars = barber_calendar.get_calendars(offers)
+    busy = {barber_id: {} for barber_id in offers}
+    for barber_id, inicio, fim in Appointment.objects.starting_between(
+        start_date, end_date
+    ).active().filter(barber_id__in=list(offers)).values_list('barber_id', 'data_hora_inicio', 'data_hora_fim'):
+        busy[barber_id].setdefault(timezone.localtime(inicio, tz).date(), []).append((inicio, fim))
+
+    # 3. Intercala os geradores (fila de prioridade) e para nos N primeiros
+    streams = [
+        barber_slot_stream(
+            barber_id, calendars[barber_id], busy[barber_id],
+            start_date, end_date, offer.service.duracao, now, tz,
+        )
+        for barber_id, offer in offers.items()
+    ]
+    return [
+        (slot, offers[barber_id])
+        for slot, barber_id in islice(heapq.merge(*streams), limit)
+    ]
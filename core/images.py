@@ -0,0 +1,132 @@
+# core/images.py
+"""
+Pipeline das fotos de perfil dos barbeiros (Pillow).
+
+O upload original (até 2MB, muitas vezes direto do celular) não é
+servido. Ele é decodificado, girado conforme a orientação EXIF e
+regravado SEM metadados (EXIF traz GPS, modelo do aparelho...) em
+algumas "renditions", cada uma em WebP e JPEG:
+
+- thumb: 96x96, recortada ao centro (admin/painel);
+- card: 300x300, recortada ao centro (homepage: 150px em telas 2x);
+- full: lado maior até 1200px, sem recorte.
+
+Os arquivos de uma foto ficam juntos em 'barber_photos/<token>/', com
+nomes fixos (ex: card.webp), então basta o prefixo para achar (e apagar)
+todas as renditions.
+"""
+import io
+import posixpath
+from uuid import uuid4
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .instrumentation import span
+
+PHOTO_DIR = 'barber_photos'
+
+# nome -> (largura, altura, recorta ao centro?)
+RENDITIONS = {
+    'thumb': (96, 96, True),
+    'card': (300, 300, True),
+    'full': (1200, 1200, False),
+}
+
+# formato -> (extensão, opções do Pillow)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 6}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_name(prefix, rendition, fmt):
+    """Caminho no storage de uma rendition. Ex: barber_photos/ab12/card.webp"""
+    return posixpath.join(prefix, f'{rendition}.{FORMATS[fmt][0]}')
+
+
+def rendition_names(prefix):
+    """Todos os caminhos das renditions de uma foto."""
+    return [rendition_name(prefix, rendition, fmt) for rendition in RENDITIONS for fmt in FORMATS]
+
+
+def photo_prefix(picture_name):
+    """
+    Prefixo das renditions a partir do nome guardado em profile_picture
+    (a 'full' em JPEG). None para fotos antigas, gravadas sem pipeline.
+    """
+    prefix, filename = posixpath.split(picture_name or '')
+    if filename != posixpath.basename(rendition_name('', 'full', 'jpeg')) or prefix == PHOTO_DIR:
+        return None
+    return prefix
+
+
+def _open(file_obj):
+    """Decodifica a imagem (já orientada, em RGB). ValidationError se não for imagem."""
+    try:
+        file_obj.seek(0)
+        image = Image.open(file_obj)
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise ValidationError('O arquivo enviado não é uma imagem válida.')
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG não tem transparência: aplica sobre fundo branco
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+    return resized
+
+
+def render_profile_photo(file_obj):
+    """
+    Gera as renditions em memória. Devolve {(rendition, formato): bytes}.
+    Nenhum metadado do original é copiado (save() sem exif=).
+    """
+    image = _open(file_obj)
+    files = {}
+    for rendition, (width, height, crop) in RENDITIONS.items():
+        resized = _resize(image, width, height, crop)
+        for fmt, (_, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, **options)
+            files[rendition, fmt] = buffer.getvalue()
+    return files
+
+
+def save_profile_photo(storage, file_obj, url_storage=None):
+    """
+    Processa e grava as renditions em 'storage' (ex: o staging local, que
+    um job copia depois para o storage definitivo; ver core/storage_jobs.py).
+    As URLs vêm de 'url_storage' (padrão: o próprio storage).
+    Devolve (nome da 'full' JPEG para o profile_picture, {rendition: {formato: url}}).
+    """
+    url_storage = url_storage or storage
+    with span('image'):
+        files = render_profile_photo(file_obj)
+    prefix = posixpath.join(PHOTO_DIR, uuid4().hex)
+    urls = {}
+    with span('storage'):
+        for (rendition, fmt), content in files.items():
+            name = storage.save(rendition_name(prefix, rendition, fmt), ContentFile(content))
+            urls.setdefault(rendition, {})[fmt] = url_storage.url(name)
+    return rendition_name(prefix, 'full', 'jpeg'), urls
+
+
+def photo_files(picture_name):
+    """Arquivos de uma foto: todas as renditions, ou o arquivo único das fotos antigas."""
+    if not picture_name:
+        return []
+    prefix = photo_prefix(picture_name)
+    return rendition_names(prefix) if prefix else [picture_name]
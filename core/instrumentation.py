@@ -0,0 +1,237 @@
+# core/instrumentation.py
+"""
+Instrumentação por request: para onde vai o tempo?
+
+PerformanceMiddleware mede, em cada request amostrado:
+
+- o tempo total (wall time);
+- queries e tempo de banco (execute_wrapper em todas as conexões);
+- hits/misses de cache (InstrumentedCache, um "wrapper" do backend real);
+- spans nomeados no código: with span('slots'): ...
+
+O resultado vai no header Server-Timing (aparece no DevTools do navegador)
+e numa linha de log estruturada no logger 'core.performance'. Controle em
+config/settings.py:
+
+- PERF_SAMPLE_RATE: fração dos requests instrumentados (0 desliga, 1 = todos);
+- PERF_SERVER_TIMING: envia o header (expõe tempos internos ao cliente);
+- PERF_SLOW_REQUEST_MS: acima disso o request sempre gera log, mesmo fora
+  da amostra (só com o tempo total).
+
+Fora de um request (worker, thread de job) span() e os contadores não
+fazem nada.
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger('core.performance')
+
+_current = ContextVar('core_request_timings', default=None)
+
+
+class RequestTimings:
+    """Métricas de UM request (vivem num ContextVar enquanto ele roda)."""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.spans = {}  # nome -> segundos (acumulado)
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper do Django: mede cada query
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.db_queries += 1
+
+
+def current():
+    """Métricas do request em andamento (None fora de um request amostrado)."""
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Mede um trecho nomeado. Ex: with span('slots'): ..."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_span(name, time.perf_counter() - start)
+
+
+def record_cache(hits, misses):
+    timings = _current.get()
+    if timings is not None:
+        timings.cache_hits += hits
+        timings.cache_misses += misses
+
+
+# ---
+# Cache: wrapper que conta hits/misses de qualquer backend
+# ---
+_MISSING = object()
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Backend de cache que delega tudo para OPTIONS['BACKEND'] e conta os
+    hits/misses de get/get_many no request atual. O resto das opções vai
+    para o backend real.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        backend = options.pop('BACKEND')
+        super().__init__({**params, 'OPTIONS': options})
+        self._wrapped = import_string(backend)(location, {**params, 'OPTIONS': options})
+
+    def get(self, key, default=None, version=None):
+        value = self._wrapped.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self._wrapped.get_many(keys, version=version)
+        record_cache(len(found), len(keys) - len(found))
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._wrapped.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._wrapped.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._wrapped.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._wrapped.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        return self._wrapped.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._wrapped.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._wrapped.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._wrapped.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._wrapped.decr(key, delta, version=version)
+
+    def clear(self):
+        return self._wrapped.clear()
+
+    def close(self, **kwargs):
+        return self._wrapped.close(**kwargs)
+
+
+# ---
+# Middleware
+# ---
+class PerformanceMiddleware:
+    """Deve ser o PRIMEIRO da lista MIDDLEWARE (mede os outros também)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', 0.0)
+        sampled = sample_rate > 0 and random.random() < sample_rate
+        start = time.perf_counter()
+
+        if not sampled:
+            response = self.get_response(request)
+            total = time.perf_counter() - start
+            self._observe(request, total)
+            if total * 1000 >= getattr(settings, 'PERF_SLOW_REQUEST_MS', 1000):
+                self._log(request, response, total, None)
+            return response
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        self._observe(request, total)
+
+        if getattr(settings, 'PERF_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(total, timings)
+        self._log(request, response, total, timings)
+        return response
+
+    @staticmethod
+    def _observe(request, total):
+        # Histograma do Prometheus (core/metrics.py): todos os requests, sem amostragem
+        match = getattr(request, 'resolver_match', None)
+        if match:
+            metrics.observe_request(match.view_name, total)
+
+    def _log(self, request, response, total, timings):
+        match = getattr(request, 'resolver_match', None)
+        data = {
+            'method': request.method,
+            'view': match.view_name if match else None,  # Sem path/query: nada de dados do cliente
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'sampled': timings is not None,
+        }
+        if timings is not None:
+            data.update({
+                'db_queries': timings.db_queries,
+                'db_ms': round(timings.db_time * 1000, 1),
+                'cache_hits': timings.cache_hits,
+                'cache_misses': timings.cache_misses,
+                'spans_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.spans.items()},
+            })
+        logger.info(
+            'request %s %s %s %.1fms', data['method'], data['view'], data['status'], data['total_ms'],
+            extra={'perf': data},
+        )
+
+
+def server_timing(total, timings):
+    """Valor do header Server-Timing (durações em ms)."""
+    entries = [
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={timings.db_time * 1000:.1f};desc="{timings.db_queries} queries"',
+        f'cache;desc="hit={timings.cache_hits} miss={timings.cache_misses}"',
+    ]
+    entries += [
+        f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.spans.items()
+    ]
+    return ', '.join(entries)
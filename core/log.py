@@ -0,0 +1,174 @@
+# core/log.py
+"""
+Logging estruturado (JSON) e sem bloquear o request.
+
+- JsonFormatter: uma linha JSON por registro (ts, level, logger, msg e os
+  campos passados em extra=...). Campos com dados pessoais (nome/telefone
+  do cliente, corpo da mensagem...) saem como "[redacted]".
+- SamplingFilter: deixa passar só uma fração dos registros abaixo de
+  WARNING (avisos e erros passam sempre).
+- QueueJsonHandler: a thread do request só formata e põe o registro numa
+  fila em memória; um QueueListener (thread própria) faz a escrita no
+  stream. Nenhuma thread de request espera o stdout.
+
+Nível e amostragem por logger ficam em config/settings.py (LOG_LOGGERS).
+Regra para quem loga: dados do cliente nunca no texto da mensagem; ids
+e tipos de erro em extra=... Para exceções de terceiros (que podem trazer
+o telefone no texto), logar type(e).__name__ em vez de exc_info.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone as dt_timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Campos (de extra=...) que nunca saem no log
+REDACTED_FIELDS = frozenset({
+    'cliente_nome', 'cliente_telefone', 'client_name', 'client_phone',
+    'telefone', 'telefone_whatsapp', 'phone', 'to', 'body',
+})
+
+# Atributos que todo LogRecord tem: o que sobrar veio de extra=...
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {
+            key: '[redacted]' if key in REDACTED_FIELDS else _redact(item)
+            for key, item in value.items()
+        }
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, tz=dt_timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        extra = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        data.update(_redact(extra))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Mantém só uma fração dos registros abaixo de WARNING (avisos e erros
+    passam sempre). 'rates' = {logger: fração}; vale o logger configurado
+    mais específico (ex: 'core' cobre 'core.views'). Fica no handler, então
+    também pega os registros que sobem dos loggers filhos.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class QueueJsonHandler(QueueHandler):
+    """
+    QueueHandler com o seu próprio QueueListener (escreve em 'stream').
+    O registro é formatado (JSON) aqui, na thread que loga; só a escrita
+    vai para a thread do listener.
+
+    A thread do listener só nasce no primeiro registro de cada processo: o
+    dictConfig roda no import do settings e, com 'gunicorn --preload', os
+    workers são fork do master e não herdam a thread (a fila herdada nunca
+    seria esvaziada).
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.setFormatter(JsonFormatter())
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Esvazia a fila na saída do processo
+        atexit.register(self.stop_listener)
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            if self.listener is not None:
+                # Listener de outro processo (antes do fork): a thread não existe aqui
+                self.listener.stop()
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+            self.listener.start()
+            self._pid = pid
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop_listener(self):
+        """Escreve o que ainda está na fila e para a thread (pode ser chamado mais de uma vez)."""
+        if self.listener is not None and self._pid == os.getpid() and self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop_listener()
+        super().close()
+
+
+def logger_levels(spec, defaults):
+    """
+    Lê "logger=NÍVEL[:amostragem],..." (ex: "core.performance=INFO:0.1,django=ERROR")
+    por cima de 'defaults' ({logger: (nível, amostragem)}).
+    """
+    levels = dict(defaults)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        level, _, rate = value.partition(':')
+        current_level, current_rate = levels.get(name.strip(), ('INFO', 1.0))
+        levels[name.strip()] = (level.strip().upper() or current_level, float(rate) if rate else current_rate)
+    return levels
+
+
+def logging_config(levels):
+    """Monta o dict do LOGGING (dictConfig) a partir de {logger: (nível, amostragem)}."""
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'filters': {
+            'sampling': {
+                '()': 'core.log.SamplingFilter',
+                'rates': {name: rate for name, (_, rate) in levels.items() if rate < 1},
+            },
+        },
+        'handlers': {
+            'json': {'()': 'core.log.QueueJsonHandler', 'filters': ['sampling']},
+        },
+        'loggers': {
+            name: {'handlers': ['json'], 'level': level, 'propagate': False}
+            for name, (level, _) in levels.items()
+        },
+    }
@@ -0,0 +1,269 @@
+import json
+import random
+import time as time_module
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    Appointment, Availability, BarberProfile, BarberService, Service, SlotReservation, User,
+)
+from core.slots import reservation_buckets
+
+# Distribuições "realistas" de uma barbearia
+DURACOES_MIN = [20, 30, 30, 30, 45, 45, 60, 90]
+STATUS_PESOS = [('confirmado', 70), ('pendente', 20), ('cancelado', 10)]
+# Turnos típicos (segunda a sábado), com e sem pausa para o almoço
+TURNOS = [
+    [(time(9, 0), time(12, 0)), (time(13, 0), time(19, 0))],
+    [(time(10, 0), time(20, 0))],
+    [(time(8, 0), time(12, 0)), (time(14, 0), time(18, 0))],
+]
+
+
+def percentile(sorted_values, p):
+    """Percentil pelo método "nearest-rank" (lista já ordenada)."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))  # ceil sem float
+    return sorted_values[int(rank) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de busca de slots e agendamento: cria barbeiros, serviços e "
+        "agendamentos e mede p50/p95/p99 e número de queries de cada view. "
+        "Por padrão roda num banco de teste descartável."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--barbers', type=int, default=10)
+        parser.add_argument('--services', type=int, default=8)
+        parser.add_argument('--appointments', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=30, help='Janela de datas dos agendamentos.')
+        parser.add_argument('--requests', type=int, default=200, help='Requisições medidas por view.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Grava o JSON neste arquivo (além do stdout).')
+        parser.add_argument(
+            '--current-db', action='store_true',
+            help='Usa o banco atual em vez de criar um banco de teste (CUIDADO: grava dados).'
+        )
+
+    def handle(self, *args, **options):
+        if options['current_db']:
+            # O Client manda Host "testserver": fora do ambiente de teste ele
+            # não está no ALLOWED_HOSTS e toda requisição voltaria 400
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                report = self.run_benchmark(options)
+        else:
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                report = self.run_benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    # ---
+    # 1. Dados de teste
+    # ---
+    def seed(self, rng, options):
+        prefix = f"bench{rng.randrange(10 ** 6)}"
+        services = Service.objects.bulk_create([
+            Service(nome=f"Serviço {i}", duracao=timedelta(minutes=rng.choice(DURACOES_MIN)))
+            for i in range(options['services'])
+        ])
+
+        barbers = []
+        for i in range(options['barbers']):
+            user = User.objects.create_user(username=f"{prefix}_{i}", password='bench', is_barber=True)
+            barbers.append(BarberProfile.objects.create(
+                user=user, nome_exibicao=f"Barbeiro {i}", telefone_whatsapp='34999998888'
+            ))
+
+        barber_services, availability = [], []
+        turnos_por_barbeiro = {}
+        for barber in barbers:
+            for service in rng.sample(services, k=max(1, len(services) * 2 // 3)):
+                barber_services.append(BarberService(
+                    barber=barber, service=service, preco=rng.choice([35, 50, 70, 120])
+                ))
+            turnos = rng.choice(TURNOS)
+            turnos_por_barbeiro[barber.pk] = turnos
+            for dia in range(6):  # Segunda a sábado
+                for inicio, fim in turnos:
+                    availability.append(Availability(
+                        barber=barber, dia_da_semana=dia, hora_inicio=inicio, hora_fim=fim
+                    ))
+        barber_services = BarberService.objects.bulk_create(barber_services)
+        Availability.objects.bulk_create(availability)
+
+        services_by_barber = {}
+        for bs in barber_services:
+            services_by_barber.setdefault(bs.barber_id, []).append(bs)
+
+        # Agendamentos sem sobreposição: mais cheios nos próximos dias
+        tz = timezone.get_current_timezone()
+        today = timezone.localdate()
+        ocupado = {}
+        appointments = []
+        tentativas = 0
+        status_values, status_weights = zip(*STATUS_PESOS)
+        while len(appointments) < options['appointments'] and tentativas < options['appointments'] * 20:
+            tentativas += 1
+            barber = rng.choice(barbers)
+            day = today + timedelta(days=min(int(rng.expovariate(1 / 7)), options['days'] - 1))
+            if day.weekday() == 6:
+                continue
+            bs = rng.choice(services_by_barber[barber.pk])
+            inicio_turno, fim_turno = rng.choice(turnos_por_barbeiro[barber.pk])
+            minutos = (fim_turno.hour - inicio_turno.hour) * 60
+            start = timezone.make_aware(
+                datetime.combine(day, inicio_turno) + timedelta(minutes=rng.randrange(0, minutos, 15)), tz
+            )
+            end = start + bs.service.duracao
+            if end > timezone.make_aware(datetime.combine(day, fim_turno), tz):
+                continue
+            intervals = ocupado.setdefault((barber.pk, day), [])
+            if any(start < fim and end > inicio for inicio, fim in intervals):
+                continue
+            intervals.append((start, end))
+            appointments.append(Appointment(
+                barber=barber, barber_service=bs,
+                cliente_nome=f"Cliente {len(appointments)}", cliente_telefone='11999999999',
+                data_hora_inicio=start, data_hora_fim=end,
+                status=rng.choices(status_values, status_weights)[0],
+            ))
+        appointments = Appointment.objects.bulk_create(appointments, batch_size=500)
+
+        # bulk_create não dispara sinais: cria as reservas na mão
+        bucket = SlotReservation.bucket_size()
+        SlotReservation.objects.bulk_create([
+            SlotReservation(barber_id=a.barber_id, appointment=a, inicio=b)
+            for a in appointments if a.status in ('pendente', 'confirmado')
+            for b in reservation_buckets(a.data_hora_inicio, a.data_hora_fim, bucket)
+        ], batch_size=1000)
+
+        return barbers, services_by_barber, len(appointments)
+
+    # ---
+    # 2. Medição
+    # ---
+    def measure(self, n, make_request):
+        latencies, queries, statuses = [], [], Counter()
+        for i in range(n):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time_module.perf_counter()
+                response = make_request(i)
+                latencies.append((time_module.perf_counter() - started) * 1000)
+            queries.append(len(ctx.captured_queries))
+            statuses[str(response.status_code)] += 1
+
+        latencies.sort()
+        queries.sort()
+        return {
+            'requests': n,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / n, 3),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': queries[-1],
+            'status': dict(statuses),
+        }
+
+    def run_benchmark(self, options):
+        rng = random.Random(options['seed'])
+        barbers, services_by_barber, n_appointments = self.seed(rng, options)
+        n = options['requests']
+        today = timezone.localdate()
+        client = Client()
+
+        def random_barber_service():
+            barber = rng.choice(barbers)
+            return barber, rng.choice(services_by_barber[barber.pk])
+
+        def random_day():
+            return today + timedelta(days=rng.randrange(options['days']))
+
+        def get_slots(i):
+            barber, bs = random_barber_service()
+            return client.get(reverse('core:get_available_slots'), {
+                'barber_id': barber.pk, 'service_id': bs.service_id,
+                'date': random_day().strftime('%Y-%m-%d'),
+            }, secure=True)
+
+        def get_dates(i):
+            return client.get(
+                reverse('core:get_barber_available_dates', args=[rng.choice(barbers).pk]), secure=True
+            )
+
+        def pick_free_slot(i):
+            # Escolhe um slot livre (fora da medição) para a maioria dar 201
+            barber, bs = random_barber_service()
+            day = random_day()
+            slots = client.get(reverse('core:get_available_slots'), {
+                'barber_id': barber.pk, 'service_id': bs.service_id, 'date': day.strftime('%Y-%m-%d'),
+            }, secure=True).json().get('available_slots') or ['10:00']
+            payload = {
+                'barber_id': barber.pk, 'service_id': bs.service_id,
+                'start_datetime': f"{day:%Y-%m-%d}T{rng.choice(slots)}",
+                'client_name': f"Bench {i}", 'client_phone': '11912345678',
+            }
+            return payload
+
+        def post_appointment(payload, i):
+            # Um IP por requisição: o AppointmentRateThrottle (5/min) não interfere
+            return client.post(
+                reverse('core:create_appointment'), json.dumps(payload),
+                content_type='application/json', secure=True,
+                REMOTE_ADDR=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            )
+
+        results = {
+            'GetAvailableSlotsView': self.measure(n, get_slots),
+            'GetBarberAvailableDatesView': self.measure(n, get_dates),
+        }
+
+        payloads = [pick_free_slot(i) for i in range(n)]
+        results['CreateAppointmentView'] = self.measure(
+            n, lambda i: post_appointment(payloads[i], i)
+        )
+
+        # Um client logado por barbeiro (o login fica fora da medição)
+        painel_clients = []
+        for barber in barbers:
+            painel_client = Client()
+            painel_client.force_login(barber.user)
+            painel_clients.append(painel_client)
+
+        def get_painel(i):
+            return rng.choice(painel_clients).get(reverse('core:painel'), secure=True)
+
+        results['PainelView'] = self.measure(n, get_painel)
+
+        return {
+            'params': {
+                'barbers': options['barbers'],
+                'services': options['services'],
+                'appointments': n_appointments,
+                'days': options['days'],
+                'requests': n,
+                'seed': options['seed'],
+                'database': connection.vendor,
+            },
+            'results': results,
+        }
@@ -0,0 +1,34 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from core.images import photo_prefix, save_profile_photo
+from core.models import BarberProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as versões redimensionadas (sem EXIF) das fotos de perfil que "
+        "ainda não passaram pelo pipeline (fotos antigas ou enviadas pelo admin)."
+    )
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for profile in BarberProfile.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True):
+            if photo_prefix(profile.profile_picture.name):
+                continue  # Já processada
+
+            try:
+                with profile.profile_picture.open('rb') as original:
+                    picture_name, renditions = save_profile_photo(profile.profile_picture.storage, original)
+            except (OSError, ValidationError) as e:
+                failed += 1
+                self.stderr.write(f"{profile}: {e}")
+                continue
+
+            # O save() apaga o arquivo original, que foi substituído
+            profile.profile_picture = picture_name
+            profile.foto_renditions = renditions
+            profile.save(update_fields=['profile_picture', 'foto_renditions'])
+            processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{processed} foto(s) processada(s), {failed} com erro."))
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import notifications
+from core.db_connections import connection_cycle
+from core.notification_transport import get_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker do outbox de notificações: envia as notificações pendentes "
+        "com retentativas e backoff exponencial."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Processa um único lote e sai (útil em cron/testes).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE,
+            help='Quantas notificações enviar por lote (um flush do transporte).'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help='Segundos de espera quando não há nada para enviar.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Conexão persistente, trocada se expirou ou caiu (core/db_connections.py)
+            with connection_cycle():
+                enviadas, nao_enviadas = notifications.drain(batch_size=options['batch_size'])
+            if enviadas or nao_enviadas:
+                stats = get_stats()
+                self.stdout.write(
+                    f"Notificações: {enviadas} enviada(s), {nao_enviadas} não enviada(s). "
+                    f"Transporte: {stats['enviados']} ok, {stats['erros']} erro(s), "
+                    f"latência média {stats['latencia_media_s'] * 1000:.0f}ms."
+                )
+
+            if options['once']:
+                return
+
+            # Lote cheio: provavelmente há mais na fila, não espera
+            if enviadas + nao_enviadas < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import storage_jobs
+from core.db_connections import connection_cycle
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker dos jobs de storage: copia os uploads do staging para o "
+        "storage padrão (GCS) e apaga os arquivos antigos, com retentativas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Processa um único lote e sai (útil em cron/testes).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.STORAGE_JOB_BATCH_SIZE,
+            help='Quantos jobs executar por lote.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help='Segundos de espera quando não há nada para fazer.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Conexão persistente, trocada se expirou ou caiu (core/db_connections.py)
+            with connection_cycle():
+                concluidos, nao_concluidos = storage_jobs.drain(batch_size=options['batch_size'])
+            if concluidos or nao_concluidos:
+                self.stdout.write(
+                    f"Jobs de storage: {concluidos} concluído(s), {nao_concluidos} não concluído(s)."
+                )
+
+            if options['once']:
+                return
+
+            # Lote cheio: provavelmente há mais na fila, não espera
+            if concluidos + nao_concluidos < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import SlotReservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga as reservas de slot (SlotReservation) de horários que já "
+        "passaram. Cada agendamento cria duração/bucket linhas; rode pelo "
+        "cron (ex: uma vez por dia) para a tabela não crescer sem limite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.SLOT_RESERVATION_RETENTION_DAYS,
+            help='Mantém as reservas dos últimos N dias.'
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        deleted = SlotReservation.prune(before)
+        self.stdout.write(self.style.SUCCESS(f"{deleted} reserva(s) de slot apagada(s)."))
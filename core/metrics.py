@@ -0,0 +1,108 @@
+# core/metrics.py
+"""
+Métricas no formato do Prometheus (prometheus_client).
+
+- core_request_latency_seconds{view}: histograma de latência das APIs
+  quentes (slots, datas disponíveis, criação de agendamento), alimentado
+  pelo PerformanceMiddleware (core/instrumentation.py);
+- core_bookings_total{resultado}: agendamentos criados ('sucesso') e
+  recusados por colisão ('colisao_validacao': o horário já estava ocupado
+  na validação; 'colisao_reserva': perdeu a corrida na UNIQUE de
+  SlotReservation);
+- core_throttled_requests_total{scope}: requests barrados pelo throttle;
+- core_notifications_total{resultado}: envios de WhatsApp ('enviado',
+  'erro', 'ignorado').
+
+Com vários workers do gunicorn, defina PROMETHEUS_MULTIPROC_DIR (ver
+config/settings.py): cada processo grava os valores em arquivos nesse
+diretório e o /metrics soma todos. O diretório deve ser esvaziado a cada
+deploy, antes de subir os workers.
+
+O /metrics (metrics_view) exige METRICS_TOKEN no header Authorization
+("Bearer <token>") ou um usuário staff; sem isso responde 404.
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Views com histograma de latência (nome da URL -> label)
+LATENCY_VIEWS = {
+    'core:get_available_slots': 'get_available_slots',
+    'core:get_barber_available_dates': 'get_barber_available_dates',
+    'core:create_appointment': 'create_appointment',
+}
+
+REQUEST_LATENCY = Histogram(
+    'core_request_latency_seconds',
+    'Latência das APIs de disponibilidade e agendamento.',
+    ['view'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+BOOKINGS = Counter(
+    'core_bookings_total',
+    'Tentativas de agendamento por resultado.',
+    ['resultado'],
+)
+THROTTLED = Counter(
+    'core_throttled_requests_total',
+    'Requests recusados pelo rate limit.',
+    ['scope'],
+)
+NOTIFICATIONS = Counter(
+    'core_notifications_total',
+    'Envios de notificação por WhatsApp por resultado.',
+    ['resultado'],
+)
+
+
+def observe_request(view_name, seconds):
+    """Chamado pelo middleware em todo request; só as views de LATENCY_VIEWS contam."""
+    label = LATENCY_VIEWS.get(view_name)
+    if label:
+        REQUEST_LATENCY.labels(view=label).observe(seconds)
+
+
+def booking(resultado):
+    BOOKINGS.labels(resultado=resultado).inc()
+
+
+def throttled(scope):
+    THROTTLED.labels(scope=scope).inc()
+
+
+def notification(resultado, count=1):
+    if count:
+        NOTIFICATIONS.labels(resultado=resultado).inc(count)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Soma os arquivos de todos os workers
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.headers.get('Authorization', '')
+        if hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+def metrics_view(request):
+    """Exposição no formato texto do Prometheus (protegida, ver o docstring do módulo)."""
+    if not _authorized(request):
+        # 404 e não 401/403: não anuncia que o endpoint existe
+        raise Http404
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
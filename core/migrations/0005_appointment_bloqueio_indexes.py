@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_barberprofile_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['barber', 'data_hora_inicio', 'data_hora_fim', 'status'], name='appt_barber_inicio_fim_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloqueio',
+            index=models.Index(fields=['barber', 'data_inicio', 'data_fim'], name='bloqueio_barber_datas_idx'),
+        ),
+    ]
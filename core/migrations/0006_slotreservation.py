@@ -0,0 +1,70 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:47
+
+import django.db.models.deletion
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _buckets(inicio, fim, size):
+    """
+    Cópia congelada de core.slots.reservation_buckets (a migração não pode
+    mudar junto com o código): buckets de 'size' segundos, alinhados à
+    época UTC, que [inicio, fim) toca.
+    """
+    start_ts = int(inicio.timestamp())
+    end_ts = int(fim.timestamp())
+    if size <= 0 or end_ts <= start_ts:
+        return []
+    first = start_ts - start_ts % size
+    return [datetime.fromtimestamp(ts, tz=dt_timezone.utc) for ts in range(first, end_ts, size)]
+
+
+def reservar_agendamentos_futuros(apps, schema_editor):
+    """
+    Cria as reservas dos agendamentos ativos a partir de hoje. Sobreposições
+    antigas (anteriores a esta trava) são ignoradas: o primeiro fica com o bucket.
+    """
+    Appointment = apps.get_model('core', 'Appointment')
+    SlotReservation = apps.get_model('core', 'SlotReservation')
+    bucket_size = int(timedelta(minutes=getattr(settings, 'SLOT_RESERVATION_BUCKET_MINUTES', 5)).total_seconds())
+
+    appointments = Appointment.objects.filter(
+        barber__isnull=False,
+        status__in=['pendente', 'confirmado'],
+        data_hora_fim__gt=timezone.now(),
+    ).order_by('id')
+    for appointment in appointments.iterator():
+        SlotReservation.objects.bulk_create(
+            [
+                SlotReservation(barber_id=appointment.barber_id, appointment_id=appointment.id, inicio=bucket)
+                for bucket in _buckets(appointment.data_hora_inicio, appointment.data_hora_fim, bucket_size)
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_appointment_bloqueio_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(verbose_name='Início do bucket')),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='core.appointment')),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='core.barberprofile')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Slot',
+                'verbose_name_plural': 'Reservas de Slots',
+                'constraints': [models.UniqueConstraint(fields=('barber', 'inicio'), name='unique_barber_slot_bucket')],
+            },
+        ),
+        migrations.RunPython(reservar_agendamentos_futuros, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_slotreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('ultimo_erro', models.TextField(blank=True, default='')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to='core.appointment')),
+            ],
+            options={
+                'verbose_name': 'Notificação (Outbox)',
+                'verbose_name_plural': 'Notificações (Outbox)',
+                'ordering': ['proxima_tentativa'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='outbox_status_proxima_idx')],
+            },
+        ),
+    ]
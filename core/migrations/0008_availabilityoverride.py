@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('hora_inicio', models.TimeField(verbose_name='Início')),
+                ('hora_fim', models.TimeField(verbose_name='Fim')),
+                ('tipo', models.CharField(choices=[('fechado', 'Fechado (pausa/atraso)'), ('aberto', 'Aberto (horário extra)')], default='fechado', max_length=10)),
+                ('motivo', models.CharField(blank=True, max_length=255, null=True)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excecoes', to='core.barberprofile')),
+            ],
+            options={
+                'verbose_name': 'Exceção de Horário',
+                'verbose_name_plural': 'Exceções de Horário',
+                'ordering': ['data', 'hora_inicio'],
+                'indexes': [models.Index(fields=['barber', 'data'], name='override_barber_data_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_availabilityoverride'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='barberprofile',
+            name='foto_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Versões da foto'),
+        ),
+    ]
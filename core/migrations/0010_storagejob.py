@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_barberprofile_foto_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('acao', models.CharField(choices=[('upload', 'Upload (staging -> storage)'), ('delete', 'Remoção')], max_length=10)),
+                ('nomes', models.JSONField(default=list, verbose_name='Arquivos')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluido', 'Concluído'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('ultimo_erro', models.TextField(blank=True, default='')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job de Storage',
+                'verbose_name_plural': 'Jobs de Storage',
+                'ordering': ['proxima_tentativa'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='storagejob_status_proxima_idx')],
+            },
+        ),
+    ]
@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.core.exceptions import ValidationError
 import re
+from datetime import datetime, time, timedelta
 from django.utils import timezone
 from .validators import validate_file_size
+from .slots import reservation_buckets
 from django.core.validators import FileExtensionValidator
 
 # --- Model 1: Usuário Customizado ---
@@ -28,24 +30,29 @@ class Service(models.Model):
         Transforma o 'timedelta' (ex: 00:30:00) 
         num formato amigável (ex: "30min" ou "1h 30min").
         """
-        # Converte a duração total para minutos
-        total_minutes = int(self.duracao.total_seconds() / 60)
+        return format_duracao(self.duracao)
+
+
+def format_duracao(duracao):
+    """Formato amigável de uma duração (usado também sem instanciar o Service)."""
+    # Converte a duração total para minutos
+    total_minutes = int(duracao.total_seconds() / 60)
+    
+    if total_minutes == 0:
+        return "0min"
         
-        if total_minutes == 0:
-            return "0min"
-            
-        # Calcula horas e minutos
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
+    # Calcula horas e minutos
+    hours = total_minutes // 60
+    minutes = total_minutes % 60
+    
+    parts = []
+    if hours > 0:
+        parts.append(f"{hours}h")
+    if minutes > 0:
+        parts.append(f"{minutes}min")
         
-        parts = []
-        if hours > 0:
-            parts.append(f"{hours}h")
-        if minutes > 0:
-            parts.append(f"{minutes}min")
-            
-        # Junta as partes (ex: "1h 30min")
-        return " ".join(parts)
+    # Junta as partes (ex: "1h 30min")
+    return " ".join(parts)
 
 # --- Model 3: Perfil do Barbeiro ---
 class BarberProfile(models.Model):
@@ -69,6 +76,10 @@ class BarberProfile(models.Model):
         ]
     )
     # --- FIM ---
+
+    # URLs das versões redimensionadas da foto (core/images.py):
+    # {'thumb'|'card'|'full': {'webp': url, 'jpeg': url}}
+    foto_renditions = models.JSONField('Versões da foto', default=dict, blank=True, editable=False)
     
     servicos_oferecidos = models.ManyToManyField(
         Service,
@@ -106,32 +117,6 @@ class BarberProfile(models.Model):
 
         # Se for um formato desconhecido, retorna o que foi limpo
         return clean_phone
-    
-    def save(self, *args, **kwargs):
-        old_instance = None
-        old_picture = None
-        
-        # 1. Antes de salvar, verifica se o objeto já existe
-        if self.pk:
-            try:
-                # Pega a instância antiga (antes da mudança) do banco
-                old_instance = BarberProfile.objects.get(pk=self.pk)
-                # Guarda o nome/caminho da foto antiga
-                old_picture = old_instance.profile_picture 
-            except BarberProfile.DoesNotExist:
-                pass # Objeto é novo, não há foto antiga para apagar
-        
-        # 2. SALVA A NOVA FOTO PRIMEIRO
-        # O Django executa o save() e o upload para o GCS aqui.
-        # Se isto falhar, a foto antiga ainda não foi apagada.
-        super(BarberProfile, self).save(*args, **kwargs)
-
-        # 3. SE O SAVE FUNCIONOU, limpa a foto antiga
-        # Verifica se tínhamos uma foto antiga E se a foto mudou
-        if old_instance and old_picture:
-            if old_picture != self.profile_picture:
-                # A foto mudou, então apaga a antiga do GCS
-                old_picture.delete(save=False)
 
 # --- NOVO MODEL (Model 4): O Serviço do Barbeiro (com Preço) ---
 # Este é o model "through". É aqui que o preço vive.
@@ -170,6 +155,60 @@ class Availability(models.Model):
         return f"{self.barber.nome_exibicao} - {self.get_dia_da_semana_display()}"
 
 
+# --- QuerySet do Agendamento ---
+class AppointmentQuerySet(models.QuerySet):
+    ACTIVE_STATUSES = ['pendente', 'confirmado']
+
+    def active(self):
+        """Agendamentos que ainda ocupam a agenda (pendentes ou confirmados)."""
+        return self.filter(status__in=self.ACTIVE_STATUSES)
+
+    def starting_between(self, start_date, end_date):
+        """
+        Agendamentos que COMEÇAM entre start_date e end_date (inclusive),
+        no fuso atual.
+
+        Evita o 'data_hora_inicio__date=', que no MySQL embrulha a coluna
+        numa função (com conversão de fuso) e impede o uso do índice.
+        Aqui o dia local vira um range "aware" [início, fim).
+        """
+        tz = timezone.get_current_timezone()
+        range_start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+        range_end = timezone.make_aware(
+            datetime.combine(end_date + timedelta(days=1), time.min), tz
+        )
+        return self.filter(data_hora_inicio__gte=range_start, data_hora_inicio__lt=range_end)
+
+    def for_barber_range(self, barber, start_date, end_date):
+        """Agendamentos do barbeiro que começam no range (ver starting_between)."""
+        return self.starting_between(start_date, end_date).filter(
+            barber_id=getattr(barber, 'pk', barber),
+        )
+
+    def for_barber_day(self, barber, day):
+        """Atalho de for_barber_range para um único dia."""
+        return self.for_barber_range(barber, day, day)
+
+    def upcoming_for(self, barber):
+        """
+        Próximos agendamentos ativos do barbeiro (a partir de hoje), na ordem
+        do painel: (data_hora_inicio, id). Usa o índice appt_barber_inicio_fim_idx.
+        """
+        tz = timezone.get_current_timezone()
+        start_of_today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min), tz)
+        return self.active().filter(
+            barber_id=getattr(barber, 'pk', barber),
+            data_hora_inicio__gte=start_of_today,
+        ).order_by('data_hora_inicio', 'id')
+
+    def after(self, data_hora_inicio, pk):
+        """Keyset: tudo que vem DEPOIS de (data_hora_inicio, pk) na ordem do painel."""
+        return self.filter(
+            models.Q(data_hora_inicio__gt=data_hora_inicio)
+            | models.Q(data_hora_inicio=data_hora_inicio, pk__gt=pk)
+        )
+
+
 # --- Model 6: Agendamento ---
 class Appointment(models.Model):
     STATUS_CHOICES = [
@@ -200,6 +239,8 @@ class Appointment(models.Model):
     data_hora_inicio = models.DateTimeField('Início do Agendamento')
     data_hora_fim = models.DateTimeField('Fim do Agendamento')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+
+    objects = AppointmentQuerySet.as_manager()
     
     def save(self, *args, **kwargs):
         # Pega o timezone padrão (definido como 'UTC' no settings.py)
@@ -215,6 +256,14 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['data_hora_inicio']
+        indexes = [
+            # Cobre as queries de colisão/slots: barbeiro (igualdade) + range
+            # em data_hora_inicio, com data_hora_fim e status já no índice.
+            models.Index(
+                fields=['barber', 'data_hora_inicio', 'data_hora_fim', 'status'],
+                name='appt_barber_inicio_fim_idx',
+            ),
+        ]
 
     def __str__(self):
         if self.barber_service:
@@ -234,6 +283,13 @@ class Bloqueio(models.Model):
 
     class Meta:
         ordering = ['data_inicio']
+        indexes = [
+            # Cobre "o barbeiro está de folga neste dia/range?"
+            models.Index(
+                fields=['barber', 'data_inicio', 'data_fim'],
+                name='bloqueio_barber_datas_idx',
+            ),
+        ]
         verbose_name = 'Bloqueio de Data'
         verbose_name_plural = 'Bloqueios de Datas'
 
@@ -246,3 +302,187 @@ class Bloqueio(models.Model):
         # Garante que a data final não seja anterior à inicial
         if self.data_fim < self.data_inicio:
             raise ValidationError('A data de fim não pode ser anterior à data de início.')
+
+
+# --- Model 8: Reserva de Slot (trava de agenda no banco) ---
+# Cada agendamento ativo ocupa "buckets" de SLOT_RESERVATION_BUCKET_MINUTES.
+# A UNIQUE (barbeiro, bucket) garante no banco que dois agendamentos do mesmo
+# barbeiro nunca se sobrepõem, sem select_for_update/gap locks: reservas de
+# horários diferentes nunca se bloqueiam.
+class SlotReservation(models.Model):
+    barber = models.ForeignKey(
+        BarberProfile,
+        on_delete=models.CASCADE,
+        related_name='slot_reservations'
+    )
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='slot_reservations'
+    )
+    inicio = models.DateTimeField('Início do bucket')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['barber', 'inicio'],
+                name='unique_barber_slot_bucket',
+            ),
+        ]
+        verbose_name = 'Reserva de Slot'
+        verbose_name_plural = 'Reservas de Slots'
+
+    def __str__(self):
+        return f"Barbeiro {self.barber_id} @ {self.inicio:%d/%m/%Y %H:%M} (agendamento {self.appointment_id})"
+
+    @staticmethod
+    def bucket_size():
+        return timedelta(minutes=getattr(settings, 'SLOT_RESERVATION_BUCKET_MINUTES', 5))
+
+    @classmethod
+    def sync_for(cls, appointment, created=False):
+        """
+        Recria as reservas do agendamento. Agendamentos cancelados/concluídos
+        (ou sem barbeiro) liberam os buckets. Levanta IntegrityError se algum
+        bucket já pertence a outro agendamento. Com created=True (agendamento
+        acabou de ser inserido) não há reservas antigas para apagar.
+        """
+        if created:
+            # Um único INSERT: não precisa de transação própria
+            cls._reserve(appointment)
+            return
+        # DELETE + INSERT juntos: fora de uma transação (autocommit) os buckets
+        # liberados pelo DELETE ficariam livres para outro agendamento, e um
+        # IntegrityError no INSERT deixaria o agendamento sem reservas
+        with transaction.atomic():
+            cls.objects.filter(appointment=appointment).delete()
+            cls._reserve(appointment)
+
+    @classmethod
+    def prune(cls, before):
+        """Apaga as reservas de buckets anteriores a 'before'. Devolve quantas."""
+        deleted, _ = cls.objects.filter(inicio__lt=before).delete()
+        return deleted
+
+    @classmethod
+    def _reserve(cls, appointment):
+        if appointment.barber_id is None or appointment.status not in AppointmentQuerySet.ACTIVE_STATUSES:
+            return
+        cls.objects.bulk_create([
+            cls(barber_id=appointment.barber_id, appointment=appointment, inicio=bucket)
+            for bucket in reservation_buckets(
+                appointment.data_hora_inicio, appointment.data_hora_fim, cls.bucket_size()
+            )
+        ])
+
+
+# --- Model 9: Outbox de Notificações ---
+# Gravado na MESMA transação do agendamento e enviado depois do commit
+# (core/notifications.py). Se a transação for desfeita, a linha some junto;
+# se o envio falhar, o worker 'process_notifications' tenta de novo.
+class NotificationOutbox(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'), ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'), ('falhou', 'Falhou'),
+    ]
+
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='notificacoes'
+    )
+    tipo = models.CharField(max_length=20)  # Ex: 'NOVO', 'CANCELAMENTO'
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField('Próxima tentativa', default=timezone.now)
+    ultimo_erro = models.TextField(blank=True, default='')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['proxima_tentativa']
+        indexes = [
+            # O worker busca "o que está vencido" por status + horário
+            models.Index(fields=['status', 'proxima_tentativa'], name='outbox_status_proxima_idx'),
+        ]
+        verbose_name = 'Notificação (Outbox)'
+        verbose_name_plural = 'Notificações (Outbox)'
+
+    def __str__(self):
+        return f"{self.tipo} - Agendamento {self.appointment_id} ({self.get_status_display()})"
+
+
+# --- Model 10: Exceção de Horário (um dia específico) ---
+# Ajusta o modelo semanal (Availability) em UMA data: uma pausa longa, um
+# atraso na abertura ('fechado') ou um horário extra ('aberto'). Folgas de
+# dia inteiro continuam sendo Bloqueio. A agenda compilada (máscara de bits
+# por dia) fica em core/barber_calendar.py.
+class AvailabilityOverride(models.Model):
+    TIPO_CHOICES = [
+        ('fechado', 'Fechado (pausa/atraso)'),
+        ('aberto', 'Aberto (horário extra)'),
+    ]
+
+    barber = models.ForeignKey(
+        BarberProfile,
+        on_delete=models.CASCADE,
+        related_name='excecoes'
+    )
+    data = models.DateField('Data')
+    hora_inicio = models.TimeField('Início')
+    hora_fim = models.TimeField('Fim')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='fechado')
+    motivo = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        ordering = ['data', 'hora_inicio']
+        indexes = [
+            models.Index(fields=['barber', 'data'], name='override_barber_data_idx'),
+        ]
+        verbose_name = 'Exceção de Horário'
+        verbose_name_plural = 'Exceções de Horário'
+
+    def __str__(self):
+        return (
+            f"{self.barber.nome_exibicao} {self.get_tipo_display().lower()} em "
+            f"{self.data.strftime('%d/%m/%Y')} ({self.hora_inicio:%H:%M}-{self.hora_fim:%H:%M})"
+        )
+
+    def clean(self):
+        if self.hora_fim <= self.hora_inicio:
+            raise ValidationError('A hora de fim deve ser depois da hora de início.')
+
+
+# --- Model 11: Job de Storage (upload/remoção de arquivos) ---
+# Escritas e remoções no storage (GCS) não acontecem na thread do request:
+# viram uma linha aqui e são executadas depois do commit por uma thread ou
+# pelo worker 'manage.py process_storage_jobs' (core/storage_jobs.py).
+class StorageJob(models.Model):
+    ACAO_CHOICES = [
+        ('upload', 'Upload (staging -> storage)'),
+        ('delete', 'Remoção'),
+    ]
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'), ('executando', 'Executando'),
+        ('concluido', 'Concluído'), ('falhou', 'Falhou'),
+    ]
+
+    acao = models.CharField(max_length=10, choices=ACAO_CHOICES)
+    nomes = models.JSONField('Arquivos', default=list)  # Caminhos no storage
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField('Próxima tentativa', default=timezone.now)
+    ultimo_erro = models.TextField(blank=True, default='')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['proxima_tentativa']
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa'], name='storagejob_status_proxima_idx'),
+        ]
+        verbose_name = 'Job de Storage'
+        verbose_name_plural = 'Jobs de Storage'
+
+    def __str__(self):
+        return f"{self.get_acao_display()} - {len(self.nomes)} arquivo(s) ({self.get_status_display()})"
@@ -0,0 +1,176 @@
+# core/notification_transport.py
+"""
+Transporte das mensagens de WhatsApp, com backends plugáveis
+(settings.WHATSAPP_BACKEND, caminho pontilhado):
+
+- TwilioBackend: API real. Uma requests.Session compartilhada por processo
+  (pool de conexões keep-alive + timeout), então um lote de mensagens
+  reaproveita a mesma conexão TLS em vez de abrir uma por envio.
+- ConsoleBackend: só registra um log seguro (sem PII). Padrão em dev.
+- LocMemBackend: guarda as mensagens em 'outbox' (memória). Para testes.
+
+Todo envio passa por send_messages(), que atualiza os contadores de
+latência/erros (get_stats()).
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 'ref' identifica a mensagem nos logs sem PII (ex: ID do agendamento)
+WhatsAppMessage = namedtuple('WhatsAppMessage', ['to', 'body', 'ref'])
+# Resultado de um envio: ok=True/False, erro=None ou o nome do erro
+SendResult = namedtuple('SendResult', ['ok', 'erro'])
+
+
+# ---
+# Contadores (por processo)
+# ---
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+        _stats.update({
+            'enviados': 0,
+            'erros': 0,
+            'lotes': 0,
+            'latencia_total_s': 0.0,
+            'latencia_max_s': 0.0,
+        })
+
+
+def _record(ok, elapsed):
+    with _stats_lock:
+        _stats['enviados' if ok else 'erros'] += 1
+        _stats['latencia_total_s'] += elapsed
+        _stats['latencia_max_s'] = max(_stats['latencia_max_s'], elapsed)
+
+
+def get_stats():
+    """Snapshot dos contadores (inclui a latência média por envio)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['enviados'] + stats['erros']
+    stats['latencia_media_s'] = stats['latencia_total_s'] / total if total else 0.0
+    return stats
+
+
+reset_stats()
+
+
+# ---
+# Backends
+# ---
+class BaseBackend:
+
+    def send_one(self, message):
+        """Envia uma mensagem. Levanta exceção se falhar."""
+        raise NotImplementedError
+
+    def send_messages(self, messages):
+        """
+        Envia um lote. Uma falha não interrompe o lote: devolve um
+        SendResult por mensagem, na mesma ordem.
+        """
+        results = []
+        for message in messages:
+            started = time.perf_counter()
+            try:
+                self.send_one(message)
+            except Exception as e:
+                _record(False, time.perf_counter() - started)
+                results.append(SendResult(False, type(e).__name__))
+            else:
+                _record(True, time.perf_counter() - started)
+                results.append(SendResult(True, None))
+        with _stats_lock:
+            _stats['lotes'] += 1
+        return results
+
+
+class ConsoleBackend(BaseBackend):
+
+    def send_one(self, message):
+        logger.info('WhatsApp simulado (API não configurada)', extra={'ref': message.ref})
+
+
+class LocMemBackend(BaseBackend):
+    """Guarda as mensagens em LocMemBackend.outbox (como o mail.outbox)."""
+    outbox = []
+    # Cada item True faz o próximo envio falhar (simula a API fora do ar)
+    falhas = []
+
+    def send_one(self, message):
+        if self.falhas and self.falhas.pop(0):
+            raise requests.exceptions.ConnectionError('Falha simulada')
+        self.outbox.append(message)
+
+
+class TwilioBackend(BaseBackend):
+
+    def __init__(self):
+        self.api_url = settings.WHATSAPP_API_URL
+        self.timeout = settings.WHATSAPP_API_TIMEOUT
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.WHATSAPP_POOL_MAXSIZE,
+            max_retries=0,  # Quem faz retry (com backoff) é o outbox
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
+            self.session.auth = (settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+
+    def send_one(self, message):
+        response = self.session.post(
+            self.api_url,
+            data={
+                'From': settings.TWILIO_WHATSAPP_FROM,
+                'To': f'whatsapp:+{message.to}',
+                'Body': message.body,
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend configurado (uma instância por processo, com a sua Session)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'WHATSAPP_BACKEND', '')
+                if not path:
+                    path = (
+                        'core.notification_transport.TwilioBackend'
+                        if settings.WHATSAPP_API_URL
+                        else 'core.notification_transport.ConsoleBackend'
+                    )
+                _backend = import_string(path)()
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    # override_settings nos testes: recria o backend com a nova config
+    global _backend
+    if setting.startswith(('WHATSAPP_', 'TWILIO_')):
+        _backend = None
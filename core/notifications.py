@@ -0,0 +1,175 @@
+# core/notifications.py
+"""
+Outbox de notificações (WhatsApp).
+
+1. enqueue() grava uma linha em NotificationOutbox dentro da transação do
+   agendamento e registra um transaction.on_commit.
+2. Depois do commit, dispatch() tenta o envio FORA da thread do request
+   (ThreadPoolExecutor) — ou não faz nada, se NOTIFICATION_DISPATCH='worker'.
+3. O worker 'manage.py process_notifications' drena o que ficou pendente,
+   com retentativas e backoff exponencial.
+
+Cada envio é "reservado" com um UPDATE condicional (claim), então a thread
+pós-commit e o worker nunca enviam a mesma notificação ao mesmo tempo.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .db_connections import connection_cycle
+from .models import NotificationOutbox
+from .notification_transport import get_backend
+from .utils import mensagem_whatsapp_barbeiro
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='notificacoes')
+    return _executor
+
+
+def enqueue(appointment, tipo):
+    """Grava a notificação no outbox (mesma transação) e agenda o envio."""
+    entry = NotificationOutbox.objects.create(appointment=appointment, tipo=tipo)
+    transaction.on_commit(lambda: dispatch(entry.pk))
+    return entry
+
+
+def dispatch(entry_id):
+    """Chamado no on_commit: nunca bloqueia o request numa API externa."""
+    mode = getattr(settings, 'NOTIFICATION_DISPATCH', 'thread')
+    if mode == 'thread':
+        _get_executor().submit(_deliver_in_thread, entry_id)
+    elif mode == 'sync':
+        deliver(entry_id)
+    # 'worker': fica para o 'manage.py process_notifications'
+
+
+def _deliver_in_thread(entry_id):
+    # Cada thread tem a sua conexão: reaproveitada entre envios enquanto
+    # estiver saudável e dentro do CONN_MAX_AGE (core/db_connections.py)
+    with connection_cycle():
+        try:
+            deliver(entry_id)
+        except Exception as e:
+            # Se nem o claim/retry funcionou, o worker pega a linha depois.
+            # Só o tipo do erro: a mensagem da exceção pode conter o telefone.
+            logger.error(
+                'Erro inesperado no envio da notificação',
+                extra={'entry_id': entry_id, 'erro': type(e).__name__},
+            )
+
+
+def backoff_delay(tentativas):
+    """30s, 60s, 120s, ... (limitado a NOTIFICATION_BACKOFF_MAX_SECONDS)."""
+    base = settings.NOTIFICATION_BACKOFF_SECONDS
+    return timedelta(seconds=min(base * 2 ** max(tentativas - 1, 0), settings.NOTIFICATION_BACKOFF_MAX_SECONDS))
+
+
+def _claim(entry_id, now):
+    """Reserva o envio para este processo. Devolve False se outro já pegou."""
+    return NotificationOutbox.objects.filter(
+        pk=entry_id,
+        status__in=['pendente', 'enviando'],
+        proxima_tentativa__lte=now,
+    ).update(
+        status='enviando',
+        proxima_tentativa=now + timedelta(seconds=settings.NOTIFICATION_CLAIM_SECONDS),
+    ) == 1
+
+
+def deliver(entry_id):
+    """Tenta enviar UMA notificação do outbox. Devolve True se foi enviada."""
+    return deliver_many([entry_id]) == 1
+
+
+def deliver_many(entry_ids):
+    """
+    Envia um lote de notificações do outbox num único flush do transporte
+    (mesma conexão keep-alive). Devolve quantas foram enviadas.
+    """
+    now = timezone.now()
+    claimed = [entry_id for entry_id in entry_ids if _claim(entry_id, now)]
+    if not claimed:
+        return 0
+
+    entries = list(NotificationOutbox.objects.select_related(
+        'appointment__barber', 'appointment__barber_service__service'
+    ).filter(pk__in=claimed))
+
+    # Monta as mensagens; um erro aqui (ex: serviço apagado) é uma falha da linha
+    batch, failures, skipped = [], {}, []
+    for entry in entries:
+        try:
+            message = mensagem_whatsapp_barbeiro(entry.appointment, entry.tipo)
+        except Exception as e:
+            failures[entry.pk] = type(e).__name__
+            continue
+        if message is None:
+            skipped.append(entry.pk)  # Tipo desconhecido: nada a enviar
+        else:
+            batch.append((entry, message))
+
+    sent = list(skipped)
+    results = get_backend().send_messages([message for _, message in batch]) if batch else []
+    for (entry, message), result in zip(batch, results):
+        if result.ok:
+            sent.append(entry.pk)
+        else:
+            failures[entry.pk] = f"Falha ao enviar WhatsApp ({message.ref}): {result.erro}"
+
+    metrics.notification('enviado', len(sent) - len(skipped))
+    metrics.notification('ignorado', len(skipped))
+    metrics.notification('erro', len(failures))
+
+    if sent:
+        NotificationOutbox.objects.filter(pk__in=sent).update(
+            status='enviado',
+            tentativas=F('tentativas') + 1,
+            enviado_em=timezone.now(),
+            ultimo_erro='',
+        )
+
+    for entry in entries:
+        if entry.pk not in failures:
+            continue
+        tentativas = entry.tentativas + 1
+        if tentativas >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            status, proxima = 'falhou', now
+        else:
+            status, proxima = 'pendente', now + backoff_delay(tentativas)
+        NotificationOutbox.objects.filter(pk=entry.pk).update(
+            status=status,
+            tentativas=tentativas,
+            proxima_tentativa=proxima,
+            ultimo_erro=failures[entry.pk][:500],
+        )
+
+    return len(sent)
+
+
+def due_entries(now=None):
+    """Notificações vencidas (pendentes ou com claim expirado)."""
+    return NotificationOutbox.objects.filter(
+        status__in=['pendente', 'enviando'],
+        proxima_tentativa__lte=now or timezone.now(),
+    )
+
+
+def drain(batch_size=None):
+    """Envia um lote de notificações vencidas. Devolve (enviadas, não enviadas)."""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    ids = list(due_entries().order_by('proxima_tentativa').values_list('pk', flat=True)[:batch_size])
+    enviadas = deliver_many(ids) if ids else 0
+    return enviadas, len(ids) - enviadas
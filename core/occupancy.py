@@ -0,0 +1,109 @@
+# core/occupancy.py
+"""
+Ocupação de um dia de um barbeiro como máscara de bits.
+
+O dia (da meia-noite local até a próxima) é dividido em buckets de
+'granularity' minutos; cada bucket é um bit de um int do Python:
+
+- open_mask: buckets dentro do horário de trabalho;
+- busy_mask: buckets tocados por algum agendamento.
+
+"Um serviço de duração D cabe em T?" vira (máscara de [T, T+D)) AND NOT
+livre == 0: uma operação em inteiros, sem comparar datetimes um a um.
+
+O resultado é idêntico ao de slots.compute_available_slots quando os
+horários caem na grade. Fora dela o arredondamento é conservador (o
+horário aberto encolhe, o ocupado cresce): pode esconder um slot, nunca
+oferecer um horário ocupado.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+class DayOccupancy:
+
+    def __init__(self, day, granularity=5, tz=None):
+        self.day = day
+        self.tz = tz or timezone.get_current_timezone()
+        self.granularity = timedelta(minutes=granularity)
+        self.day_start = timezone.make_aware(datetime.combine(day, time.min), self.tz)
+        day_end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), self.tz)
+        # Dias de horário de verão têm 23h ou 25h
+        self.size = -(-(day_end - self.day_start) // self.granularity)
+        self.open_mask = 0
+        self.busy_mask = 0
+        # Blocos abertos (inícios dos slots seguem a grade de cada bloco)
+        self.blocks = []
+
+    @classmethod
+    def build(cls, day, availability_blocks, busy_intervals, granularity=5, tz=None):
+        """
+        - availability_blocks: pares (hora_inicio, hora_fim) do tipo time.
+        - busy_intervals: pares (inicio, fim) "aware" (agendamentos do dia).
+        """
+        occupancy = cls(day, granularity=granularity, tz=tz)
+        for hora_inicio, hora_fim in availability_blocks:
+            occupancy.add_open(hora_inicio, hora_fim)
+        for inicio, fim in busy_intervals:
+            occupancy.add_busy(inicio, fim)
+        return occupancy
+
+    # ---
+    # Máscaras
+    # ---
+    def _index(self, moment, round_up):
+        offset = moment - self.day_start
+        index = -(-offset // self.granularity) if round_up else offset // self.granularity
+        return min(max(index, 0), self.size)
+
+    def range_mask(self, start, end, outward=True):
+        """Bits de [start, end). outward=True inclui buckets parcialmente tocados."""
+        first = self._index(start, round_up=not outward)
+        last = self._index(end, round_up=outward)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def add_open(self, hora_inicio, hora_fim):
+        start = timezone.make_aware(datetime.combine(self.day, hora_inicio), self.tz)
+        end = timezone.make_aware(datetime.combine(self.day, hora_fim), self.tz)
+        self.blocks.append((start, end))
+        self.open_mask |= self.range_mask(start, end, outward=False)
+
+    def add_busy(self, inicio, fim):
+        self.busy_mask |= self.range_mask(inicio, fim, outward=True)
+
+    @property
+    def free_mask(self):
+        return self.open_mask & ~self.busy_mask
+
+    # ---
+    # Consultas
+    # ---
+    def fits(self, start, duration):
+        """[start, start + duration) está todo livre (aberto e sem agendamento)?"""
+        if duration <= timedelta(0) or start < self.day_start:
+            return False
+        needed = self.range_mask(start, start + duration, outward=True)
+        end_index = -(-(start + duration - self.day_start) // self.granularity)
+        if not needed or end_index > self.size:
+            return False
+        return needed & ~self.free_mask == 0
+
+    def free_slots(self, duration, now=None):
+        """
+        Inícios (datetimes "aware") dos slots livres, bloco a bloco com passo
+        = duration, como em compute_available_slots.
+        """
+        if duration <= timedelta(0):
+            return []
+        now = now or timezone.now()
+        slots = []
+        for block_start, block_end in self.blocks:
+            slot_start = block_start
+            while slot_start + duration <= block_end:
+                if slot_start >= now and self.fits(slot_start, duration):
+                    slots.append(slot_start)
+                slot_start += duration
+        return slots
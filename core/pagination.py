@@ -0,0 +1,73 @@
+# core/pagination.py
+"""
+Paginação por "keyset" dos próximos agendamentos do painel.
+
+Em vez de OFFSET (que lê e descarta todas as linhas anteriores), cada
+página começa depois do último (data_hora_inicio, id) da página anterior,
+seguindo o índice. O custo de uma página não depende de quantos
+agendamentos o barbeiro tem. O cursor é opaco para o cliente:
+"<microssegundos desde a época>_<id>".
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+from .models import Appointment, format_duracao
+
+# Só o que o painel mostra (sem instanciar models)
+PAINEL_FIELDS = (
+    'id', 'cliente_nome', 'cliente_telefone', 'data_hora_inicio', 'data_hora_fim', 'status',
+    'barber_service__service__nome', 'barber_service__service__duracao',
+)
+
+_STATUS_DISPLAY = dict(Appointment.STATUS_CHOICES)
+
+
+def encode_cursor(data_hora_inicio, pk):
+    delta = data_hora_inicio - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f'{micros}_{pk}'
+
+
+def decode_cursor(value):
+    """(data_hora_inicio, pk) do cursor. Levanta ValueError se for inválido."""
+    micros, sep, pk = value.partition('_')
+    if not sep:
+        raise ValueError('Cursor inválido')
+    seconds, micros = divmod(int(micros), 1_000_000)
+    moment = datetime.fromtimestamp(seconds, tz=dt_timezone.utc).replace(microsecond=micros)
+    return moment, int(pk)
+
+
+def _painel_row(row):
+    return {
+        'id': row['id'],
+        'cliente_nome': row['cliente_nome'],
+        'cliente_telefone': row['cliente_telefone'],
+        'data_hora_inicio': row['data_hora_inicio'],
+        'data_hora_fim': row['data_hora_fim'],
+        'status': row['status'],
+        'status_display': _STATUS_DISPLAY.get(row['status'], row['status']),
+        'servico_nome': row['barber_service__service__nome'],
+        'servico_duracao': (
+            format_duracao(row['barber_service__service__duracao'])
+            if row['barber_service__service__duracao'] is not None else ''
+        ),
+    }
+
+
+def upcoming_appointments_page(barber, cursor=None, size=None):
+    """
+    Uma página dos próximos agendamentos do barbeiro (uma query).
+    Devolve (linhas, próximo cursor ou None se for a última página).
+    """
+    size = size or settings.PAINEL_PAGE_SIZE
+    queryset = Appointment.objects.upcoming_for(barber)
+    if cursor:
+        queryset = queryset.after(*decode_cursor(cursor))
+    # Um a mais só para saber se existe próxima página
+    rows = [_painel_row(row) for row in queryset.values(*PAINEL_FIELDS)[:size + 1]]
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(rows[-1]['data_hora_inicio'], rows[-1]['id'])
@@ -1,8 +1,10 @@
 # core/serializers.py
 from rest_framework import serializers
-from .models import Appointment, BarberService, Bloqueio
+from .models import Appointment, Availability, AvailabilityOverride, BarberService, Bloqueio
 from django.utils import timezone # Importe o timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from . import availability_cache, metrics
+from .slots import is_interval_free, merge_intervals
 
 class AppointmentSerializer(serializers.ModelSerializer):
     """
@@ -39,7 +41,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         
         # 1. Encontra o 'BarberService' (como já estava)
         try:
-            barber_service = BarberService.objects.get(
+            barber_service = BarberService.objects.select_related('barber', 'service').get(
                 service__id=data['service_id'],
                 barber__id=data['barber_id']
             )
@@ -70,17 +72,13 @@ class AppointmentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("O profissional não está disponível nesta data (folga/férias).")
         # --- FIM DA CORREÇÃO ---
 
-        # 5. O slot está ocupado? (A checagem de colisão, como já estava)
-        existing_appointments = Appointment.objects.filter(
-            barber__id=data['barber_id'],
-            data_hora_inicio__date=start_time.date(),
-            status__in=['pendente', 'confirmado']
-        ).filter(
-            data_hora_inicio__lt=end_time,
-            data_hora_fim__gt=start_time
-        )
-        
-        if existing_appointments.exists():
+        # 5. O slot está ocupado? (mesmo motor de intervalos de GetAvailableSlotsView)
+        existing_appointments = Appointment.objects.for_barber_day(
+            data['barber_id'], start_time.date()
+        ).active().values_list('data_hora_inicio', 'data_hora_fim')
+
+        if not is_interval_free(start_time, end_time, merge_intervals(existing_appointments)):
+            metrics.booking('colisao_validacao')
             raise serializers.ValidationError("Este horário acabou de ser reservado. Por favor, escolha outro.")
 
         # Adiciona os dados que faltam (como já estava)
@@ -88,7 +86,6 @@ class AppointmentSerializer(serializers.ModelSerializer):
         data['barber_service'] = barber_service
         data['data_hora_fim'] = end_time
         data['status'] = 'pendente'
-        data['_slot_range'] = (start_time, end_time)
 
         return data
 
@@ -96,20 +93,175 @@ class AppointmentSerializer(serializers.ModelSerializer):
         # Remove os IDs que não fazem parte do modelo Appointment
         validated_data.pop('service_id', None) # <-- MUDANÇA AQUI
         validated_data.pop('barber_id', None)
-        slot_range = validated_data.pop('_slot_range', None)
 
+        # A garantia final contra double-booking é a UNIQUE de SlotReservation
+        # (gravada pelo sinal post_save na mesma transação). Sem
+        # select_for_update: reservas de horários diferentes não se bloqueiam.
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            metrics.booking('colisao_reserva')
+            raise serializers.ValidationError(
+                "Este horário acabou de ser reservado. Por favor, escolha outro."
+            )
+
+
+# ---
+# Edição da agenda em lote (ScheduleView)
+# ---
+class AvailabilityBlockSerializer(serializers.ModelSerializer):
+    # 'id' presente = atualiza o bloco existente; ausente = cria um novo
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Availability
+        fields = ['id', 'dia_da_semana', 'hora_inicio', 'hora_fim']
+
+    def validate(self, data):
+        if data['hora_fim'] <= data['hora_inicio']:
+            raise serializers.ValidationError("A hora de fim deve ser depois da hora de início.")
+        return data
+
+
+class BloqueioRangeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Bloqueio
+        fields = ['id', 'data_inicio', 'data_fim', 'motivo']
+
+    def validate(self, data):
+        if data['data_fim'] < data['data_inicio']:
+            raise serializers.ValidationError("A data de fim não pode ser anterior à data de início.")
+        if data['data_fim'] < timezone.now().date():
+            raise serializers.ValidationError("A folga não pode estar toda no passado.")
+        # Folgas novas não começam no passado (as existentes podem estar em andamento)
+        if 'id' not in data and data['data_inicio'] < timezone.now().date():
+            raise serializers.ValidationError("A data de início não pode ser no passado.")
+        return data
+
+
+class AvailabilityOverrideSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = AvailabilityOverride
+        fields = ['id', 'data', 'hora_inicio', 'hora_fim', 'tipo', 'motivo']
+
+    def validate(self, data):
+        if data['hora_fim'] <= data['hora_inicio']:
+            raise serializers.ValidationError("A hora de fim deve ser depois da hora de início.")
+        if 'id' not in data and data['data'] < timezone.now().date():
+            raise serializers.ValidationError("A data não pode ser no passado.")
+        return data
+
+
+def _overlap_errors(items, key, start_field, end_field, inclusive, message):
+    """
+    Acha sobreposições entre os itens (agrupados por 'key') numa varredura
+    ordenada. Devolve {índice_no_payload: [mensagem]}.
+    """
+    errors = {}
+    groups = {}
+    for index, item in enumerate(items):
+        groups.setdefault(key(item), []).append((item[start_field], item[end_field], index))
+    for intervals in groups.values():
+        intervals.sort()
+        last_end, last_index = None, None
+        for start, end, index in intervals:
+            if last_end is not None and (start <= last_end if inclusive else start < last_end):
+                errors[index] = [message.format(outro=last_index)]
+            if last_end is None or end > last_end:
+                last_end, last_index = end, index
+    return errors
+
+
+class ScheduleSerializer(serializers.Serializer):
+    """
+    Agenda completa de um barbeiro: o modelo semanal (TODOS os blocos de
+    Availability) e, opcionalmente, as folgas e as exceções de horário
+    (AvailabilityOverride) atuais/futuras. O que não vier
+    na lista é apagado; itens com 'id' são atualizados, sem 'id' criados.
+    Tudo numa transação, com bulk_create/bulk_update.
+    """
+    availability = AvailabilityBlockSerializer(many=True)
+    bloqueios = BloqueioRangeSerializer(many=True, required=False)
+    excecoes = AvailabilityOverrideSerializer(many=True, required=False)
+
+    def validate_availability(self, blocks):
+        errors = _overlap_errors(
+            blocks, key=lambda b: b['dia_da_semana'], start_field='hora_inicio', end_field='hora_fim',
+            inclusive=False, message="Este horário se sobrepõe ao bloco {outro} do mesmo dia.",
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return blocks
+
+    def validate_excecoes(self, excecoes):
+        # 'aberto' e 'fechado' podem se cruzar (o fechado vence); iguais, não
+        errors = _overlap_errors(
+            excecoes, key=lambda e: (e['data'], e['tipo']), start_field='hora_inicio', end_field='hora_fim',
+            inclusive=False, message="Esta exceção se sobrepõe à exceção {outro} do mesmo dia.",
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return excecoes
+
+    def validate_bloqueios(self, bloqueios):
+        errors = _overlap_errors(
+            bloqueios, key=lambda b: None, start_field='data_inicio', end_field='data_fim',
+            inclusive=True, message="Esta folga se sobrepõe à folga {outro}.",
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return bloqueios
+
+    def save(self, barber):
+        """Aplica a agenda validada ao barbeiro (uma transação)."""
+        data = self.validated_data
         with transaction.atomic():
-            if slot_range:
-                start_time, end_time = slot_range
-                overlap_exists = Appointment.objects.select_for_update().filter(
-                    barber=validated_data.get('barber'),
-                    status__in=['pendente', 'confirmado'],
-                    data_hora_inicio__lt=end_time,
-                    data_hora_fim__gt=start_time,
-                ).exists()
-                if overlap_exists:
-                    raise serializers.ValidationError(
-                        "Este horário acabou de ser reservado. Por favor, escolha outro."
-                    )
-
-            return super().create(validated_data)
+            self._sync(
+                Availability, Availability.objects.filter(barber=barber), data['availability'],
+                barber, ['dia_da_semana', 'hora_inicio', 'hora_fim'], 'availability',
+            )
+            if 'bloqueios' in data:
+                self._sync(
+                    Bloqueio, Bloqueio.objects.filter(barber=barber, data_fim__gte=timezone.now().date()),
+                    data['bloqueios'], barber, ['data_inicio', 'data_fim', 'motivo'], 'bloqueios',
+                )
+            if 'excecoes' in data:
+                self._sync(
+                    AvailabilityOverride,
+                    AvailabilityOverride.objects.filter(barber=barber, data__gte=timezone.now().date()),
+                    data['excecoes'], barber, ['data', 'hora_inicio', 'hora_fim', 'tipo', 'motivo'], 'excecoes',
+                )
+            # bulk_create/bulk_update não disparam sinais: invalida o cache uma vez
+            availability_cache.invalidate_barber(barber.pk)
+        return barber
+
+    def _sync(self, model, queryset, items, barber, fields, field_name):
+        existing = {obj.pk: obj for obj in queryset}
+        unknown = [item['id'] for item in items if 'id' in item and item['id'] not in existing]
+        if unknown:
+            raise serializers.ValidationError({field_name: f"IDs inválidos para este barbeiro: {unknown}"})
+
+        to_create, to_update, keep = [], [], set()
+        for item in items:
+            if 'id' not in item:
+                to_create.append(model(barber=barber, **{f: item.get(f) for f in fields}))
+                continue
+            obj = existing[item['id']]
+            keep.add(obj.pk)
+            if any(getattr(obj, f) != item.get(f) for f in fields):
+                for f in fields:
+                    setattr(obj, f, item.get(f))
+                to_update.append(obj)
+
+        stale = [pk for pk in existing if pk not in keep]
+        if stale:
+            model.objects.filter(pk__in=stale).delete()
+        if to_update:
+            model.objects.bulk_update(to_update, fields)
+        if to_create:
+            model.objects.bulk_create(to_create)
@@ -1,7 +1,47 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_init
 from django.dispatch import receiver
-from .models import Appointment
-from .utils import enviar_notificacao_whatsapp_barbeiro # Função que criaremos
+from django.utils import timezone
+from .models import (
+    Appointment, AppointmentQuerySet, Availability, AvailabilityOverride, BarberProfile, BarberService, Bloqueio, Service,
+    SlotReservation,
+)
+from . import availability_cache, catalog, notifications, storage_jobs
+from .images import photo_files
+
+def _reservation_state(appointment):
+    # Só o que muda as reservas: barbeiro, horário e ativo/inativo (pendente ->
+    # confirmado não mexe nos buckets). Lê do __dict__: um campo adiado
+    # (.only()/.defer()) faria um refresh_from_db() dentro do post_init, que
+    # cria outra instância e dispara o post_init de novo (recursão).
+    values = appointment.__dict__
+    return (
+        values.get('barber_id'),
+        values.get('data_hora_inicio'),
+        values.get('data_hora_fim'),
+        values.get('status') in AppointmentQuerySet.ACTIVE_STATUSES,
+    )
+
+
+@receiver(post_init, sender=Appointment)
+def guardar_estado_da_reserva(sender, instance, **kwargs):
+    # Estado carregado do banco: evita recriar as reservas em saves que não
+    # mexem no horário/barbeiro/ativo (ex: confirmar, editar o nome do cliente).
+    instance._reservation_state = _reservation_state(instance)
+
+
+# Registrado ANTES da notificação: se o horário já foi tomado, o
+# IntegrityError desfaz a transação antes de qualquer efeito colateral.
+@receiver(post_save, sender=Appointment)
+def sincronizar_reservas_de_slot(sender, instance, created, **kwargs):
+    """
+    Mantém a tabela SlotReservation em dia com o agendamento
+    (criação, remarcação, cancelamento, reativação).
+    """
+    state = _reservation_state(instance)
+    if created or state != getattr(instance, '_reservation_state', None):
+        SlotReservation.sync_for(instance, created=created)
+        instance._reservation_state = state
+
 
 # O 'receiver' é o que escuta o sinal
 @receiver(post_save, sender=Appointment)
@@ -10,9 +50,119 @@ def notificar_barbeiro_novo_agendamento(sender, instance, created, **kwargs):
     Acionado após um objeto Appointment ser salvo no banco de dados.
     """
     if created and instance.barber:
-        # Só envia a notificação se for a CRIAÇÃO de um novo agendamento
-        enviar_notificacao_whatsapp_barbeiro(instance, tipo='NOVO')
-    
+        # Só envia a notificação se for a CRIAÇÃO de um novo agendamento.
+        # Vai para o outbox (mesma transação) e é enviada depois do commit,
+        # fora da thread do request (core/notifications.py).
+        notifications.enqueue(instance, tipo='NOVO')
+
     # Se fosse necessário, poderíamos adicionar um 'elif' para updates de status
     # elif instance.status == 'cancelado':
-    #     enviar_notificacao_whatsapp_barbeiro(instance, tipo='CANCELAMENTO')
\ No newline at end of file
+    #     notifications.enqueue(instance, tipo='CANCELAMENTO')
+
+
+# ---
+# Invalidação do cache de slots (core/availability_cache.py)
+# ---
+def _appointment_cache_day(barber_id, data_hora_inicio):
+    if not barber_id or not data_hora_inicio:
+        return None
+    if timezone.is_naive(data_hora_inicio):
+        return (barber_id, data_hora_inicio.date())
+    return (barber_id, timezone.localtime(data_hora_inicio).date())
+
+
+@receiver(post_init, sender=Appointment)
+def guardar_dia_original_do_agendamento(sender, instance, **kwargs):
+    """
+    Guarda em memória o (barbeiro, dia) carregado do banco. Se o agendamento
+    for remarcado para outro dia, o dia antigo também precisa ser invalidado
+    (sem fazer um SELECT extra no save). Lê do __dict__: campos adiados
+    (.only()/.defer()) não podem disparar um refresh_from_db() aqui.
+    """
+    instance._slots_cache_origin = _appointment_cache_day(
+        instance.__dict__.get('barber_id'), instance.__dict__.get('data_hora_inicio')
+    )
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidar_cache_do_dia_do_agendamento(sender, instance, **kwargs):
+    days = {
+        getattr(instance, '_slots_cache_origin', None),
+        _appointment_cache_day(instance.barber_id, instance.data_hora_inicio),
+    }
+    for barber_day in days - {None}:
+        availability_cache.invalidate_barber_day(*barber_day)
+    instance._slots_cache_origin = _appointment_cache_day(
+        instance.barber_id, instance.data_hora_inicio
+    )
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+@receiver(post_save, sender=Bloqueio)
+@receiver(post_delete, sender=Bloqueio)
+@receiver(post_save, sender=AvailabilityOverride)
+@receiver(post_delete, sender=AvailabilityOverride)
+@receiver(post_save, sender=BarberService)
+@receiver(post_delete, sender=BarberService)
+def invalidar_cache_da_agenda_do_barbeiro(sender, instance, **kwargs):
+    availability_cache.invalidate_barber(instance.barber_id)
+
+
+@receiver(post_delete, sender=BarberProfile)
+def invalidar_cache_do_barbeiro_removido(sender, instance, **kwargs):
+    availability_cache.invalidate_barber(instance.pk)
+
+
+@receiver(post_save, sender=Service)
+def invalidar_cache_de_quem_oferece_o_servico(sender, instance, created, **kwargs):
+    # A duração do serviço muda todos os slots de quem o oferece
+    if created:
+        return
+    for barber_id in BarberService.objects.filter(service=instance).values_list('barber_id', flat=True):
+        availability_cache.invalidate_barber(barber_id)
+
+
+# ---
+# Catálogo da homepage (core/catalog.py)
+# ---
+@receiver(post_save, sender=BarberProfile)
+@receiver(post_delete, sender=BarberProfile)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=BarberService)
+@receiver(post_delete, sender=BarberService)
+def invalidar_catalogo_da_homepage(sender, instance, **kwargs):
+    catalog.invalidate_catalog()
+
+
+# ---
+# Foto antiga do barbeiro: removida por um job de storage (core/storage_jobs.py)
+# ---
+def _picture_name(profile):
+    # Lê o valor cru (sem o descriptor): se o campo foi adiado com .only()/.defer(),
+    # não dispara um SELECT só para isso
+    value = profile.__dict__.get('profile_picture')
+    return getattr(value, 'name', value)
+
+
+@receiver(post_init, sender=BarberProfile)
+def guardar_foto_original(sender, instance, **kwargs):
+    """Nome da foto carregada do banco, para o save não precisar de um SELECT extra."""
+    instance._foto_original = _picture_name(instance)
+
+
+@receiver(post_save, sender=BarberProfile)
+def apagar_foto_substituida(sender, instance, created, **kwargs):
+    # Só depois do save: se ele falhar, a foto antiga continua lá
+    original = getattr(instance, '_foto_original', None)
+    atual = _picture_name(instance)
+    if not created and original and original != atual:
+        storage_jobs.enqueue_delete(photo_files(original))
+    instance._foto_original = atual
+
+
+@receiver(post_delete, sender=BarberProfile)
+def apagar_foto_do_barbeiro_removido(sender, instance, **kwargs):
+    storage_jobs.enqueue_delete(photo_files(_picture_name(instance)))
@@ -0,0 +1,196 @@
+# core/slots.py
+"""
+Motor de cálculo de slots (horários livres).
+
+Em vez de comparar cada slot candidato com cada agendamento do dia
+(O(slots x agendamentos)), ordenamos e fundimos os intervalos ocupados
+uma única vez e fazemos uma varredura ("sweep") contra os blocos de
+disponibilidade. As funções aqui são puras: recebem dados já carregados
+do banco e não fazem queries.
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .occupancy import DayOccupancy
+
+
+def merge_intervals(intervals):
+    """
+    Ordena e funde intervalos [inicio, fim) que se sobrepõem ou se tocam.
+    Ex: [(9h, 10h), (9h30, 11h), (11h, 12h)] -> [(9h, 12h)]
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue  # Intervalo vazio/inválido não ocupa nada
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _first_candidate(busy_ends, moment):
+    """Índice do primeiro intervalo ocupado que termina DEPOIS de 'moment'."""
+    return bisect_right(busy_ends, moment)
+
+
+def is_interval_free(start, end, busy):
+    """
+    Verifica se [start, end) não colide com nenhum intervalo de 'busy'.
+    'busy' deve vir de merge_intervals() (ordenado e sem sobreposição).
+    """
+    busy_ends = [interval_end for _, interval_end in busy]
+    i = _first_candidate(busy_ends, start)
+    # (A_start < B_end) já é garantido pelo bisect; falta (A_end > B_start)
+    return not (i < len(busy) and busy[i][0] < end)
+
+
+def compute_available_slots(selected_date, availability_blocks, busy_intervals,
+                            duration, now=None, tz=None):
+    """
+    Gera os inícios (datetimes "aware") de todos os slots livres do dia.
+
+    - availability_blocks: pares (hora_inicio, hora_fim) do tipo time.
+    - busy_intervals: pares (inicio, fim) "aware" (agendamentos do dia).
+    - duration: timedelta do serviço (também é o "passo" entre slots).
+
+    Devolve exatamente os mesmos slots que o antigo loop aninhado de
+    GetAvailableSlotsView, na mesma ordem (bloco a bloco).
+    """
+    if duration <= timedelta(0):
+        return []
+
+    tz = tz or timezone.get_current_timezone()
+    now = now or timezone.now()
+
+    busy = merge_intervals(busy_intervals)
+    busy_ends = [end for _, end in busy]
+
+    slots = []
+    for hora_inicio, hora_fim in availability_blocks:
+        slot_start = timezone.make_aware(datetime.combine(selected_date, hora_inicio), tz)
+        block_end = timezone.make_aware(datetime.combine(selected_date, hora_fim), tz)
+
+        # Blocos podem se sobrepor, então reposicionamos o ponteiro por bloco.
+        i = _first_candidate(busy_ends, slot_start)
+
+        while slot_start + duration <= block_end:
+            slot_end = slot_start + duration
+
+            # Avança o ponteiro pelos intervalos que já terminaram
+            while i < len(busy) and busy[i][1] <= slot_start:
+                i += 1
+
+            is_booked = i < len(busy) and busy[i][0] < slot_end
+            if not is_booked and slot_start >= now:
+                slots.append(slot_start)
+
+            slot_start = slot_end
+
+    return slots
+
+
+def compute_available_slots_by_day(start_date, end_date, blocks_for_day,
+                                   busy_by_day, duration, now=None, tz=None,
+                                   granularity=5):
+    """
+    Versão multi-dia de compute_available_slots (de start_date até end_date,
+    inclusive). Devolve um dict {date: [inícios "aware"]} com TODOS os dias
+    do range (lista vazia = dia sem horário livre).
+
+    - blocks_for_day: função date -> [(hora_inicio, hora_fim), ...] com os
+      blocos abertos do dia (ex: BarberCalendar.blocks_for; [] = fechado).
+    - busy_by_day: {date: [(inicio, fim), ...]} com os agendamentos.
+
+    Cada dia é resolvido com a máscara de bits de core/occupancy.py.
+    """
+    tz = tz or timezone.get_current_timezone()
+    now = now or timezone.now()
+
+    slots_by_day = {}
+    current_date = start_date
+    while current_date <= end_date:
+        blocks = blocks_for_day(current_date)
+        if blocks:
+            slots_by_day[current_date] = DayOccupancy.build(
+                current_date, blocks, busy_by_day.get(current_date, []),
+                granularity=granularity, tz=tz,
+            ).free_slots(duration, now=now)
+        else:
+            slots_by_day[current_date] = []
+        current_date += timedelta(days=1)
+    return slots_by_day
+
+
+def merge_date_ranges(ranges):
+    """
+    Funde ranges de datas INCLUSIVOS (data_inicio, data_fim), como os dos
+    Bloqueios, e devolve intervalos [inicio, fim) (fim = dia seguinte).
+    Ex: [(01/12, 05/12), (06/12, 08/12)] -> [(01/12, 09/12)]
+    """
+    return merge_intervals((inicio, fim + timedelta(days=1)) for inicio, fim in ranges)
+
+
+def available_work_dates(start_date, end_date, work_weekdays, blocked_ranges):
+    """
+    Datas de start_date até end_date (inclusive) em que o dia da semana
+    está em work_weekdays e que não caem em nenhum bloqueio.
+
+    Os bloqueios são fundidos e só os "buracos" entre eles são percorridos,
+    semana a semana: o custo não depende de quantos dias os bloqueios
+    cobrem (férias de meses custam o mesmo que uma folga).
+    """
+    work_weekdays = frozenset(work_weekdays)
+    if not work_weekdays or end_date < start_date:
+        return []
+
+    dates = []
+    cursor = start_date
+    for block_start, block_end in merge_date_ranges(blocked_ranges):
+        if block_end <= cursor:
+            continue
+        if block_start > end_date:
+            break
+        dates.extend(_work_dates_between(cursor, block_start - timedelta(days=1), work_weekdays))
+        cursor = block_end
+    dates.extend(_work_dates_between(cursor, end_date, work_weekdays))
+    return dates
+
+
+def _work_dates_between(first, last, work_weekdays):
+    """Dias de trabalho de first até last (inclusive), em ordem."""
+    total = (last - first).days
+    if total < 0:
+        return []
+    # Deslocamentos (0-6) dos dias de trabalho a partir de 'first'
+    offsets = sorted((weekday - first.weekday()) % 7 for weekday in work_weekdays)
+    return [
+        first + timedelta(days=week + offset)
+        for week in range(0, total + 1, 7)
+        for offset in offsets
+        if week + offset <= total
+    ]
+
+
+def reservation_buckets(inicio, fim, bucket_size):
+    """
+    Lista os "buckets" (blocos de tamanho fixo, alinhados à época UTC) que
+    o intervalo [inicio, fim) toca. Dois intervalos que se sobrepõem sempre
+    dividem ao menos um bucket, então uma UNIQUE (barbeiro, bucket) no banco
+    impede o double-booking sem travar ranges.
+    Ex (5min): 10:00-10:30 -> [10:00, 10:05, ..., 10:25]
+    """
+    size = int(bucket_size.total_seconds())
+    start_ts = int(inicio.timestamp())
+    end_ts = int(fim.timestamp())
+    if size <= 0 or end_ts <= start_ts:
+        return []
+    first = start_ts - start_ts % size
+    return [
+        datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+        for ts in range(first, end_ts, size)
+    ]
@@ -0,0 +1,171 @@
+# core/storage_jobs.py
+"""
+Fila de jobs de storage (upload e remoção de arquivos no GCS).
+
+O request nunca espera o storage remoto:
+
+1. Upload: a view grava os arquivos no storage de "staging" (disco local,
+   STORAGES['staging']) e chama enqueue_upload(); o job copia cada arquivo
+   para o storage padrão com o MESMO nome e apaga a cópia local.
+2. Remoção: enqueue_delete() (ex: a foto antiga, ver core/signals.py).
+
+Mesmo esquema do outbox de notificações (core/notifications.py): a linha
+de StorageJob é gravada na transação do request e, depois do commit,
+executada numa thread (STORAGE_JOB_DISPATCH='thread') ou pelo worker
+'manage.py process_storage_jobs', com claim por UPDATE condicional,
+retentativas e backoff exponencial.
+
+No modo 'worker' o staging precisa ser um diretório compartilhado entre
+o web e o worker.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage, storages
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .db_connections import connection_cycle
+from .instrumentation import span
+from .models import StorageJob
+from .notifications import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='storage')
+    return _executor
+
+
+def staging_storage():
+    return storages['staging']
+
+
+def enqueue_upload(nomes):
+    """Agenda a cópia dos arquivos do staging para o storage padrão."""
+    return _enqueue('upload', nomes)
+
+
+def enqueue_delete(nomes):
+    """Agenda a remoção dos arquivos (do storage padrão e do staging)."""
+    return _enqueue('delete', nomes)
+
+
+def _enqueue(acao, nomes):
+    nomes = list(nomes)
+    if not nomes:
+        return None
+    job = StorageJob.objects.create(acao=acao, nomes=nomes)
+    transaction.on_commit(lambda: dispatch(job.pk))
+    return job
+
+
+def dispatch(job_id):
+    """Chamado no on_commit: o request não fica esperando o storage."""
+    mode = getattr(settings, 'STORAGE_JOB_DISPATCH', 'thread')
+    if mode == 'thread':
+        _get_executor().submit(_run_in_thread, job_id)
+    elif mode == 'sync':
+        run(job_id)
+    # 'worker': fica para o 'manage.py process_storage_jobs'
+
+
+def _run_in_thread(job_id):
+    with connection_cycle():
+        try:
+            run(job_id)
+        except Exception as e:
+            logger.error('Erro inesperado no job de storage', extra={'job_id': job_id, 'erro': type(e).__name__})
+
+
+def _claim(job_id, now):
+    """Reserva o job para este processo. Devolve False se outro já pegou."""
+    return StorageJob.objects.filter(
+        pk=job_id,
+        status__in=['pendente', 'executando'],
+        proxima_tentativa__lte=now,
+    ).update(
+        status='executando',
+        proxima_tentativa=now + timedelta(seconds=settings.STORAGE_JOB_CLAIM_SECONDS),
+    ) == 1
+
+
+def _upload(nomes):
+    staging = staging_storage()
+    for nome in nomes:
+        if not staging.exists(nome):
+            continue  # Já copiado numa tentativa anterior (ou a foto já foi apagada)
+        # Retentativa depois de uma cópia parcial: o arquivo já está lá
+        if not default_storage.exists(nome):
+            with staging.open(nome, 'rb') as content:
+                saved = default_storage.save(nome, content)
+            if saved != nome:
+                raise RuntimeError(f"Storage renomeou {nome} para {saved}")
+        staging.delete(nome)
+
+
+def _delete(nomes):
+    staging = staging_storage()
+    for nome in nomes:
+        default_storage.delete(nome)
+        staging.delete(nome)  # Upload que ainda não tinha acontecido
+
+
+def run(job_id):
+    """Executa UM job (se conseguir o claim). Devolve True se concluiu."""
+    now = timezone.now()
+    if not _claim(job_id, now):
+        return False
+
+    job = StorageJob.objects.get(pk=job_id)
+    try:
+        with span('storage'):
+            if job.acao == 'upload':
+                _upload(job.nomes)
+            else:
+                _delete(job.nomes)
+    except Exception as e:
+        tentativas = job.tentativas + 1
+        if tentativas >= settings.STORAGE_JOB_MAX_ATTEMPTS:
+            status, proxima = 'falhou', now
+        else:
+            status, proxima = 'pendente', now + backoff_delay(tentativas)
+        StorageJob.objects.filter(pk=job_id).update(
+            status=status,
+            tentativas=tentativas,
+            proxima_tentativa=proxima,
+            ultimo_erro=f"{type(e).__name__}: {e}"[:500],
+        )
+        return False
+
+    StorageJob.objects.filter(pk=job_id).update(
+        status='concluido',
+        tentativas=F('tentativas') + 1,
+        concluido_em=timezone.now(),
+        ultimo_erro='',
+    )
+    return True
+
+
+def due_jobs(now=None):
+    """Jobs vencidos (pendentes ou com claim expirado)."""
+    return StorageJob.objects.filter(
+        status__in=['pendente', 'executando'],
+        proxima_tentativa__lte=now or timezone.now(),
+    )
+
+
+def drain(batch_size=None):
+    """Executa um lote de jobs vencidos, em ordem. Devolve (concluídos, não concluídos)."""
+    batch_size = batch_size or settings.STORAGE_JOB_BATCH_SIZE
+    ids = list(due_jobs().order_by('proxima_tentativa', 'pk').values_list('pk', flat=True)[:batch_size])
+    concluidos = sum(run(job_id) for job_id in ids)
+    return concluidos, len(ids) - concluidos
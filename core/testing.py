@@ -0,0 +1,64 @@
+# core/testing.py
+"""
+Apoio para os testes: orçamento de queries por view.
+
+Cada view tem um número máximo de queries (QUERY_BUDGETS). Os testes
+medem as queries de um request e falham se o orçamento for estourado,
+listando o SQL executado. assertConstantQueries roda o mesmo request
+com volumes de dados diferentes para pegar N+1 (o número de queries não
+pode crescer com os dados).
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Orçamento máximo de queries por view (nome da URL -> queries)
+QUERY_BUDGETS = {
+    'core:homepage': 3,                     # cache frio: preços, barbeiros, serviços (depois: 0)
+    'core:painel': 7,                       # sessão, usuário, perfil + 4 listas
+    'core:get_available_slots': 5,          # cache frio: BarberService, agenda (3), Appointment
+    'core:get_available_slots_range': 5,
+    'core:get_barber_available_dates': 4,   # barbeiro + agenda (Availability, Bloqueio, exceções)
+    'core:first_available_slots': 5,        # BarberService, agendas (3, todas juntas), Appointment
+    'core:create_appointment': 8,           # 3 de validação + savepoint, insert, reservas, outbox, release
+    'core:success_page': 1,
+    'core:confirm_appointment': 5,          # sessão, usuário, agendamento, perfil, update (reservas não mudam)
+    'core:cancel_appointment': 8,           # idem + savepoint, apaga as reservas, release
+}
+
+
+class QueryBudgetMixin:
+    """Mixin para TestCase/APITestCase."""
+
+    def captureQueries(self, func, *args, **kwargs):
+        """Executa func e devolve (resultado, lista de queries)."""
+        with CaptureQueriesContext(connection) as ctx:
+            result = func(*args, **kwargs)
+        return result, [query['sql'] for query in ctx.captured_queries]
+
+    def assertQueryBudget(self, url_name, func, *args, **kwargs):
+        """Falha se func fizer mais queries que QUERY_BUDGETS[url_name]."""
+        budget = QUERY_BUDGETS[url_name]
+        result, queries = self.captureQueries(func, *args, **kwargs)
+        if len(queries) > budget:
+            self.fail(
+                f"{url_name} fez {len(queries)} queries (orçamento: {budget}):\n"
+                + "\n".join(f"  {i}. {sql}" for i, sql in enumerate(queries, 1))
+            )
+        return result
+
+    def assertConstantQueries(self, url_name, sizes, populate, func):
+        """
+        Para cada tamanho em 'sizes': populate(tamanho) cria os dados e
+        func() faz o request. O número de queries tem que ser o mesmo em
+        todos os tamanhos (e caber no orçamento).
+        """
+        counts = {}
+        for size in sizes:
+            populate(size)
+            _, queries = self.captureQueries(self.assertQueryBudget, url_name, func)
+            counts[size] = len(queries)
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"{url_name}: o número de queries cresce com os dados {counts}"
+        )
+        return counts
@@ -1,7 +1,16 @@
 from django.urls import reverse
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.cache import cache
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from .models import (
     Appointment,
     User,
@@ -9,14 +18,41 @@ from .models import (
     Service,
     BarberService,
     Availability,
+    AvailabilityOverride,
     Bloqueio,
+    SlotReservation,
+    NotificationOutbox,
+    StorageJob,
 )
+from .serializers import AppointmentSerializer
+from . import availability_cache, db_connections, db_router, notifications, storage_jobs
+from .notification_transport import LocMemBackend, get_stats, reset_stats
 from django.utils import timezone
-from datetime import timedelta, time, datetime
+from datetime import date, timedelta, time, datetime
 from django.core.files.uploadedfile import SimpleUploadedFile
 from decimal import Decimal
 import io
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time as time_module
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
 from PIL import Image
+from .slots import available_work_dates, compute_available_slots, is_interval_free, merge_intervals
+from .occupancy import DayOccupancy
+from .log import JsonFormatter, QueueJsonHandler, SamplingFilter, logger_levels
+from .testing import QueryBudgetMixin
+from .barber_calendar import interval_mask, mask_to_blocks
+from .views import GetAvailableSlotsView
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import REGISTRY
+from django.core.signing import Signer
 
 
 class AppointmentAPITests(APITestCase):
@@ -320,6 +356,274 @@ class SlotGenerationAPITests(APITestCase):
         # A próxima segunda-feira (férias) NÃO PODE estar na lista
         self.assertNotIn(self.proxima_segunda.strftime("%Y-%m-%d"), dates)
 
+    def test_get_slots_is_cached_and_invalidated_by_appointment(self):
+        """A 2ª chamada não vai ao banco; um novo agendamento invalida o dia."""
+
+        params = {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "date": self.test_date.strftime("%Y-%m-%d"),
+        }
+        first = self.client.get(self.url, params).json()["available_slots"]
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, params).json()["available_slots"]
+        self.assertEqual(first, cached)
+        self.assertIn("14:00", cached)
+
+        start_dt = timezone.make_aware(datetime.combine(self.test_date, time(14, 0)))
+        Appointment.objects.create(
+            barber=self.barber,
+            barber_service=self.bs_30min,
+            cliente_nome="Cliente Novo",
+            cliente_telefone="123",
+            data_hora_inicio=start_dt,
+            data_hora_fim=start_dt + timedelta(minutes=30),
+            status="pendente",
+        )
+        slots = self.client.get(self.url, params).json()["available_slots"]
+        self.assertNotIn("14:00", slots)
+
+    def test_get_available_dates_cache_invalidated_by_bloqueio(self):
+        """Um novo Bloqueio invalida o cache do carrossel de datas."""
+
+        dates = self.client.get(self.url_datas).json()["available_dates"]
+        self.assertIn(self.test_date.strftime("%Y-%m-%d"), dates)
+        with self.assertNumQueries(0):
+            self.client.get(self.url_datas)
+
+        Bloqueio.objects.create(
+            barber=self.barber, data_inicio=self.test_date, data_fim=self.test_date
+        )
+        dates = self.client.get(self.url_datas).json()["available_dates"]
+        self.assertNotIn(self.test_date.strftime("%Y-%m-%d"), dates)
+
+    def test_get_slots_conditional_get_returns_304_until_schedule_changes(self):
+        params = {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "date": self.test_date.strftime("%Y-%m-%d"),
+        }
+        first = self.client.get(self.url, params)
+        etag = first["ETag"]
+        self.assertTrue(etag.startswith('"'))  # ETag forte
+        self.assertIn("Last-Modified", first)
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        with mock.patch.object(GetAvailableSlotsView, "compute_day_slots") as compute, self.assertNumQueries(0):
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        compute.assert_not_called()
+
+        # Outro barbeiro/serviço não muda a versão; um agendamento no dia muda
+        start_dt = timezone.make_aware(datetime.combine(self.test_date, time(15, 0)))
+        Appointment.objects.create(
+            barber=self.barber, barber_service=self.bs_30min,
+            cliente_nome="Cliente Novo", cliente_telefone="123",
+            data_hora_inicio=start_dt, data_hora_fim=start_dt + timedelta(minutes=30),
+        )
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertNotIn("15:00", response.json()["available_slots"])
+
+    def test_deferred_appointment_fields(self):
+        start_dt = timezone.make_aware(datetime.combine(self.test_date, time(15, 0)))
+        appointment = Appointment.objects.create(
+            barber=self.barber, barber_service=self.bs_30min,
+            cliente_nome="Cliente Novo", cliente_telefone="123",
+            data_hora_inicio=start_dt, data_hora_fim=start_dt + timedelta(minutes=30),
+        )
+        # Os post_init não podem ler campos adiados (refresh_from_db -> recursão)
+        self.assertTrue(list(Appointment.objects.only("id")))
+        self.assertTrue(list(Appointment.objects.defer("data_hora_inicio", "barber")))
+
+        params = {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "date": self.test_date.strftime("%Y-%m-%d"),
+        }
+        self.assertNotIn("15:00", self.client.get(self.url, params).json()["available_slots"])
+
+        # Cancelar a partir de uma instância parcial libera o horário e invalida o cache
+        deferred = Appointment.objects.only("id", "status").get(pk=appointment.pk)
+        deferred.status = "cancelado"
+        deferred.save()
+        self.assertFalse(appointment.slot_reservations.exists())
+        self.assertIn("15:00", self.client.get(self.url, params).json()["available_slots"])
+
+    def test_local_cache_expires_quickly(self):
+        # Cache por processo: os outros workers não veem a invalidação, então
+        # dados e versões (ETag) duram no máximo LOCAL_CACHE_MAX_TIMEOUT
+        self.assertTrue(settings.CACHE_IS_LOCAL)
+        cache_key, _ = availability_cache.day_slots_state(self.barber.id, self.servico_30min.id, self.test_date)
+        self.client.get(self.url, {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "date": self.test_date.strftime("%Y-%m-%d"),
+        })
+        local = cache._wrapped
+        limit = time_module.time() + settings.LOCAL_CACHE_MAX_TIMEOUT
+        version_key = f"slots:v:barber:{self.barber.id}"
+        for key in (cache_key, version_key):
+            self.assertLessEqual(local._expire_info[local.make_key(key)], limit)
+
+    def test_get_available_dates_conditional_get(self):
+        etag = self.client.get(self.url_datas)["ETag"]
+        self.assertEqual(self.client.get(self.url_datas, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Availability.objects.create(
+            barber=self.barber, dia_da_semana=2, hora_inicio=time(9, 0), hora_fim=time(12, 0)
+        )
+        response = self.client.get(self.url_datas, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_get_available_dates_horizon_is_configurable(self):
+        with self.settings(AVAILABLE_DATES_HORIZON_DAYS=365):
+            dates = self.client.get(self.url_datas).json()["available_dates"]
+        # Só segundas, exceto a semana do Bloqueio
+        self.assertGreaterEqual(len(dates), 50)
+        self.assertNotIn(self.proxima_segunda.strftime("%Y-%m-%d"), dates)
+        self.assertTrue(all(date.fromisoformat(d).weekday() == 0 for d in dates))
+        self.assertLessEqual(date.fromisoformat(dates[-1]), timezone.now().date() + timedelta(days=365))
+
+    def test_override_closes_part_of_day_and_opens_extra_day(self):
+        """Exceções de um dia: pausa longa na segunda e expediente extra na terça."""
+        params = {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "date": self.test_date.strftime("%Y-%m-%d"),
+        }
+        self.assertIn("14:30", self.client.get(self.url, params).json()["available_slots"])  # Esquenta o cache
+
+        AvailabilityOverride.objects.create(
+            barber=self.barber, data=self.test_date, hora_inicio=time(14, 0), hora_fim=time(15, 30),
+            tipo="fechado", motivo="Almoço longo",
+        )
+        terca = self.test_date + timedelta(days=1)
+        AvailabilityOverride.objects.create(
+            barber=self.barber, data=terca, hora_inicio=time(18, 0), hora_fim=time(19, 0), tipo="aberto",
+        )
+
+        slots = self.client.get(self.url, params).json()["available_slots"]
+        self.assertNotIn("14:00", slots)
+        self.assertNotIn("15:00", slots)
+        self.assertIn("15:30", slots)
+        self.assertIn("09:00", slots)
+
+        extra = self.client.get(self.url, dict(params, date=terca.strftime("%Y-%m-%d"))).json()
+        self.assertEqual(extra["available_slots"], ["18:00", "18:30"])
+        self.assertIn(terca.strftime("%Y-%m-%d"), self.client.get(self.url_datas).json()["available_dates"])
+
+    def test_adjacent_blocks_keep_their_own_slot_grid(self):
+        """Blocos encostados (09-12 e 12-18) não viram um só: a grade recomeça às 12:00."""
+        quarta = self.test_date + timedelta(days=2)
+        Availability.objects.create(barber=self.barber, dia_da_semana=2, hora_inicio=time(9, 0), hora_fim=time(12, 0))
+        Availability.objects.create(barber=self.barber, dia_da_semana=2, hora_inicio=time(12, 0), hora_fim=time(18, 0))
+        servico_40min = Service.objects.create(nome="Barba 40min", duracao=timedelta(minutes=40))
+        BarberService.objects.create(barber=self.barber, service=servico_40min, preco=40)
+
+        slots = self.client.get(self.url, {
+            "barber_id": self.barber.id,
+            "service_id": servico_40min.id,
+            "date": quarta.strftime("%Y-%m-%d"),
+        }).json()["available_slots"]
+        self.assertIn("11:00", slots)
+        self.assertIn("12:00", slots)
+        self.assertNotIn("11:40", slots)
+        self.assertNotIn("12:20", slots)
+
+    def test_get_slots_range_returns_per_day_map(self):
+        """Testa a API de range: mesmo resultado da API diária, dia a dia."""
+
+        url_range = reverse("core:get_available_slots_range")
+        params = {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "start": self.test_date.strftime("%Y-%m-%d"),
+            "end": self.proxima_segunda.strftime("%Y-%m-%d"),
+        }
+        # BarberService + agenda compilada (Availability, Bloqueio, exceções) + Appointment
+        with self.assertNumQueries(5):
+            response = self.client.get(url_range, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        slots_by_day = response.json()["available_slots"]
+        self.assertEqual(len(slots_by_day), 8)  # Segunda até a próxima segunda
+
+        # O dia do teste bate com a API de um dia só
+        single = self.client.get(self.url, {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "date": self.test_date.strftime("%Y-%m-%d"),
+        }).json()["available_slots"]
+        self.assertEqual(slots_by_day[self.test_date.strftime("%Y-%m-%d")], single)
+
+        # Terça (sem Availability) e a próxima segunda (Bloqueio) ficam vazias
+        terca = self.test_date + timedelta(days=1)
+        self.assertEqual(slots_by_day[terca.strftime("%Y-%m-%d")], [])
+        self.assertEqual(slots_by_day[self.proxima_segunda.strftime("%Y-%m-%d")], [])
+
+    def test_get_slots_range_rejects_invalid_window(self):
+        """O fim antes do início (ou um range grande demais) retorna 400."""
+
+        url_range = reverse("core:get_available_slots_range")
+        params = {
+            "barber_id": self.barber.id,
+            "service_id": self.servico_30min.id,
+            "start": self.proxima_segunda.strftime("%Y-%m-%d"),
+            "end": self.test_date.strftime("%Y-%m-%d"),
+        }
+        response = self.client.get(url_range, params)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        params["start"] = self.test_date.strftime("%Y-%m-%d")
+        params["end"] = (self.test_date + timedelta(days=400)).strftime("%Y-%m-%d")
+        response = self.client.get(url_range, params)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_first_available_merges_barbers_in_time_order(self):
+        """Primeiros horários entre TODOS os barbeiros do serviço; empate pelo id do barbeiro."""
+
+        rival_user = User.objects.create_user(username="rival", password="123", is_barber=True)
+        rival = BarberProfile.objects.create(user=rival_user, nome_exibicao="Rival")
+        bs_rival = BarberService.objects.create(barber=rival, service=self.servico_30min, preco=45)
+        Availability.objects.create(
+            barber=rival, dia_da_semana=0, hora_inicio=time(9, 0), hora_fim=time(12, 0)
+        )
+        start_dt = timezone.make_aware(datetime.combine(self.test_date, time(9, 0)))
+        Appointment.objects.create(
+            barber=rival, barber_service=bs_rival, cliente_nome="Ocupado", cliente_telefone="123",
+            data_hora_inicio=start_dt, data_hora_fim=start_dt + timedelta(minutes=30), status="pendente",
+        )
+
+        url = reverse("core:first_available_slots")
+        params = {
+            "service_id": self.servico_30min.id,
+            "start": self.test_date.strftime("%Y-%m-%d"),
+            "end": (self.test_date + timedelta(days=6)).strftime("%Y-%m-%d"),
+            "limit": 5,
+        }
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        results = [(r["time"], r["barber_nome"]) for r in response.json()["results"]]
+        # Cadu: 09:00, 09:30, (10:00 ocupado), 10:30 | Rival: (09:00 ocupado), 09:30, 10:00
+        self.assertEqual(results, [
+            ("09:00", "Cadu Slots"), ("09:30", "Cadu Slots"), ("09:30", "Rival"),
+            ("10:00", "Rival"), ("10:30", "Cadu Slots"),
+        ])
+        self.assertEqual(response.json()["results"][2]["preco"], "45.00")
+
+        # Parâmetros inválidos
+        self.assertEqual(self.client.get(url, {**params, "limit": 0}).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {**params, "end": (self.test_date + timedelta(days=60)).isoformat()}).status_code,
+            400,
+        )
+        self.assertEqual(self.client.get(url, {"service_id": "x"}).status_code, 400)
+
 
 class PainelViewTests(TestCase):
 
@@ -484,6 +788,41 @@ class PainelViewTests(TestCase):
         response = self.client.get(self.painel_url)
         self.assertContains(response, "Cliente Painel")
 
+    def test_09_upcoming_appointments_keyset_pagination(self):
+        """Primeira página no painel, o resto pela API, sem repetir nem pular."""
+        base = (timezone.now() + timedelta(days=1)).replace(second=0, microsecond=0)
+        # bulk_create: sem sinais/reservas, então dá para ter horários empatados
+        Appointment.objects.bulk_create([
+            Appointment(
+                barber=self.barber_profile, barber_service=self.barber_service,
+                cliente_nome=f"Cliente {i:02d}", cliente_telefone="11999999999",
+                data_hora_inicio=base + timedelta(hours=i // 3),
+                data_hora_fim=base + timedelta(hours=i // 3, minutes=30),
+                status="confirmado" if i % 4 else "cancelado",
+            )
+            for i in range(45)
+        ])
+        esperado = list(
+            Appointment.objects.filter(barber=self.barber_profile, status="confirmado")
+            .order_by("data_hora_inicio", "id").values_list("id", flat=True)
+        )
+        self.client.login(username="barbeiro_painel", password="123")
+
+        with self.settings(PAINEL_PAGE_SIZE=10):
+            response = self.client.get(self.painel_url)
+            vistos = [appt["id"] for appt in response.context["proximos_agendamentos"]]
+            cursor = response.context["proximos_cursor"]
+            self.assertContains(response, "10+")
+            api_url = reverse("core:upcoming_appointments")
+            while cursor:
+                with self.assertNumQueries(4):  # sessão, usuário, perfil e a página
+                    data = self.client.get(api_url, {"cursor": cursor}).json()
+                vistos += [row["id"] for row in data["results"]]
+                self.assertEqual(data["html"].count("list-group-item-action"), len(data["results"]))
+                cursor = data["next_cursor"]
+
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(self.client.get(api_url, {"cursor": "lixo"}).status_code, 400)
 
 class ProfilePhotoUploadTests(APITestCase):
 
@@ -539,7 +878,8 @@ class ProfilePhotoUploadTests(APITestCase):
         self.assertTrue(
             stored_name.startswith("barber_photos/")
         )
-        self.assertTrue(stored_name.endswith(".png"))
+        # O original não é guardado: profile_picture aponta para a versão 'full' em JPEG
+        self.assertTrue(stored_name.endswith("/full.jpg"))
 
     def test_02_upload_fails_if_file_too_large(self):
         """Testa se a API bloqueia arquivos maiores que 2MB."""
@@ -574,3 +914,1147 @@ class ProfilePhotoUploadTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         # Verifica se a mensagem de erro do FileExtensionValidator está lá
         self.assertIn("File extension “txt” is not allowed", str(response.data))
+
+    def _jpeg_with_exif(self, size=(400, 200)):
+        """JPEG 'deitado' com orientação EXIF 6 (girar 90°) e um campo de GPS."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation
+        exif[0x010F] = "CameraQueVaza"  # Make
+        img_io = io.BytesIO()
+        Image.new("RGB", size, color="red").save(img_io, format="JPEG", exif=exif)
+        return SimpleUploadedFile("celular.jpg", img_io.getvalue(), content_type="image/jpeg")
+
+    def test_04_upload_generates_oriented_renditions_without_exif(self):
+        """Versões thumb/card/full em WebP e JPEG, orientadas e sem metadados."""
+        response = self.client.post(
+            self.upload_url, {"photo": self._jpeg_with_exif()}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.barber_profile.refresh_from_db()
+        renditions = self.barber_profile.foto_renditions
+        self.assertEqual(set(renditions), {"thumb", "card", "full"})
+        self.assertEqual(response.data["renditions"], renditions)
+
+        storage = self.barber_profile.profile_picture.storage
+        prefix = self.barber_profile.profile_picture.name.rsplit("/", 1)[0]
+
+        # O request só grava no staging; o upload para o storage é um job
+        self.assertTrue(storage_jobs.staging_storage().exists(f"{prefix}/card.webp"))
+        self.assertFalse(storage.exists(f"{prefix}/card.webp"))
+        self.assertEqual(storage_jobs.drain(), (1, 0))
+        self.assertFalse(storage_jobs.staging_storage().exists(f"{prefix}/card.webp"))
+        esperado = {"thumb": (96, 96), "card": (300, 300), "full": (200, 400)}  # full: girada
+        for rendition, tamanho in esperado.items():
+            for ext, formato in (("webp", "WEBP"), ("jpg", "JPEG")):
+                with storage.open(f"{prefix}/{rendition}.{ext}") as f:
+                    img = Image.open(f)
+                    img.load()
+                    self.assertEqual(img.format, formato)
+                    self.assertEqual(img.size, tamanho)
+                    self.assertEqual(len(img.getexif()), 0)
+
+        # A homepage usa a versão 'card'
+        response = self.client.get(reverse("core:homepage"))
+        self.assertContains(response, renditions["card"]["webp"])
+        self.assertContains(response, renditions["card"]["jpeg"])
+
+        # Uma nova foto apaga TODAS as versões da anterior (upload da nova primeiro)
+        self.client.post(self.upload_url, {"photo": self._jpeg_with_exif()}, format="multipart")
+        self.assertTrue(storage.exists(f"{prefix}/card.webp"))
+        self.assertEqual(
+            list(StorageJob.objects.filter(status="pendente").values_list("acao", flat=True).order_by("pk")),
+            ["upload", "delete"],
+        )
+        self.assertEqual(storage_jobs.drain(), (2, 0))
+        self.assertFalse(storage.exists(f"{prefix}/card.webp"))
+        self.assertFalse(storage.exists(f"{prefix}/full.jpg"))
+
+    def test_05_upload_rejects_undecodable_image(self):
+        fake_png = SimpleUploadedFile("foto.png", b"nao sou um png", content_type="image/png")
+        response = self.client.post(self.upload_url, {"photo": fake_png}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("não é uma imagem válida", str(response.data))
+        self.barber_profile.refresh_from_db()
+        self.assertFalse(self.barber_profile.profile_picture)
+
+    def test_06_replacing_photo_uses_loaded_value_and_retries_jobs(self):
+        """A foto antiga vem do valor carregado (sem SELECT extra) e o job tenta de novo se o storage falhar."""
+        storage = self.barber_profile.profile_picture.storage
+        storage.save("barber_photos/antiga.jpg", io.BytesIO(b"x"))
+        self.barber_profile.profile_picture = "barber_photos/antiga.jpg"
+        self.barber_profile.save()
+
+        profile = BarberProfile.objects.get(pk=self.barber_profile.pk)
+        profile.profile_picture = "barber_photos/abc/full.jpg"
+        with self.assertNumQueries(2):  # UPDATE + INSERT do job
+            profile.save(update_fields=["profile_picture"])
+        job = StorageJob.objects.get(acao="delete")
+        self.assertEqual(job.nomes, ["barber_photos/antiga.jpg"])
+
+        # Storage fora do ar: o job volta para a fila com backoff
+        gcs_fora = mock.Mock(**{"delete.side_effect": OSError("GCS indisponível")})
+        with mock.patch.object(storage_jobs, "default_storage", gcs_fora):
+            self.assertEqual(storage_jobs.drain(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.tentativas), ("pendente", 1))
+        self.assertIn("GCS indisponível", job.ultimo_erro)
+        self.assertTrue(storage.exists("barber_photos/antiga.jpg"))
+
+        StorageJob.objects.filter(pk=job.pk).update(proxima_tentativa=timezone.now())
+        self.assertEqual(storage_jobs.drain(), (1, 0))
+        self.assertFalse(storage.exists("barber_photos/antiga.jpg"))
+
+class SlotEngineTests(SimpleTestCase):
+    """Compara o motor de intervalos (core/slots.py) com o antigo loop aninhado."""
+
+    @staticmethod
+    def _slots_loop_antigo(selected_date, blocks, appointments, duration, now):
+        # Réplica fiel do algoritmo O(slots x agendamentos) de GetAvailableSlotsView
+        tz = timezone.get_current_timezone()
+        slots = []
+        for hora_inicio, hora_fim in blocks:
+            slot_start = timezone.make_aware(datetime.combine(selected_date, hora_inicio), tz)
+            block_end = timezone.make_aware(datetime.combine(selected_date, hora_fim), tz)
+            while slot_start + duration <= block_end:
+                slot_end = slot_start + duration
+                is_booked = any(
+                    slot_start < fim and slot_end > inicio for inicio, fim in appointments
+                )
+                if not is_booked and slot_start >= now:
+                    slots.append(slot_start)
+                slot_start += duration
+        return slots
+
+    def test_merge_intervals_funde_sobreposicoes_e_vizinhos(self):
+        self.assertEqual(merge_intervals([(5, 6), (1, 3), (2, 4), (4, 5), (8, 9)]), [(1, 6), (8, 9)])
+        self.assertEqual(merge_intervals([(3, 3), (2, 1)]), [])
+
+    def test_engine_equals_nested_loop(self):
+        rng = random.Random(42)
+        tz = timezone.get_current_timezone()
+        day = date(2030, 1, 7)
+        for _ in range(300):
+            blocks = []
+            for _ in range(rng.randint(1, 3)):
+                inicio = rng.randint(6 * 4, 20 * 4) * 15
+                fim = min(inicio + rng.randint(1, 24) * 15, 23 * 60 + 59)
+                blocks.append((time(inicio // 60, inicio % 60), time(fim // 60, fim % 60)))
+            blocks.sort()
+            appointments = []
+            for _ in range(rng.randint(0, 12)):
+                start = timezone.make_aware(datetime.combine(day, time(rng.randint(5, 21), rng.choice([0, 10, 15, 30, 45]))), tz)
+                appointments.append((start, start + timedelta(minutes=rng.choice([15, 30, 45, 90]))))
+            duration = timedelta(minutes=rng.choice([15, 20, 30, 45, 60, 90]))
+            now = timezone.make_aware(datetime.combine(day, time(rng.randint(0, 23), 0)), tz)
+
+            self.assertEqual(
+                compute_available_slots(day, blocks, appointments, duration, now=now),
+                self._slots_loop_antigo(day, blocks, appointments, duration, now),
+            )
+
+    def test_available_work_dates_equals_day_by_day_expansion(self):
+        rng = random.Random(7)
+        start = date(2030, 1, 1)
+        for _ in range(300):
+            end = start + timedelta(days=rng.randint(0, 365))
+            weekdays = set(rng.sample(range(7), rng.randint(0, 7)))
+            blocked = []
+            for _ in range(rng.randint(0, 8)):
+                inicio = start + timedelta(days=rng.randint(-30, 380))
+                blocked.append((inicio, inicio + timedelta(days=rng.randint(0, 120))))
+
+            # Algoritmo antigo: expande cada bloqueio dia a dia
+            blocked_dates = set()
+            for inicio, fim in blocked:
+                for i in range((fim - inicio).days + 1):
+                    blocked_dates.add(inicio + timedelta(days=i))
+            esperado = [
+                start + timedelta(days=i) for i in range((end - start).days + 1)
+                if (start + timedelta(days=i)).weekday() in weekdays
+                and start + timedelta(days=i) not in blocked_dates
+            ]
+            self.assertEqual(available_work_dates(start, end, weekdays, blocked), esperado)
+
+    def _random_day(self, rng, day, tz, minute_step):
+        blocks = []
+        for _ in range(rng.randint(1, 3)):
+            inicio = rng.randint(6 * 4, 20 * 4) * 15
+            fim = min(inicio + rng.randint(1, 24) * 15, 23 * 60 + 45)
+            blocks.append((time(inicio // 60, inicio % 60), time(fim // 60, fim % 60)))
+        blocks.sort()
+        appointments = []
+        for _ in range(rng.randint(0, 12)):
+            minute = rng.randrange(0, 60, minute_step)
+            start = timezone.make_aware(datetime.combine(day, time(rng.randint(5, 21), minute)), tz)
+            appointments.append((start, start + timedelta(minutes=rng.randrange(minute_step, 120, minute_step))))
+        return blocks, appointments
+
+    def test_day_occupancy_equals_engine_on_grid(self):
+        """Propriedade: com horários na grade, a máscara dá os mesmos slots do motor."""
+        rng = random.Random(17)
+        tz = timezone.get_current_timezone()
+        day = date(2030, 1, 7)
+        for granularity in (1, 5, 15):
+            for _ in range(200):
+                blocks, appointments = self._random_day(rng, day, tz, minute_step=granularity)
+                duration = timedelta(minutes=rng.choice([15, 30, 45, 60, 90]))
+                now = timezone.make_aware(datetime.combine(day, time(rng.randint(0, 23), 0)), tz)
+                occupancy = DayOccupancy.build(day, blocks, appointments, granularity=granularity, tz=tz)
+                self.assertEqual(
+                    occupancy.free_slots(duration, now=now),
+                    compute_available_slots(day, blocks, appointments, duration, now=now, tz=tz),
+                )
+
+    def test_day_occupancy_is_conservative_off_grid(self):
+        """Fora da grade: nunca oferece um horário que o motor exato diria ocupado."""
+        rng = random.Random(71)
+        tz = timezone.get_current_timezone()
+        day = date(2030, 1, 7)
+        for _ in range(300):
+            blocks, appointments = self._random_day(rng, day, tz, minute_step=1)
+            busy = merge_intervals(appointments)
+            occupancy = DayOccupancy.build(day, blocks, appointments, granularity=15, tz=tz)
+            start = timezone.make_aware(datetime.combine(day, time(rng.randint(6, 21), rng.randint(0, 59))), tz)
+            duration = timedelta(minutes=rng.randint(5, 120))
+            if occupancy.fits(start, duration):
+                self.assertTrue(is_interval_free(start, start + duration, busy))
+                self.assertTrue(any(
+                    timezone.make_aware(datetime.combine(day, ini), tz) <= start
+                    and start + duration <= timezone.make_aware(datetime.combine(day, fim), tz)
+                    for ini, fim in merge_intervals(blocks)
+                ))
+
+    def test_calendar_masks_round_conservatively(self):
+        # 9:07-12:00 aberto vira 9:10-12:00; 13:02-13:58 fechado vira 13:00-14:00
+        aberto = interval_mask(time(9, 7), time(12, 0), 5)
+        self.assertEqual(mask_to_blocks(aberto, 5), [(time(9, 10), time(12, 0))])
+        dia = interval_mask(time(9, 0), time(18, 0), 5) & ~interval_mask(time(13, 2), time(13, 58), 5, outward=True)
+        self.assertEqual(mask_to_blocks(dia, 5), [(time(9, 0), time(13, 0)), (time(14, 0), time(18, 0))])
+        self.assertEqual(mask_to_blocks(0, 5), [])
+
+class QueryPlanIndexTests(TestCase):
+    """
+    Garante que as queries de colisão/folga usam os índices compostos
+    (migração 0005). Roda EXPLAIN no SQLite de teste; o formato do plano
+    muda por banco, mas o nome do índice aparece em todos.
+    """
+
+    def setUp(self):
+        self.start = timezone.now() + timedelta(days=1)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        # E nada de varredura completa da tabela
+        self.assertNotIn("SCAN core_", plan)
+
+    def test_collision_query_uses_appointment_index(self):
+        # Mesmo formato de AppointmentSerializer.validate (for_barber_day().active());
+        # o create não consulta: conta com a UNIQUE de SlotReservation
+        queryset = Appointment.objects.for_barber_day(1, self.start.date()).active()
+        self.assertUsesIndex(queryset, "appt_barber_inicio_fim_idx")
+
+    def test_day_range_query_uses_covering_index(self):
+        # Mesmo formato das queries de slots (intervalos do dia)
+        queryset = Appointment.objects.for_barber_day(
+            1, self.start.date()
+        ).active().values_list("data_hora_inicio", "data_hora_fim")
+        self.assertUsesIndex(queryset, "appt_barber_inicio_fim_idx")
+        # O range do dia é usado no índice (sem função sobre a coluna)
+        self.assertIn("data_hora_inicio>", queryset.explain())
+
+    def test_for_barber_day_matches_local_day_boundaries(self):
+        """for_barber_day pega o dia LOCAL, igual ao antigo __date=."""
+        user = User.objects.create_user(username="plano", password="123", is_barber=True)
+        barber = BarberProfile.objects.create(user=user, nome_exibicao="Plano")
+        service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        barber_service = BarberService.objects.create(barber=barber, service=service, preco=50)
+        dia = date(2030, 3, 4)
+        with timezone.override("America/Sao_Paulo"):
+            tz = timezone.get_current_timezone()
+            horarios = [
+                datetime.combine(dia - timedelta(days=1), time(23, 30)),
+                datetime.combine(dia, time(0, 0)),
+                datetime.combine(dia, time(23, 30)),
+                datetime.combine(dia + timedelta(days=1), time(0, 0)),
+            ]
+            for inicio in horarios:
+                inicio = timezone.make_aware(inicio, tz)
+                Appointment.objects.create(
+                    barber=barber, barber_service=barber_service,
+                    cliente_nome="X", cliente_telefone="1",
+                    data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(minutes=30),
+                )
+            por_range = set(Appointment.objects.for_barber_day(barber, dia).values_list("id", flat=True))
+            por_date = set(Appointment.objects.filter(
+                barber=barber, data_hora_inicio__date=dia
+            ).values_list("id", flat=True))
+        self.assertEqual(len(por_range), 2)
+        self.assertEqual(por_range, por_date)
+
+    def test_bloqueio_query_uses_bloqueio_index(self):
+        dia = self.start.date()
+        queryset = Bloqueio.objects.filter(
+            barber__id=1, data_inicio__lte=dia, data_fim__gte=dia
+        )
+        self.assertUsesIndex(queryset, "bloqueio_barber_datas_idx")
+
+
+class DoubleBookingStressTests(TransactionTestCase):
+    """
+    Várias threads tentam reservar ao mesmo tempo. Todas passam pelo
+    validate() antes de qualquer INSERT (o pior caso da corrida); a UNIQUE
+    de SlotReservation tem que deixar passar só um agendamento por horário.
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(username="stress", password="123", is_barber=True)
+        self.barber = BarberProfile.objects.create(user=user, nome_exibicao="Stress")
+        self.service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        BarberService.objects.create(barber=self.barber, service=self.service, preco=50)
+        self.day = timezone.localdate() + timedelta(days=2)
+
+    def _payload(self, hour, minute, n):
+        start = timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+        return {
+            "barber_id": self.barber.id,
+            "service_id": self.service.id,
+            "start_datetime": start.isoformat(),
+            "client_name": f"Cliente {n}",
+            "client_phone": "11999999999",
+        }
+
+    def test_concurrent_bookings_never_double_book(self):
+        # 10h00 e 10h15 se sobrepõem (30min); 11h00 e 14h00 são independentes
+        horarios = [(10, 0), (10, 15), (11, 0), (14, 0)] * 6
+        serializers_ = []
+        for n, (hour, minute) in enumerate(horarios):
+            serializer = AppointmentSerializer(data=self._payload(hour, minute, n))
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializers_.append(serializer)
+
+        barrier = threading.Barrier(len(serializers_))
+        results = []
+
+        def book(serializer):
+            barrier.wait()
+            for _ in range(50):
+                try:
+                    serializer.save()
+                    results.append("ok")
+                    return
+                except DRFValidationError:
+                    results.append("colisao")
+                    return
+                except OperationalError:
+                    # SQLite de teste trava o banco inteiro na escrita; tenta de novo
+                    time_module.sleep(0.01)
+                finally:
+                    connection.close()
+            results.append("desistiu")
+
+        threads = [threading.Thread(target=book, args=(s,)) for s in serializers_]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertNotIn("desistiu", results)
+        active = list(
+            Appointment.objects.filter(barber=self.barber).active().order_by("data_hora_inicio")
+        )
+        # Um para o grupo 10h00/10h15, um às 11h00 e um às 14h00
+        self.assertEqual(len(active), 3)
+        self.assertEqual(results.count("ok"), 3)
+        for first, second in zip(active, active[1:]):
+            self.assertLessEqual(first.data_hora_fim, second.data_hora_inicio)
+
+    def test_cancel_releases_reservation(self):
+        payload = self._payload(15, 0, 0)
+        serializer = AppointmentSerializer(data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        appointment = serializer.save()
+        self.assertEqual(appointment.slot_reservations.count(), 6)  # 30min / 5min
+
+        appointment.status = "cancelado"
+        appointment.save()
+        self.assertFalse(SlotReservation.objects.filter(barber=self.barber).exists())
+
+        serializer = AppointmentSerializer(data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+    def test_confirm_does_not_rebuild_reservations(self):
+        serializer = AppointmentSerializer(data=self._payload(16, 0, 0))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        first = serializer.save()
+
+        # Agendamento legado sobreposto, sem reservas (backfill com ignore_conflicts)
+        legacy = Appointment.objects.create(
+            barber=self.barber, barber_service=first.barber_service,
+            cliente_nome="Legado", cliente_telefone="123",
+            data_hora_inicio=first.data_hora_inicio, data_hora_fim=first.data_hora_fim,
+            status="cancelado",
+        )
+        Appointment.objects.filter(pk=legacy.pk).update(status="pendente")
+
+        # pendente -> confirmado não mexe nos buckets: nada de IntegrityError
+        legacy = Appointment.objects.get(pk=legacy.pk)
+        legacy.status = "confirmado"
+        legacy.save()
+        self.assertFalse(legacy.slot_reservations.exists())
+        self.assertEqual(first.slot_reservations.count(), 6)
+
+    def test_prune_deletes_only_past_reservations(self):
+        barber_service = BarberService.objects.get(barber=self.barber)
+        appointments = []
+        for days in (-3, 2):
+            start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=days), time(10, 0)))
+            appointments.append(Appointment.objects.create(
+                barber=self.barber, barber_service=barber_service,
+                cliente_nome="Cliente", cliente_telefone="123",
+                data_hora_inicio=start, data_hora_fim=start + timedelta(minutes=30),
+            ))
+        passado, futuro = appointments
+
+        out = io.StringIO()
+        call_command("prune_slot_reservations", stdout=out)
+        self.assertFalse(passado.slot_reservations.exists())
+        self.assertEqual(futuro.slot_reservations.count(), 6)
+        self.assertIn("reserva(s) de slot apagada(s)", out.getvalue())
+
+class _FakeWhatsAppHandler(BaseHTTPRequestHandler):
+    """Endpoint HTTP local que imita a API do WhatsApp (sem internet)."""
+    protocol_version = "HTTP/1.1"  # Aceita keep-alive, como a API real
+    respostas = []  # status HTTP a devolver, em ordem (padrão: 201)
+    recebidos = []
+    conexoes = 0
+
+    def setup(self):
+        type(self).conexoes += 1
+        super().setup()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.recebidos.append(parse_qs(self.rfile.read(length).decode()))
+        self.send_response(self.respostas.pop(0) if self.respostas else 201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class NotificationOutboxTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(("127.0.0.1", 0), _FakeWhatsAppHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.fake_url = f"http://127.0.0.1:{cls.server.server_port}/Messages.json"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        _FakeWhatsAppHandler.respostas = []
+        _FakeWhatsAppHandler.recebidos = []
+        _FakeWhatsAppHandler.conexoes = 0
+        LocMemBackend.outbox = []
+        LocMemBackend.falhas = []
+        cache.clear()  # Zera o AppointmentRateThrottle entre os testes
+        user = User.objects.create_user(username="notif", password="123", is_barber=True)
+        self.barber = BarberProfile.objects.create(
+            user=user, nome_exibicao="Notif", telefone_whatsapp="(34) 99999-8888"
+        )
+        service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        BarberService.objects.create(barber=self.barber, service=service, preco=50)
+        start = (timezone.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        self.payload = {
+            "barber_id": self.barber.id,
+            "service_id": service.id,
+            "start_datetime": start.isoformat(),
+            "client_name": "Cliente Notif",
+            "client_phone": "11912345678",
+        }
+
+    def _book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("core:create_appointment"), self.payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return NotificationOutbox.objects.get(appointment_id=response.data["id"])
+
+    def test_booking_writes_outbox_and_sends_after_commit(self):
+        with self.settings(WHATSAPP_API_URL=self.fake_url, NOTIFICATION_DISPATCH="sync"):
+            entry = self._book()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, "enviado")
+        self.assertEqual(entry.tentativas, 1)
+        self.assertEqual(len(_FakeWhatsAppHandler.recebidos), 1)
+        self.assertEqual(_FakeWhatsAppHandler.recebidos[0]["To"], ["whatsapp:+5534999998888"])
+
+    def test_collision_does_not_leave_outbox_entry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("core:create_appointment"), self.payload, format="json")
+            response = self.client.post(reverse("core:create_appointment"), self.payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+    def test_worker_retries_with_backoff_until_success(self):
+        _FakeWhatsAppHandler.respostas = [500]
+        with self.settings(WHATSAPP_API_URL=self.fake_url, NOTIFICATION_DISPATCH="sync"):
+            entry = self._book()
+            entry.refresh_from_db()
+            self.assertEqual(entry.status, "pendente")
+            self.assertEqual(entry.tentativas, 1)
+            self.assertGreater(entry.proxima_tentativa, timezone.now())
+
+            # Ainda no backoff: o worker não reenvia
+            call_command("process_notifications", "--once", stdout=io.StringIO())
+            self.assertEqual(len(_FakeWhatsAppHandler.recebidos), 1)
+
+            NotificationOutbox.objects.filter(pk=entry.pk).update(proxima_tentativa=timezone.now())
+            call_command("process_notifications", "--once", stdout=io.StringIO())
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, "enviado")
+        self.assertEqual(entry.tentativas, 2)
+        self.assertEqual(len(_FakeWhatsAppHandler.recebidos), 2)
+
+    def test_gives_up_after_max_attempts(self):
+        _FakeWhatsAppHandler.respostas = [503, 503]
+        with self.settings(
+            WHATSAPP_API_URL=self.fake_url, NOTIFICATION_DISPATCH="worker", NOTIFICATION_MAX_ATTEMPTS=2
+        ):
+            entry = self._book()
+            self.assertEqual(len(_FakeWhatsAppHandler.recebidos), 0)  # Só o worker envia
+            for _ in range(2):
+                NotificationOutbox.objects.filter(pk=entry.pk).update(proxima_tentativa=timezone.now())
+                call_command("process_notifications", "--once", stdout=io.StringIO())
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, "falhou")
+        self.assertIn("HTTPError", entry.ultimo_erro)
+
+    def _book_many(self, n):
+        base = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=3), time(9, 0)))
+        for i in range(n):
+            self.payload["start_datetime"] = (base + timedelta(minutes=30 * i)).isoformat()
+            self._book()
+
+    def test_worker_flushes_batch_over_one_keepalive_connection(self):
+        with self.settings(WHATSAPP_API_URL=self.fake_url):
+            self._book_many(3)
+            call_command("process_notifications", "--once", stdout=io.StringIO())
+        self.assertEqual(len(_FakeWhatsAppHandler.recebidos), 3)
+        self.assertEqual(_FakeWhatsAppHandler.conexoes, 1)
+        self.assertEqual(NotificationOutbox.objects.filter(status="enviado").count(), 3)
+
+    def test_batch_failure_only_retries_failed_message(self):
+        reset_stats()
+        with self.settings(WHATSAPP_BACKEND="core.notification_transport.LocMemBackend"):
+            self._book_many(3)
+            LocMemBackend.falhas = [False, True, False]
+            enviadas, nao_enviadas = notifications.drain()
+        self.assertEqual((enviadas, nao_enviadas), (2, 1))
+        self.assertEqual(len(LocMemBackend.outbox), 2)
+        self.assertEqual(NotificationOutbox.objects.filter(status="pendente", tentativas=1).count(), 1)
+        stats = get_stats()
+        self.assertEqual((stats["enviados"], stats["erros"], stats["lotes"]), (2, 1, 1))
+
+
+class BenchBookingCommandTests(TestCase):
+
+    def test_bench_reports_percentiles_and_queries_as_json(self):
+        out = io.StringIO()
+        call_command(
+            "bench_booking", "--current-db", "--barbers=2", "--services=3",
+            "--appointments=30", "--requests=5", stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["params"]["barbers"], 2)
+        for view in ("GetAvailableSlotsView", "GetBarberAvailableDatesView", "CreateAppointmentView", "PainelView"):
+            result = report["results"][view]
+            self.assertEqual(result["requests"], 5)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+            self.assertLessEqual(result["p95_ms"], result["p99_ms"])
+            self.assertIn("queries_max", result)
+        self.assertEqual(report["results"]["PainelView"]["status"], {"200": 5})
+
+    def test_current_db_works_outside_the_test_environment(self):
+        # Como rodar o comando direto (manage.py): sem o "testserver" no ALLOWED_HOSTS
+        teardown_test_environment()
+        try:
+            self.assertNotIn("testserver", settings.ALLOWED_HOSTS)
+            out = io.StringIO()
+            call_command(
+                "bench_booking", "--current-db", "--barbers=1", "--services=2",
+                "--appointments=5", "--requests=2", stdout=out,
+            )
+        finally:
+            setup_test_environment()
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["results"]["GetAvailableSlotsView"]["status"], {"200": 2})
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Cada view tem um orçamento fixo de queries (core/testing.py) e o número
+    de queries não pode crescer com o volume de dados (N+1).
+    """
+    SIZES = (1, 5, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() + timedelta(days=1)
+        while cls.day.weekday() != 0:  # Segunda-feira
+            cls.day += timedelta(days=1)
+        # Sem senha: o hash (PBKDF2) dominava o tempo destes testes
+        cls.user = User.objects.create(username="budget", is_barber=True)
+        cls.barber = BarberProfile.objects.create(user=cls.user, nome_exibicao="Budget")
+        cls.service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        cls.bs = BarberService.objects.create(barber=cls.barber, service=cls.service, preco=50)
+
+    def setUp(self):
+        cache.clear()
+        self.created = 0
+
+    def populate(self, size):
+        """Cresce até 'size' barbeiros/serviços extras e agendamentos do barbeiro principal."""
+        for i in range(self.created, size):
+            user = User.objects.create(username=f"budget_{i}", is_barber=True)
+            barber = BarberProfile.objects.create(user=user, nome_exibicao=f"Barbeiro {i}")
+            service = Service.objects.create(nome=f"Serviço {i}", duracao=timedelta(minutes=45))
+            BarberService.objects.create(barber=self.barber, service=service, preco=40)
+            BarberService.objects.create(barber=barber, service=service, preco=40)
+            Availability.objects.create(
+                barber=self.barber, dia_da_semana=i % 7, hora_inicio=time(8 + i % 12, 0), hora_fim=time(20, 0)
+            )
+            Bloqueio.objects.create(
+                barber=self.barber,
+                data_inicio=self.day + timedelta(days=30 + i),
+                data_fim=self.day + timedelta(days=30 + i),
+            )
+            start = timezone.make_aware(datetime.combine(self.day + timedelta(days=i // 8), time(9, 0)))
+            start += timedelta(hours=i % 8)
+            Appointment.objects.create(
+                barber=self.barber, barber_service=self.bs,
+                cliente_nome=f"Cliente {i}", cliente_telefone="11999999999",
+                data_hora_inicio=start, data_hora_fim=start + timedelta(minutes=30),
+                status="confirmado" if i % 2 else "pendente",
+            )
+        self.created = size
+        cache.clear()  # Mede sempre o caminho sem cache
+
+    def test_homepage(self):
+        url = reverse("core:homepage")
+        self.assertConstantQueries("core:homepage", self.SIZES, self.populate, lambda: self.client.get(url))
+
+    def test_homepage_steady_state_does_not_hit_database(self):
+        self.populate(5)
+        url = reverse("core:homepage")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Barbeiro 4")
+        self.assertContains(response, "Serviço 4 (45min)")
+
+    def test_homepage_catalog_invalidated_by_changes(self):
+        self.populate(1)
+        url = reverse("core:homepage")
+        self.assertContains(self.client.get(url), "Barbeiro 0")
+
+        barber = BarberProfile.objects.get(nome_exibicao="Barbeiro 0")
+        barber.nome_exibicao = "Barbeiro Renomeado"
+        barber.save()
+        self.service.nome = "Corte Navalha"
+        self.service.save()
+        self.bs.preco = Decimal("77.50")
+        self.bs.save()
+
+        response = self.client.get(url)
+        self.assertNotContains(response, "Barbeiro 0")
+        self.assertContains(response, "Barbeiro Renomeado")
+        self.assertContains(response, "Corte Navalha")
+        self.assertContains(response, "77.50")
+
+    def test_painel(self):
+        self.client.force_login(self.user)
+        url = reverse("core:painel")
+        self.assertConstantQueries("core:painel", self.SIZES, self.populate, lambda: self.client.get(url))
+
+    def test_get_available_slots(self):
+        url = reverse("core:get_available_slots")
+        params = {"barber_id": self.barber.id, "service_id": self.service.id, "date": self.day.isoformat()}
+        self.assertConstantQueries(
+            "core:get_available_slots", self.SIZES, self.populate, lambda: self.client.get(url, params)
+        )
+
+    def test_get_available_slots_range(self):
+        url = reverse("core:get_available_slots_range")
+        params = {
+            "barber_id": self.barber.id, "service_id": self.service.id,
+            "start": self.day.isoformat(), "end": (self.day + timedelta(days=13)).isoformat(),
+        }
+        self.assertConstantQueries(
+            "core:get_available_slots_range", self.SIZES, self.populate, lambda: self.client.get(url, params)
+        )
+
+    def test_first_available_slots(self):
+        """Mais barbeiros oferecendo o serviço não pode significar mais queries."""
+        url = reverse("core:first_available_slots")
+        params = {"service_id": self.service.id, "start": self.day.isoformat(), "limit": 20}
+        extra = []
+
+        def populate(size):
+            for i in range(len(extra), size * 4):
+                user = User.objects.create(username=f"any_{i}", is_barber=True)
+                barber = BarberProfile.objects.create(user=user, nome_exibicao=f"Qualquer {i}")
+                bs = BarberService.objects.create(barber=barber, service=self.service, preco=30)
+                Availability.objects.create(barber=barber, dia_da_semana=i % 7, hora_inicio=time(9), hora_fim=time(18))
+                AvailabilityOverride.objects.create(
+                    barber=barber, data=self.day, hora_inicio=time(12), hora_fim=time(13), tipo="fechado"
+                )
+                start = timezone.make_aware(datetime.combine(self.day, time(9)))
+                Appointment.objects.create(
+                    barber=barber, barber_service=bs, cliente_nome="C", cliente_telefone="1",
+                    data_hora_inicio=start, data_hora_fim=start + timedelta(minutes=30),
+                )
+                extra.append(barber)
+            cache.clear()
+
+        self.assertConstantQueries(
+            "core:first_available_slots", self.SIZES, populate, lambda: self.client.get(url, params)
+        )
+
+    def test_get_barber_available_dates(self):
+        url = reverse("core:get_barber_available_dates", args=[self.barber.id])
+        self.assertConstantQueries(
+            "core:get_barber_available_dates", self.SIZES, self.populate, lambda: self.client.get(url)
+        )
+
+    def test_cached_slots_do_not_hit_database(self):
+        self.populate(5)
+        url = reverse("core:get_available_slots")
+        params = {"barber_id": self.barber.id, "service_id": self.service.id, "date": self.day.isoformat()}
+        self.client.get(url, params)
+        with self.assertNumQueries(0):
+            self.client.get(url, params)
+
+    def test_create_appointment(self):
+        def book():
+            cache.clear()  # AppointmentRateThrottle
+            self.booked = getattr(self, "booked", 0) + 1
+            start = timezone.make_aware(datetime.combine(self.day + timedelta(days=14), time(6, 0)))
+            start += timedelta(minutes=30 * self.booked)
+            response = self.client.post(reverse("core:create_appointment"), {
+                "barber_id": self.barber.id, "service_id": self.service.id,
+                "start_datetime": start.isoformat(),
+                "client_name": "Budget", "client_phone": "11912345678",
+            }, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+            return response
+
+        self.assertConstantQueries("core:create_appointment", self.SIZES, self.populate, book)
+
+    def test_success_page(self):
+        self.populate(1)
+        appointment = Appointment.objects.first()
+        url = reverse("core:success_page", args=[appointment.pk])
+        token = Signer().sign(appointment.pk)
+        response = self.assertQueryBudget("core:success_page", self.client.get, url, {"token": token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_confirm_and_cancel(self):
+        self.client.force_login(self.user)
+
+        def post(url_name):
+            appointment = Appointment.objects.filter(status="pendente").last()
+            return lambda: self.client.post(reverse(f"core:{url_name}", args=[appointment.pk]))
+
+        for url_name in ("confirm_appointment", "cancel_appointment"):
+            with self.subTest(url_name):
+                self.populate(3)
+                response = self.assertQueryBudget(f"core:{url_name}", post(url_name))
+                self.assertEqual(response.status_code, 302)
+
+
+class ScheduleAPITests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="agenda", password="123", is_barber=True)
+        self.barber = BarberProfile.objects.create(user=self.user, nome_exibicao="Agenda")
+        self.url = reverse("core:schedule")
+        self.client.force_authenticate(self.user)
+        self.hoje = timezone.now().date()
+        self.semana = {
+            "availability": [
+                {"dia_da_semana": dia, "hora_inicio": inicio, "hora_fim": fim}
+                for dia in range(6)
+                for inicio, fim in (("09:00", "12:00"), ("13:00", "19:00"))
+            ],
+            "bloqueios": [
+                {"data_inicio": str(self.hoje + timedelta(days=10)), "data_fim": str(self.hoje + timedelta(days=20)), "motivo": "Férias"},
+            ],
+        }
+
+    def test_put_creates_whole_week_in_one_request(self):
+        response = self.client.put(self.url, self.semana, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(Availability.objects.filter(barber=self.barber).count(), 12)
+        self.assertEqual(len(response.data["availability"]), 12)
+        self.assertEqual(response.data["bloqueios"][0]["motivo"], "Férias")
+        self.assertEqual(self.client.get(self.url).data, response.data)
+
+    def test_put_updates_by_id_and_removes_missing_blocks(self):
+        saved = self.client.put(self.url, self.semana, format="json").data
+        dates_url = reverse("core:get_barber_available_dates", args=[self.barber.id])
+        self.assertTrue(self.client.get(dates_url).json()["available_dates"])
+
+        # Só segunda de manhã, esticada até 13h; sem folgas
+        first = dict(saved["availability"][0], hora_fim="13:00")
+        response = self.client.put(self.url, {"availability": [first], "bloqueios": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        bloco = Availability.objects.get(barber=self.barber)
+        self.assertEqual((bloco.pk, bloco.hora_fim), (first["id"], time(13, 0)))
+        self.assertFalse(Bloqueio.objects.filter(barber=self.barber).exists())
+
+        # bulk_update/bulk_create não disparam sinais: o cache foi invalidado na mão
+        dates = self.client.get(dates_url).json()["available_dates"]
+        self.assertTrue(all(date.fromisoformat(d).weekday() == 0 for d in dates))
+
+    def test_put_rejects_overlaps_and_changes_nothing(self):
+        self.semana["availability"].append({"dia_da_semana": 0, "hora_inicio": "11:00", "hora_fim": "14:00"})
+        self.semana["bloqueios"].append(
+            {"data_inicio": str(self.hoje + timedelta(days=20)), "data_fim": str(self.hoje + timedelta(days=22))}
+        )
+        response = self.client.put(self.url, self.semana, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("availability", response.data)
+        self.assertIn("bloqueios", response.data)
+        self.assertFalse(Availability.objects.exists())
+
+    def test_put_rejects_ids_of_other_barber(self):
+        other = BarberProfile.objects.create(
+            user=User.objects.create_user(username="outro", password="123", is_barber=True), nome_exibicao="Outro"
+        )
+        bloco = Availability.objects.create(barber=other, dia_da_semana=0, hora_inicio=time(9), hora_fim=time(10))
+        payload = {"availability": [{"id": bloco.pk, "dia_da_semana": 1, "hora_inicio": "09:00", "hora_fim": "10:00"}]}
+        response = self.client.put(self.url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        bloco.refresh_from_db()
+        self.assertEqual(bloco.dia_da_semana, 0)
+
+    def test_non_barber_is_forbidden(self):
+        self.client.force_authenticate(User.objects.create_user(username="cliente", password="123"))
+        self.assertEqual(self.client.put(self.url, self.semana, format="json").status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PerformanceMiddlewareTests(APITestCase):
+    """Server-Timing + log estruturado por request (core/instrumentation.py)."""
+
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=1)
+        while self.day.weekday() != 0:
+            self.day += timedelta(days=1)
+        user = User.objects.create_user(username="perf", password="123", is_barber=True)
+        self.barber = BarberProfile.objects.create(user=user, nome_exibicao="Perf")
+        self.service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        BarberService.objects.create(barber=self.barber, service=self.service, preco=50)
+        Availability.objects.create(barber=self.barber, dia_da_semana=0, hora_inicio=time(9), hora_fim=time(12))
+        self.url = reverse("core:get_available_slots")
+        self.params = {"barber_id": self.barber.id, "service_id": self.service.id, "date": self.day.isoformat()}
+
+    @staticmethod
+    def _metrics(response):
+        return {part.split(";")[0]: part for part in response["Server-Timing"].split(", ")}
+
+    def test_sampled_request_reports_db_cache_and_spans(self):
+        with self.settings(PERF_SAMPLE_RATE=1.0), self.assertLogs("core.performance", "INFO") as logs:
+            frio = self.client.get(self.url, self.params)
+            quente = self.client.get(self.url, self.params)
+
+        metrics = self._metrics(frio)
+        self.assertRegex(metrics["db"], r'db;dur=[\d.]+;desc="5 queries"')
+        self.assertIn("slots", metrics)
+        self.assertRegex(metrics["cache"], r"miss=[1-9]")
+
+        metrics = self._metrics(quente)
+        self.assertIn('desc="0 queries"', metrics["db"])
+        self.assertNotIn("slots", metrics)  # Veio do cache
+        self.assertIn("miss=0", metrics["cache"])
+
+        perf = logs.records[0].perf
+        self.assertEqual(perf["view"], "core:get_available_slots")
+        self.assertEqual((perf["status"], perf["db_queries"]), (200, 5))
+        self.assertIn("slots", perf["spans_ms"])
+
+    def test_unsampled_request_is_not_instrumented(self):
+        with self.settings(PERF_SAMPLE_RATE=0.0, PERF_SLOW_REQUEST_MS=0), \
+                self.assertLogs("core.performance", "INFO") as logs:
+            response = self.client.get(self.url, self.params)
+        self.assertFalse(response.has_header("Server-Timing"))
+        # Lento (limite 0ms): loga mesmo fora da amostra, só com o tempo total
+        self.assertEqual(logs.records[0].perf["sampled"], False)
+        self.assertNotIn("db_queries", logs.records[0].perf)
+
+
+class MetricsTests(APITestCase):
+    """/metrics no formato do Prometheus (core/metrics.py)."""
+
+    def setUp(self):
+        cache.clear()  # Throttle
+        self.user = User.objects.create_user(username="metrics", password="123", is_barber=True)
+        self.barber = BarberProfile.objects.create(user=self.user, nome_exibicao="Metrics")
+        self.service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        BarberService.objects.create(barber=self.barber, service=self.service, preco=50)
+        start = (timezone.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        self.payload = {
+            "barber_id": self.barber.id, "service_id": self.service.id,
+            "client_name": "Cliente", "client_phone": "11912345678",
+            "start_datetime": start.isoformat(),
+        }
+
+    @staticmethod
+    def _value(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_endpoint_requires_token_or_staff(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        with self.settings(METRICS_TOKEN="segredo"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer errado").status_code, 404)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer segredo")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"core_bookings_total", response.content)
+
+        self.client.force_login(User.objects.create_user(username="staff", password="123", is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_booking_collision_throttle_and_latency_are_counted(self):
+        url = reverse("core:create_appointment")
+        antes = {
+            "sucesso": self._value("core_bookings_total", resultado="sucesso"),
+            "colisao": self._value("core_bookings_total", resultado="colisao_validacao"),
+            "throttle": self._value("core_throttled_requests_total", scope="anon"),
+            "latencia": self._value("core_request_latency_seconds_count", view="create_appointment"),
+        }
+
+        self.assertEqual(self.client.post(url, self.payload, format="json").status_code, 201)
+        response = self.client.post(url, self.payload, format="json")
+        self.assertIn("acabou de ser reservado", str(response.data))
+        for _ in range(4):  # 5/min: a 6ª tentativa é barrada
+            self.client.post(url, self.payload, format="json")
+
+        self.assertEqual(self._value("core_bookings_total", resultado="sucesso") - antes["sucesso"], 1)
+        self.assertEqual(self._value("core_bookings_total", resultado="colisao_validacao") - antes["colisao"], 4)
+        self.assertEqual(self._value("core_throttled_requests_total", scope="anon") - antes["throttle"], 1)
+        self.assertEqual(
+            self._value("core_request_latency_seconds_count", view="create_appointment") - antes["latencia"], 6
+        )
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    """Logging em JSON, amostrado e sem bloquear quem loga (core/log.py)."""
+
+    def _record(self, name="core.views", level=logging.INFO, **extra):
+        record = logging.LogRecord(name, level, __file__, 1, "Agendamento %s criado", (42,), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter_keeps_extras_and_redacts_pii(self):
+        record = self._record(appointment_id=42, cliente_telefone="11912345678", perf={"to": "5511999998888"})
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual((data["level"], data["logger"], data["msg"]), ("INFO", "core.views", "Agendamento 42 criado"))
+        self.assertEqual(data["appointment_id"], 42)
+        self.assertEqual(data["cliente_telefone"], "[redacted]")
+        self.assertEqual(data["perf"], {"to": "[redacted]"})
+
+    def test_sampling_is_per_logger_prefix_and_never_drops_warnings(self):
+        levels = logger_levels("core=INFO:0,core.performance=DEBUG:1", {"core": ("WARNING", 1.0)})
+        self.assertEqual(levels, {"core": ("INFO", 0.0), "core.performance": ("DEBUG", 1.0)})
+
+        sampling = SamplingFilter({name: rate for name, (_, rate) in levels.items()})
+        self.assertFalse(sampling.filter(self._record("core.views")))
+        self.assertTrue(sampling.filter(self._record("core.views", level=logging.WARNING)))
+        self.assertTrue(sampling.filter(self._record("core.performance")))
+        self.assertTrue(sampling.filter(self._record("django.request")))
+
+    def test_queue_handler_does_not_wait_for_the_stream(self):
+        class SlowStream(io.StringIO):
+            def write(self, text):
+                time_module.sleep(0.2)
+                return super().write(text)
+
+        stream = SlowStream()
+        handler = QueueJsonHandler(stream)
+        try:
+            started = time_module.perf_counter()
+            for _ in range(3):
+                handler.handle(self._record())
+            self.assertLess(time_module.perf_counter() - started, 0.2)
+        finally:
+            handler.close()  # Espera a fila esvaziar
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])["msg"], "Agendamento 42 criado")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "precisa de fork()")
+    def test_queue_handler_writes_after_fork(self):
+        # Como no 'gunicorn --preload': o handler nasce (e loga) no master, o
+        # worker é um fork e tem que ter o seu próprio listener
+        read_fd, write_fd = os.pipe()
+        stream = os.fdopen(write_fd, "w")
+        handler = QueueJsonHandler(stream)
+        handler.handle(self._record(name="master"))
+        pid = os.fork()
+        if pid == 0:  # Processo filho
+            try:
+                handler.handle(self._record(name="worker"))
+                handler.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        handler.close()
+        stream.close()  # Fecha a escrita do pipe: a leitura abaixo termina
+        with os.fdopen(read_fd) as pipe:
+            loggers = [json.loads(line)["logger"] for line in pipe.read().splitlines()]
+        self.assertEqual(sorted(loggers), ["master", "worker"])
+
+
+@override_settings(READ_REPLICA_ALIAS="replica", READ_REPLICA_MAX_LAG_SECONDS=0)
+class ReadReplicaRouterTests(TestCase):
+    """Réplica de leitura + read-your-writes (core/db_router.py)."""
+
+    # Dois SQLite separados: o que está só na "réplica" prova de onde veio a leitura
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="replica", password="123", is_barber=True)
+        self.barber = BarberProfile.objects.create(user=self.user, nome_exibicao="Nome no Primario")
+        service = Service.objects.create(nome="Corte", duracao=timedelta(minutes=30))
+        self.barber_service = BarberService.objects.create(barber=self.barber, service=service, preco=50)
+        for weekday in range(7):
+            Availability.objects.create(
+                barber=self.barber, dia_da_semana=weekday, hora_inicio=time(9), hora_fim=time(18)
+            )
+        # A réplica "atrasada": o barbeiro ainda sem agenda e com o nome antigo
+        User.objects.using("replica").create(id=self.user.id, username="replica", is_barber=True)
+        BarberProfile.objects.using("replica").create(
+            id=self.barber.id, user_id=self.user.id, nome_exibicao="Nome na Replica"
+        )
+        self.dates_url = reverse("core:get_barber_available_dates", args=[self.barber.id])
+
+    def _dates(self):
+        cache.clear()  # Sempre do banco, não do cache
+        return self.client.get(self.dates_url).json()["available_dates"]
+
+    def test_read_only_views_read_from_replica(self):
+        self.assertEqual(self._dates(), [])
+        response = self.client.get(reverse("core:homepage"))
+        self.assertContains(response, "Nome na Replica")
+        self.assertNotContains(response, "Nome no Primario")
+        self.assertNotIn(db_router.STICKY_COOKIE, response.cookies)
+
+    def test_write_sticks_the_client_to_the_primary(self):
+        start = timezone.now() + timedelta(days=1)
+        appointment = Appointment.objects.create(
+            barber=self.barber, barber_service=self.barber_service,
+            cliente_nome="Cliente", cliente_telefone="123",
+            data_hora_inicio=start, data_hora_fim=start + timedelta(minutes=30),
+        )
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse("core:confirm_appointment", args=[appointment.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+
+        # Quem escreveu lê do primário; os outros continuam na réplica
+        self.assertNotEqual(self._dates(), [])
+        self.client.cookies.pop(db_router.STICKY_COOKIE)
+        self.assertEqual(self._dates(), [])
+
+    def test_recent_change_is_read_from_primary(self):
+        # A versão do cache foi criada agora: mais nova que o atraso da réplica
+        with self.settings(READ_REPLICA_MAX_LAG_SECONDS=60):
+            self.assertNotEqual(self._dates(), [])
+
+    def test_without_replica_everything_reads_from_default(self):
+        with self.settings(READ_REPLICA_ALIAS=None):
+            self.assertNotEqual(self._dates(), [])
+
+
+class PersistentConnectionTests(SimpleTestCase):
+    """
+    Conexões persistentes (DB_CONN_MAX_AGE/DB_CONN_HEALTH_CHECKS em
+    config/settings.py, core/db_connections.py). O banco de teste é SQLite
+    em memória, que o Django nunca fecha: a contagem usa um SQLite em
+    arquivo com as mesmas opções. Cada abertura = um connect (e, no MariaDB,
+    um init_command/charset).
+    """
+
+    # Libera o backend sqlite3 (o banco de teste em si não é usado)
+    databases = {"default"}
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = f"{tmp.name}/probe.sqlite3"
+        self.opens = []
+
+        def count(sender, connection, **kwargs):
+            if connection.settings_dict["NAME"] == self.path:
+                self.opens.append(connection.alias)
+
+        connection_created.connect(count, weak=False, dispatch_uid="probe")
+        self.addCleanup(connection_created.disconnect, dispatch_uid="probe")
+
+    def _connections(self, max_age):
+        handler = ConnectionHandler({"default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": self.path,
+            "CONN_MAX_AGE": max_age,
+            "CONN_HEALTH_CHECKS": settings.DB_CONN_HEALTH_CHECKS,
+        }})
+        self.addCleanup(handler.close_all)
+        return handler
+
+    def _burst(self, handler, requests=20):
+        # Ciclo de request do Django: close_old_connections() no início e no fim
+        with mock.patch("django.db.connections", handler):
+            for _ in range(requests):
+                request_started.send(sender=self.__class__)
+                with handler["default"].cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                request_finished.send(sender=self.__class__)
+
+    def test_burst_of_requests_reuses_one_connection(self):
+        self.assertGreater(settings.DB_CONN_MAX_AGE, 0)
+        self._burst(self._connections(settings.DB_CONN_MAX_AGE))
+        self.assertEqual(len(self.opens), 1)
+
+    def test_without_max_age_every_request_connects(self):
+        self._burst(self._connections(0))
+        self.assertEqual(len(self.opens), 20)
+
+    def test_job_thread_reuses_its_connection(self):
+        handler = self._connections(settings.DB_CONN_MAX_AGE)
+
+        def job():
+            with db_connections.connection_cycle():
+                with handler["default"].cursor() as cursor:
+                    cursor.execute("SELECT 1")
+
+        with mock.patch.object(db_connections, "connections", handler), \
+                ThreadPoolExecutor(max_workers=1) as executor:
+            for future in [executor.submit(job) for _ in range(10)]:
+                future.result()
+            executor.submit(handler.close_all).result()  # A conexão é da thread
+        self.assertEqual(len(self.opens), 1)
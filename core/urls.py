@@ -27,8 +27,16 @@ urlpatterns = [
     ),
     
     path('api/profile/photo/', views.ProfilePhotoUploadView.as_view(), name='profile_photo_upload'),
+
+    path('api/painel/schedule/', views.ScheduleView.as_view(), name='schedule'),
     
     path('painel/', views.PainelView.as_view(), name='painel'),
+
+    path(
+        'painel/api/agendamentos/', 
+        views.UpcomingAppointmentsView.as_view(), 
+        name='upcoming_appointments'
+    ),
     
     path(
         'painel/horario/delete/<int:pk>/', 
@@ -42,6 +50,18 @@ urlpatterns = [
         name='get_available_slots'
     ),
     
+    path(
+        'api/get-available-slots-range/', 
+        views.GetAvailableSlotsRangeView.as_view(), 
+        name='get_available_slots_range'
+    ),
+
+    path(
+        'api/first-available-slots/',
+        views.FirstAvailableSlotsView.as_view(),
+        name='first_available_slots'
+    ),
+    
     path(
         'api/create-appointment/', 
         views.CreateAppointmentView.as_view(), 
@@ -1,5 +1,8 @@
+import hashlib
+import logging
 import os
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.views.generic import ListView, View, TemplateView, DetailView 
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.views import LoginView
@@ -9,24 +12,47 @@ from django.core.signing import Signer, BadSignature
 from .forms import AvailabilityForm, BloqueioForm , ServiceForm
 from django.urls import reverse_lazy
 from django.http import JsonResponse
-from datetime import datetime, time, timedelta
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from datetime import datetime, timedelta
 from uuid import uuid4
-from .models import BarberService, Appointment, Availability, BarberProfile, Service, Bloqueio
+from .models import BarberService, Appointment, Availability, AvailabilityOverride, BarberProfile, Service, Bloqueio
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.throttling import AnonRateThrottle
-from .serializers import AppointmentSerializer
+from .serializers import (
+    AppointmentSerializer, AvailabilityBlockSerializer, AvailabilityOverrideSerializer, BloqueioRangeSerializer,
+    ScheduleSerializer,
+)
+from .first_available import first_available_slots
+from .images import photo_files, save_profile_photo
+from .pagination import upcoming_appointments_page
+from .occupancy import DayOccupancy
+from .slots import compute_available_slots_by_day
+from . import availability_cache, barber_calendar, catalog, db_router, instrumentation, metrics, storage_jobs
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import DetailView
 
+logger = logging.getLogger(__name__)
+
 
 class AppointmentRateThrottle(AnonRateThrottle):
     """Limita quantos agendamentos anônimos podem ser criados por minuto."""
     rate = '5/min'
 
+    def allow_request(self, request, view):
+        allowed = super().allow_request(request, view)
+        if not allowed:
+            metrics.throttled(self.scope)
+        return allowed
+
 
 class CoreLoginView(LoginView):
     template_name = 'core/login.html'
@@ -64,9 +90,15 @@ class HomePageView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Busca todos os barbeiros e serviços para o cliente escolher
-        context['barbers'] = BarberProfile.objects.all()
-        context['services'] = Service.objects.all()
+        # Barbeiros e serviços vêm do snapshot em cache (core/catalog.py).
+        # O template guarda o HTML do catálogo com {% cache %} usando a
+        # mesma versão; o snapshot só é lido se o fragmento não estiver lá.
+        version = catalog.catalog_version()
+        # Catálogo mudou agora? A réplica pode não ter recebido (core/db_router.py)
+        db_router.pin_primary_if_recent(availability_cache.version_timestamp(version))
+        context['catalog_version'] = version
+        context['catalog_timeout'] = catalog.CATALOG_CACHE_TIMEOUT
+        context['catalog'] = SimpleLazyObject(lambda: catalog.get_snapshot(version))
         return context
 
 # ---
@@ -102,14 +134,10 @@ class PainelView(BarberRequiredMixin, ListView):
             profile = self.request.user.barber_profile
             context['barber_profile'] = profile
             
-            hoje = timezone.localdate()
-            tz = timezone.get_current_timezone()
-            start_of_today = timezone.make_aware(datetime.combine(hoje, time.min), tz)
-            context['proximos_agendamentos'] = Appointment.objects.filter(
-                barber=profile,
-                data_hora_inicio__gte=start_of_today,
-                status__in=['pendente', 'confirmado'],
-            ).select_related('barber_service', 'barber_service__service').order_by('data_hora_inicio')
+            # Só a primeira página (keyset); o resto vem por rolagem infinita
+            context['proximos_agendamentos'], context['proximos_cursor'] = (
+                upcoming_appointments_page(profile)
+            )
             
             # --- FORMULÁRIOS ---
             if 'availability_form' not in context:
@@ -179,6 +207,32 @@ class PainelView(BarberRequiredMixin, ListView):
         context.update(self.get_context_data(**context))
         return render(request, self.template_name, context)
     
+# ---
+# API do Painel: próximas páginas dos agendamentos (rolagem infinita)
+# ---
+class UpcomingAppointmentsView(BarberRequiredMixin, View):
+    """
+    GET ?cursor=<next_cursor da página anterior>. Devolve os dados da
+    página, o HTML pronto dos itens e o cursor da próxima (ou null).
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            profile = request.user.barber_profile
+        except BarberProfile.DoesNotExist:
+            raise PermissionDenied("Perfil de barbeiro não encontrado.")
+
+        try:
+            rows, next_cursor = upcoming_appointments_page(profile, cursor=request.GET.get('cursor'))
+        except (ValueError, OverflowError):
+            return JsonResponse({'error': 'Cursor inválido'}, status=400)
+
+        html = ''.join(
+            render_to_string('core/painel_agendamento.html', {'appt': row}, request=request)
+            for row in rows
+        )
+        return JsonResponse({'results': rows, 'html': html, 'next_cursor': next_cursor})
+
 class DeleteAvailabilityView(BarberRequiredMixin, View):
     """
     Esta view recebe um POST, checa a permissão e deleta o horário.
@@ -207,6 +261,40 @@ class DeleteAvailabilityView(BarberRequiredMixin, View):
         # 5. Redirecione de volta para o painel
         return redirect(reverse_lazy('core:painel'))
     
+# ---
+# GET condicional (ETag/Last-Modified) das APIs de disponibilidade
+# ---
+def _validators(cache_key, last_modified, now=None):
+    """
+    ETag forte (hash da chave versionada do cache) e Last-Modified. 'now'
+    (truncado no minuto) entra quando a resposta depende da hora atual.
+    """
+    if now is not None:
+        now = now.replace(second=0, microsecond=0)
+        cache_key = f'{cache_key}:{now.isoformat()}'
+        last_modified = max(last_modified, now) if last_modified else None
+    etag = quote_etag(hashlib.md5(cache_key.encode(), usedforsecurity=False).hexdigest())
+    return etag, last_modified
+
+
+def _not_modified(request, etag, last_modified):
+    """Resposta 304 se o cliente já tem esta versão; senão None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        _set_validators(response, etag, last_modified)
+    return response
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # O navegador/CDN pode guardar, mas sempre revalida (a agenda muda a qualquer hora)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
 # ---
 # API VIEW: Para buscar Slots Disponíveis
 # ---
@@ -231,104 +319,215 @@ class GetAvailableSlotsView(View):
         except (TypeError, ValueError, AttributeError):
             return JsonResponse({'error': 'Parâmetros inválidos'}, status=400)
 
-        # 2. Encontrar os objetos no banco (sem mudança aqui)
+        # Pega o timezone padrão (ex: UTC, como definido no settings.py)
+        default_tz = timezone.get_current_timezone()
+
+        # 2. Cache (core/availability_cache.py). A chave é lida ANTES do cálculo.
+        cache_key, last_modified = availability_cache.day_slots_state(barber_id, service_id, selected_date)
+        db_router.pin_primary_if_recent(last_modified)
+
+        # O cliente já tem esta versão? 304 sem calcular nada. Hoje a
+        # resposta também muda com a hora (slots que já passaram).
+        now_aware = timezone.now()
+        is_today = selected_date == timezone.localdate(now_aware, default_tz)
+        etag, last_modified = _validators(cache_key, last_modified, now_aware if is_today else None)
+        not_modified = _not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        slot_starts = cache.get(cache_key)
+
+        if slot_starts is None:
+            try:
+                with instrumentation.span('slots'):
+                    slot_starts = self.compute_day_slots(barber_id, service_id, selected_date, default_tz)
+            except BarberService.DoesNotExist:
+                return JsonResponse({'error': 'Este barbeiro não oferece esse serviço.'}, status=404)
+            except Exception:
+                # Loga o erro real com o traceback (só ids, nada do cliente)
+                logger.exception(
+                    'Erro inesperado ao calcular os slots',
+                    extra={'barber_id': barber_id, 'service_id': service_id, 'date': selected_date.isoformat()},
+                )
+                # Retorna uma mensagem genérica para o cliente
+                return JsonResponse({'error': 'Não foi possível buscar os horários. Tente novamente mais tarde.'}, status=500)
+            cache.set(cache_key, slot_starts, availability_cache.SLOTS_CACHE_TIMEOUT)
+
+        # 3. O cache guarda o dia inteiro; o filtro "o slot já passou?" é feito aqui
+        available_slots = [
+            # Pega a hora (já está no fuso correto)
+            slot_start_dt.astimezone(default_tz).time().strftime('%H:%M')
+            for slot_start_dt in slot_starts
+            if slot_start_dt >= now_aware
+        ]
+
+        # 4. Retorna a lista de slots como JSON
+        return _set_validators(JsonResponse({'available_slots': available_slots}), etag, last_modified)
+
+    def compute_day_slots(self, barber_id, service_id, selected_date, default_tz):
+        """
+        Busca os dados no banco e roda o motor de intervalos (core/slots.py).
+        Devolve TODOS os slots livres do dia, inclusive os que já passaram.
+        """
+        barber_service = BarberService.objects.select_related('service').get(
+            barber__id=barber_id, 
+            service__id=service_id
+        )
+
+        # Horário de trabalho do dia (modelo semanal + exceções - folgas),
+        # da agenda compilada em cache (core/barber_calendar.py)
+        availability_blocks = barber_calendar.get_calendar(barber_id).blocks_for(selected_date)
+        if not availability_blocks:
+            # Folga, dia sem expediente ou dia inteiro fechado: não há slots
+            return []
+
+        existing_appointments = Appointment.objects.for_barber_day(
+            barber_id, selected_date
+        ).active().values_list('data_hora_inicio', 'data_hora_fim')
+
+        # Ocupação do dia em bits: cada slot candidato é um AND de máscaras
+        occupancy = DayOccupancy.build(
+            selected_date, availability_blocks, existing_appointments,
+            granularity=settings.CALENDAR_BUCKET_MINUTES, tz=default_tz,
+        )
+        return occupancy.free_slots(barber_service.service.duracao, now=occupancy.day_start)
+
+# ---
+# API VIEW: Slots de um RANGE de datas (uma única requisição)
+# ---
+class GetAvailableSlotsRangeView(View):
+    """
+    Versão multi-dia de GetAvailableSlotsView. Parâmetros (Query Params):
+    1. barber_id
+    2. service_id
+    3. start (YYYY-MM-DD)
+    4. end (YYYY-MM-DD, inclusive)
+
+    Usa a agenda compilada do barbeiro (cache) e UMA query de Appointment
+    para o range inteiro; devolve um mapa {data: [slots]} (lista vazia =
+    dia lotado).
+    """
+    max_days = 62
+
+    def get(self, request, *args, **kwargs):
+        # 1. Obter e validar os parâmetros
         try:
-            barber_service = BarberService.objects.get(
-                barber__id=barber_id, 
-                service__id=service_id
-            )
-            service_duration = barber_service.service.duracao
-            weekday = selected_date.weekday()
+            barber_id = int(request.GET.get('barber_id'))
+            service_id = int(request.GET.get('service_id'))
+            start_date = datetime.strptime(request.GET.get('start'), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.GET.get('end'), '%Y-%m-%d').date()
+        except (TypeError, ValueError, AttributeError):
+            return JsonResponse({'error': 'Parâmetros inválidos'}, status=400)
 
-            availability_blocks = Availability.objects.filter(
-                barber__id=barber_id, 
-                dia_da_semana=weekday
+        if end_date < start_date or (end_date - start_date).days >= self.max_days:
+            return JsonResponse(
+                {'error': f'O intervalo deve ter entre 1 e {self.max_days} dias.'},
+                status=400,
             )
 
-            existing_appointments = Appointment.objects.filter(
+        try:
+            barber_service = BarberService.objects.select_related('service').get(
                 barber__id=barber_id,
-                data_hora_inicio__date=selected_date,
-                status__in=['confirmado', 'pendente']
+                service__id=service_id
             )
-            
-            esta_bloqueado = Bloqueio.objects.filter(
-                barber__id=barber_id,
-                data_inicio__lte=selected_date,
-                data_fim__gte=selected_date
-            ).exists()
-            
-            if esta_bloqueado:
-                # Se o dia inteiro está bloqueado, retorna uma lista vazia
-                return JsonResponse({'available_slots': []})
-            # --- FIM DA CORREÇÃO ---
-
         except BarberService.DoesNotExist:
             return JsonResponse({'error': 'Este barbeiro não oferece esse serviço.'}, status=404)
-        except Exception as e:
-            # CORRIGIDO: Loga o erro real (para você ver no GCS Logs)
-            print(f"ERRO INESPERADO em GetAvailableSlotsView: {e}") 
-            # Retorna uma mensagem genérica para o cliente
-            return JsonResponse({'error': 'Não foi possível buscar os horários. Tente novamente mais tarde.'}, status=500)
 
-        # --- 3. O ALGORITMO (ATUALIZADO) ---
+        default_tz = timezone.get_current_timezone()
 
-        available_slots = []
+        # 2. Agenda compilada (cache) + uma query de agendamentos do range inteiro
+        calendar = barber_calendar.get_calendar(barber_id)
 
-        # Pega o timezone padrão (ex: UTC, como definido no settings.py)
-        default_tz = timezone.get_current_timezone() 
+        busy_by_day = {}
+        for inicio, fim in Appointment.objects.for_barber_range(
+            barber_id, start_date, end_date
+        ).active().values_list('data_hora_inicio', 'data_hora_fim'):
+            busy_by_day.setdefault(timezone.localtime(inicio, default_tz).date(), []).append((inicio, fim))
 
-        # Pega a hora atual (aware)
-        now_aware = timezone.now()
+        # 3. O algoritmo (mesmo motor de GetAvailableSlotsView, dia a dia)
+        with instrumentation.span('slots'):
+            slots_by_day = compute_available_slots_by_day(
+                start_date, end_date, calendar.blocks_for,
+                busy_by_day, barber_service.service.duracao, tz=default_tz,
+                granularity=settings.CALENDAR_BUCKET_MINUTES,
+            )
 
-        # Itera sobre cada bloco de trabalho (ex: manhã, depois tarde)
-        for block in availability_blocks:
-
-            # Combina a data (naive) com a hora (naive)
-            slot_start_naive = datetime.combine(selected_date, block.hora_inicio)
-            block_end_naive = datetime.combine(selected_date, block.hora_fim)
-
-            # Torna o bloco "aware" (consciente do fuso)
-            slot_start_dt = timezone.make_aware(slot_start_naive, default_tz)
-            block_end_dt = timezone.make_aware(block_end_naive, default_tz)
-
-            # Itera dentro do bloco, "pulando" de acordo com a duração do serviço
-            while slot_start_dt + service_duration <= block_end_dt:
-
-                slot_end_dt = slot_start_dt + service_duration
-
-                # --- CHECAGEM DE COLISÃO (A LÓGICA CORRETA) ---
-                is_booked = False
-                for appt in existing_appointments:
-                    # O slot (A) começa ANTES que o agendamento (B) termine? E
-                    # O slot (A) termina DEPOIS que o agendamento (B) começa?
-                    # Se sim, há sobreposição.
-                    # (A_start < B_end) and (A_end > B_start)
-                    if (slot_start_dt < appt.data_hora_fim) and (slot_end_dt > appt.data_hora_inicio):
-                        is_booked = True
-                        break # Encontramos uma colisão, não precisa checar mais
-
-                if is_booked:
-                    slot_start_dt += service_duration # Pula este slot
-                    continue
-                # --- FIM DA CHECAGEM DE COLISÃO ---
-
-                # --- Checagem 2: O slot já passou? ---
-                if slot_start_dt < now_aware:
-                    slot_start_dt += service_duration
-                    continue
-
-                # Se passou nas checagens, é um slot válido!
-                available_slots.append(
-                    # Pega a hora (já está no fuso correto)
-                    slot_start_dt.astimezone(default_tz).time().strftime('%H:%M') 
-                )
+        return JsonResponse({
+            'available_slots': {
+                day.strftime('%Y-%m-%d'): [
+                    slot.astimezone(default_tz).time().strftime('%H:%M') for slot in slots
+                ]
+                for day, slots in slots_by_day.items()
+            }
+        })
 
-                # Avança o tempo para o próximo slot
-                slot_start_dt += service_duration
+# ---
+# API VIEW: Primeiros horários livres com QUALQUER barbeiro
+# ---
+class FirstAvailableSlotsView(View):
+    """
+    Para o cliente que não faz questão de barbeiro. Parâmetros (Query Params):
+    1. service_id
+    2. start (YYYY-MM-DD, opcional: hoje)
+    3. end (YYYY-MM-DD, inclusive, opcional: start + 6 dias)
+    4. limit (opcional: 10)
+
+    Devolve os 'limit' primeiros slots livres entre todos os barbeiros que
+    oferecem o serviço (core/first_available.py), com um número fixo de
+    queries, não importa quantos barbeiros existam.
+    """
+    max_days = 31
+    default_days = 7
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        # 1. Obter e validar os parâmetros
+        default_tz = timezone.get_current_timezone()
+        try:
+            service_id = int(request.GET.get('service_id'))
+            start_str = request.GET.get('start')
+            start_date = (
+                datetime.strptime(start_str, '%Y-%m-%d').date() if start_str
+                else timezone.localdate(timezone.now(), default_tz)
+            )
+            end_str = request.GET.get('end')
+            end_date = (
+                datetime.strptime(end_str, '%Y-%m-%d').date() if end_str
+                else start_date + timedelta(days=self.default_days - 1)
+            )
+            limit = int(request.GET.get('limit', self.default_limit))
+        except (TypeError, ValueError, AttributeError):
+            return JsonResponse({'error': 'Parâmetros inválidos'}, status=400)
+
+        if end_date < start_date or (end_date - start_date).days >= self.max_days:
+            return JsonResponse(
+                {'error': f'O intervalo deve ter entre 1 e {self.max_days} dias.'},
+                status=400,
+            )
+        if not 1 <= limit <= self.max_limit:
+            return JsonResponse(
+                {'error': f'O limite deve ficar entre 1 e {self.max_limit}.'},
+                status=400,
+            )
+
+        # 2. Busca em lote + intercalação por fila de prioridade
+        with instrumentation.span('slots'):
+            results = first_available_slots(service_id, start_date, end_date, limit, tz=default_tz)
+
+        return JsonResponse({
+            'results': [
+                {
+                    'barber_id': offer.barber_id,
+                    'barber_nome': offer.barber.nome_exibicao,
+                    'date': slot.astimezone(default_tz).strftime('%Y-%m-%d'),
+                    'time': slot.astimezone(default_tz).strftime('%H:%M'),
+                    'preco': str(offer.preco),
+                }
+                for slot, offer in results
+            ]
+        })
 
-        # 4. Retorna a lista de slots como JSON
-        return JsonResponse({'available_slots': available_slots})
-    
 # ---
 # API VIEW (DRF): Para Criar o Agendamento
 # ---
@@ -350,10 +549,14 @@ class CreateAppointmentView(APIView):
         serializer = AppointmentSerializer(data=data)
         
         # 3. Roda a validação (o método validate() do serializer)
-        if serializer.is_valid():
+        with instrumentation.span('validation'):
+            is_valid = serializer.is_valid()
+        if is_valid:
             # Se a validação passou (sem colisão, etc.)
             # o .save() vai chamar o nosso método create()
-            appointment = serializer.save()
+            with instrumentation.span('booking'):
+                appointment = serializer.save()
+            metrics.booking('sucesso')
             
             # 4. Retorna uma resposta de Sucesso (201 Created)
             response_data = AppointmentSerializer(appointment).data
@@ -377,7 +580,7 @@ class ConfirmAppointmentView(BarberRequiredMixin, View):
         appointment = get_object_or_404(Appointment, pk=pk)
         
         # Check de Segurança: O agendamento é deste barbeiro?
-        if appointment.barber != request.user.barber_profile:
+        if appointment.barber_id != request.user.barber_profile.pk:
             raise PermissionDenied("Você não tem permissão para alterar este agendamento.")
             
         # Altera o status e salva
@@ -398,7 +601,7 @@ class CancelAppointmentView(BarberRequiredMixin, View):
         appointment = get_object_or_404(Appointment, pk=pk)
         
         # Check de Segurança
-        if appointment.barber != request.user.barber_profile:
+        if appointment.barber_id != request.user.barber_profile.pk:
             raise PermissionDenied("Você não tem permissão para alterar este agendamento.")
             
         # Altera o status e salva
@@ -418,6 +621,10 @@ class SuccessPageView(DetailView):
     context_object_name = 'appointment' # Nome do objeto no template
     signer = Signer()
 
+    def get_queryset(self):
+        # O template mostra o barbeiro e o serviço: busca tudo num JOIN só
+        return super().get_queryset().select_related('barber', 'barber_service__service')
+
     def dispatch(self, request, *args, **kwargs):
         user = request.user
 
@@ -445,51 +652,43 @@ class GetBarberAvailableDatesView(View):
     """
     Devolve os próximos X dias em que um barbeiro específico
     tem disponibilidade, JÁ EXCLUINDO os dias bloqueados (folgas/férias).
+    X = settings.AVAILABLE_DATES_HORIZON_DAYS (no máximo um ano).
     """
-    
+    max_horizon_days = 365
+
     def get(self, request, barber_id):
+        horizon = min(max(settings.AVAILABLE_DATES_HORIZON_DAYS, 1), self.max_horizon_days)
         start_date = timezone.now().date()
-        end_date = start_date + timedelta(days=30) # Range de 30 dias
+        end_date = start_date + timedelta(days=horizon)
         
+        # Cache (core/availability_cache.py): invalidado por Availability/Bloqueio
+        cache_key, last_modified = availability_cache.available_dates_state(barber_id, start_date, end_date)
+        db_router.pin_primary_if_recent(last_modified)
+        etag, last_modified = _validators(cache_key, last_modified)
+        not_modified = _not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        available_dates = cache.get(cache_key)
+        if available_dates is not None:
+            return _set_validators(JsonResponse({'available_dates': available_dates}), etag, last_modified)
+
         try:
             barber = BarberProfile.objects.get(pk=barber_id)
         except BarberProfile.DoesNotExist:
             return JsonResponse({'error': 'Barbeiro não encontrado'}, status=404)
 
-        # 1. Encontra os dias da semana em que o barbeiro TRABALHA (ex: [1] para Terça)
-        work_weekdays = Availability.objects.filter(
-            barber=barber
-        ).values_list('dia_da_semana', flat=True).distinct()
-
-        # 2. Busca todos os BLOCOS de folga/férias do barbeiro
-        #    que se sobrepõem ao nosso range de 30 dias.
-        bloqueios = Bloqueio.objects.filter(
-            barber=barber,
-            data_inicio__lte=end_date, # O bloqueio começa antes do fim do range
-            data_fim__gte=start_date   # E termina depois do início do range
-        )
-        
-        # 3. Cria um set() de datas bloqueadas para checagem rápida
-        blocked_dates = set()
-        for bloqueio in bloqueios:
-            # Itera de 01/12 até 20/12 (exemplo) e adiciona cada dia ao set
-            delta = (bloqueio.data_fim - bloqueio.data_inicio).days
-            for i in range(delta + 1):
-                blocked_dates.add(bloqueio.data_inicio + timedelta(days=i))
-
-        # 4. Gera as datas de trabalho e filtra as bloqueadas
-        available_dates = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            # Se o dia da semana é um dia de trabalho (ex: Terça)
-            # E este dia específico NÃO está no set de datas bloqueadas
-            if current_date.weekday() in work_weekdays and current_date not in blocked_dates:
-                available_dates.append(current_date.strftime('%Y-%m-%d'))
-                
-            current_date += timedelta(days=1)
-            
-        return JsonResponse({'available_dates': available_dates})
+        # Datas com algum horário aberto (modelo semanal + exceções, já sem
+        # as folgas), da agenda compilada: os Bloqueios ficam fundidos em
+        # intervalos e não são expandidos dia a dia
+        with instrumentation.span('slots'):
+            available_dates = [
+                current_date.strftime('%Y-%m-%d')
+                for current_date in barber_calendar.get_calendar(barber.pk).available_dates(start_date, end_date)
+            ]
+
+        cache.set(cache_key, available_dates, availability_cache.SLOTS_CACHE_TIMEOUT)
+        return _set_validators(JsonResponse({'available_dates': available_dates}), etag, last_modified)
     
 class ProfilePhotoUploadView(APIView):
     permission_classes = [IsAuthenticated]
@@ -523,19 +722,68 @@ class ProfilePhotoUploadView(APIView):
         except ValidationError as e:
             return Response({'detail': e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Gera um nome único para evitar colisão nos testes/ambiente real.
-        file_obj.seek(0)
-        _, extension = os.path.splitext(file_obj.name)
-        extension = extension.lower()
-        allowed_exts = {'.jpg', '.jpeg', '.png'}
-        if extension not in allowed_exts:
-            extension = '.jpg'
-        unique_name = f'barber_photos/{uuid4().hex}{extension}'
-        profile.profile_picture.save(unique_name, file_obj, save=False)
+        # Decodifica, tira o EXIF e grava as versões redimensionadas
+        # (core/images.py) no staging local. O original não é guardado.
+        try:
+            picture_name, renditions = save_profile_photo(
+                storage_jobs.staging_storage(), file_obj, url_storage=profile.profile_picture.storage,
+            )
+        except ValidationError as e:
+            return Response({'detail': {'photo': e.messages}}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Nome (string): o FieldFile fica "commitado" e o upload original não é gravado
+        profile.profile_picture = picture_name
+        profile.foto_renditions = renditions
+        with transaction.atomic():
+            # O upload para o GCS (e, nos sinais, a remoção da foto antiga, que
+            # entra na fila DEPOIS dele) roda após o commit, fora do request
+            storage_jobs.enqueue_upload(photo_files(picture_name))
+            profile.save(update_fields=['profile_picture', 'foto_renditions'])
+
+        return Response(
+            {'photo_url': profile.profile_picture.url, 'renditions': renditions},
+            status=status.HTTP_201_CREATED,
+        )
 
-        profile.save(update_fields=['profile_picture'])
+# ---
+# API: Agenda do barbeiro em lote (modelo semanal + folgas)
+# ---
+class ScheduleView(APIView):
+    """
+    GET: a agenda atual (blocos semanais + folgas e exceções atuais/futuras).
+    PUT: substitui a agenda inteira numa única requisição
+    (ver ScheduleSerializer). Devolve a agenda salva.
+    """
+    permission_classes = [IsAuthenticated]
 
-        return Response({'photo_url': profile.profile_picture.url}, status=status.HTTP_201_CREATED)
+    def get_profile(self, request):
+        try:
+            return request.user.barber_profile
+        except BarberProfile.DoesNotExist:
+            raise PermissionDenied('Apenas barbeiros podem editar a agenda.')
+
+    def schedule_data(self, profile):
+        return {
+            'availability': AvailabilityBlockSerializer(
+                Availability.objects.filter(barber=profile), many=True
+            ).data,
+            'bloqueios': BloqueioRangeSerializer(
+                Bloqueio.objects.filter(barber=profile, data_fim__gte=timezone.now().date()), many=True
+            ).data,
+            'excecoes': AvailabilityOverrideSerializer(
+                AvailabilityOverride.objects.filter(barber=profile, data__gte=timezone.now().date()), many=True
+            ).data,
+        }
+
+    def get(self, request):
+        return Response(self.schedule_data(self.get_profile(request)))
+
+    def put(self, request):
+        profile = self.get_profile(request)
+        serializer = ScheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(barber=profile)
+        return Response(self.schedule_data(profile))
 
 class DeleteBloqueioView(BarberRequiredMixin, View):
     